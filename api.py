@@ -4,14 +4,57 @@ from flask_restx import Api, Namespace, fields
 health_ns = Namespace('health', description='Health check operations')
 evaluation_ns = Namespace('evaluation', description='Expression evaluation operations')
 
+# Optional scheduling fields of queued submissions
+scheduling_fields = {
+    'priority': fields.String(enum=['high', 'normal', 'low'], description='Priority lane (default normal; low for batches)'),
+    'deadline': fields.Raw(description="Duration such as 5, '5s' or '500ms' after which the job expires unevaluated"),
+}
+
+# Optional numeric mode of evaluations
+mode_field = {
+    'mode': fields.String(
+        enum=['float', 'exact', 'decimal'],
+        description='Numeric mode: float (fast), exact (integers and fractions) or decimal (fixed precision)',
+    ),
+}
+
 # Models for Swagger docs
 evaluate_model = evaluation_ns.model('Evaluate', {
-    'expression': fields.String(required=True, description='Mathematical expression')
+    'expression': fields.String(required=True, description='Mathematical expression'),
+    **mode_field,
+    **scheduling_fields,
 })
 
 evaluate_variable_model = evaluation_ns.model('EvaluateVariable', {
     'expression': fields.String(required=True, description='Variable math expression'),
-    'value': fields.Raw(required=True, description='Value for variable')
+    'value': fields.Raw(required=True, description='Value for variable'),
+    **mode_field,
+    **scheduling_fields,
+})
+
+tabulate_model = evaluation_ns.model('Tabulate', {
+    'expression': fields.String(required=True, description='Variable math expression'),
+    'values': fields.List(fields.Raw, required=True, description='Values for variable'),
+    **mode_field,
+})
+
+tabulate_response_model = evaluation_ns.model('TabulateResponse', {
+    'results': fields.List(fields.Raw, description='One result per value (numbers in float mode, strings otherwise; null where evaluation failed)')
+})
+
+batch_item_model = evaluation_ns.model('BatchItem', {
+    'expression': fields.String(required=True, description='Mathematical expression'),
+    'value': fields.Raw(description='Value for variable (variable expressions only)')
+})
+
+batch_model = evaluation_ns.model('Batch', {
+    'expressions': fields.List(fields.Nested(batch_item_model), required=True, description='Expressions to evaluate'),
+    **mode_field,
+    **scheduling_fields,
+})
+
+batch_response_model = evaluation_ns.model('BatchResponse', {
+    'request_ids': fields.List(fields.String, description='Request IDs, in submission order')
 })
 
 result_model = evaluation_ns.model('Result', {
@@ -28,7 +71,8 @@ history_item_model = evaluation_ns.model('HistoryItem', {
 })
 
 history_response_model = evaluation_ns.model('HistoryResponse', {
-    'history': fields.List(fields.Nested(history_item_model))
+    'history': fields.List(fields.Nested(history_item_model)),
+    'next_cursor': fields.String(description='Cursor for the next page, or null on the last page'),
 })
 
 api = Api(
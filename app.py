@@ -1,27 +1,76 @@
+from dotenv import load_dotenv
+load_dotenv()
+
 from flask import Flask
 from api import api
-from models import db
-from routes import bp, process_expression, expression_stream
+from models import db, upgrade_schema
+from retention import RetentionManager
+from routes import (
+    bp, process_expression, fail_dropped_item, write_results, expression_stream, result_writer, result_archive,
+    result_store, EMBEDDED_WORKER,
+)
+from store import pool_options
+from utils.stream import Stream
 import os
 
-from dotenv import load_dotenv
-load_dotenv()
-
 app = Flask(__name__)
 
 # Configure PostgreSQL connection
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', '')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
-# Initialize SQLAlchemy with the app
-db.init_app(app)
+# Size the request-handling connection pool explicitly and time its checkouts
+if app.config['SQLALCHEMY_DATABASE_URI']:
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = pool_options(
+        app.config['SQLALCHEMY_DATABASE_URI'],
+        'request',
+        pool_size=int(os.getenv('DB_POOL_SIZE', '5')),
+        max_overflow=int(os.getenv('DB_MAX_OVERFLOW', '10')),
+        timeout=float(os.getenv('DB_POOL_TIMEOUT', '30')),
+        recycle=int(os.getenv('DB_POOL_RECYCLE', '1800')),
+        pre_ping=os.getenv('DB_POOL_PRE_PING', '1') == '1',
+    )
+
+# Initialize SQLAlchemy with the app (optional when results use the memory or sqlite store)
+if app.config['SQLALCHEMY_DATABASE_URI']:
+    db.init_app(app)
+
+    # Create tables if they don't exist, and add indexes and constraints missing from existing ones
+    with app.app_context():
+        db.create_all()
+        upgrade_schema(db.engine)
+
+# Bind the result store to the app
+result_store.init_app(app)
+
+def start_worker(app):
+    """
+    Evaluate queued expressions in this process, passing the app instance to the processing function.
+    """
+    expression_stream.onDrop(fail_dropped_item)
+    expression_stream.forEach(lambda item: process_expression(item, app))
+
+# Evaluate in the web process unless separate `python -m worker` processes consume a shared queue
+if EMBEDDED_WORKER:
+    start_worker(app)
+elif isinstance(expression_stream, Stream):
+    raise RuntimeError("EMBEDDED_WORKER=0 requires QUEUE_BACKEND=database.")
 
-# Create tables if they don't exist
-with app.app_context():
-    db.create_all()
+# Set the result writer to persist batches of results in the result store
+result_writer.forEach(write_results)
 
-# Set the stream to use the processing function, passing the app instance
-expression_stream.forEach(lambda item: process_expression(item, app))
+# Expire old results in the background when a retention period is configured
+retention_days = float(os.getenv('RETENTION_DAYS', '0'))
+retention = None
+if retention_days > 0:
+    retention = RetentionManager(
+        result_store,
+        retention_days,
+        batch_size=int(os.getenv('RETENTION_BATCH_SIZE', '1000')),
+        interval=float(os.getenv('RETENTION_INTERVAL', '3600')),
+        archive=result_archive,
+    )
+    retention.start()
 
 # Register the blueprint
 app.register_blueprint(bp)
@@ -0,0 +1,194 @@
+"""
+ASGI serving mode for high-concurrency clients.
+
+Submission, result and history endpoints run natively on asyncio: result waits
+(long-polls) are awaited on the event loop instead of holding a thread each, and
+the SQLAlchemy result store is read through an asyncio driver. Every other route
+(the web interface, Swagger docs, batch, tabulate, result streams and health
+checks) is served by the Flask application through a WSGI adapter.
+
+Usage:
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+"""
+from a2wsgi import WSGIMiddleware
+from flask_restx import marshal
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse
+from starlette.routing import Mount, Route
+from app import app as flask_app
+from api import result_model
+from store import AsyncResultReader, SQLAlchemyStore
+import contextlib
+import functools
+import json
+import os
+import time
+import routes
+
+def create_reader():
+    """
+    Create the asynchronous result reader, or None to read the result store on the thread pool.
+    """
+    url = os.getenv('DATABASE_URL', '')
+    if not isinstance(routes.result_store, SQLAlchemyStore) or not url:
+        return None
+    try:
+        return AsyncResultReader(
+            url,
+            pool_size=int(os.getenv('DB_POOL_SIZE', '5')),
+            max_overflow=int(os.getenv('DB_MAX_OVERFLOW', '10')),
+            timeout=float(os.getenv('DB_POOL_TIMEOUT', '30')),
+            recycle=int(os.getenv('DB_POOL_RECYCLE', '1800')),
+            pre_ping=os.getenv('DB_POOL_PRE_PING', '1') == '1',
+        )
+    except ValueError as e:
+        print(f"Reading results on the thread pool: {e}")
+        return None
+
+result_reader = create_reader()
+
+async def read_result(req_id):
+    """
+    Read a result row from the result store without blocking the event loop.
+    """
+    if result_reader:
+        return await result_reader.get(req_id)
+    return await run_in_threadpool(routes.result_store.get, req_id)
+
+async def lookup_result(req_id):
+    """
+    Asynchronous counterpart of routes.lookup_result().
+    """
+    cached = routes.cached_result(req_id)
+    if cached is not None:
+        return cached
+    row = await read_result(req_id)
+    if row is None and routes.result_archive:
+        return await run_in_threadpool(routes.stored_result, req_id, None)
+    return routes.stored_result(req_id, row)
+
+async def wait_for_completion(watch, timeout):
+    """
+    Asynchronous counterpart of routes.wait_for_completion().
+    """
+    if not routes.evaluates_every_job():
+        routes.result_poller.start()
+    return await watch.wait(timeout)
+
+def respond(response):
+    """
+    Turn a Flask-RESTX style return value (body, (body, status) or (body, status, headers))
+    into a JSON response.
+    """
+    if not isinstance(response, tuple):
+        response = (response, 200)
+    body, status, headers = response + (None,) * (3 - len(response))
+    return JSONResponse(body, status_code=status, headers=headers)
+
+def client_key(request):
+    """
+    Identify the client of a request (see routes.identify_client()).
+    """
+    return routes.identify_client(request.headers.get(routes.RATE_LIMIT_KEY_HEADER), request.client and request.client.host)
+
+def instrumented(rule):
+    """
+    Count and time a native endpoint in the same HTTP metrics as the Flask routes.
+
+    Args:
+        rule (str): The route rule used as the 'endpoint' label.
+    """
+    def decorate(handler):
+        @functools.wraps(handler)
+        async def wrapper(request):
+            started = time.perf_counter()
+            response = await handler(request)
+            routes.http_requests.labels(rule, request.method, response.status_code).inc()
+            routes.http_request_seconds.labels(rule).observe(time.perf_counter() - started)
+            return response
+        return wrapper
+    return decorate
+
+async def read_json(request):
+    try:
+        return await request.json()
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return None
+
+@instrumented('/evaluation/expression')
+async def submit_expression(request):
+    """Submit a standard mathematical expression for evaluation"""
+    data = await read_json(request)
+    # Queueing may wait for room in a full queue or write to the database queue
+    return respond(await run_in_threadpool(routes.submit_expression, data, False, client_key(request)))
+
+@instrumented('/evaluation/variable')
+async def submit_variable_expression(request):
+    """Submit a variable math expression and value for evaluation"""
+    data = await read_json(request)
+    return respond(await run_in_threadpool(routes.submit_expression, data, True, client_key(request)))
+
+@instrumented('/evaluation/result/<string:req_id>')
+async def get_result(request):
+    """
+    Poll for the result of an evaluated expression, optionally waiting up to `?wait=`.
+    """
+    req_id = request.path_params['req_id']
+    try:
+        wait = routes.parse_duration(request.query_params.get('wait'), routes.LONG_POLL_MAX_WAIT)
+    except ValueError as e:
+        return JSONResponse(marshal({'error': str(e)}, result_model), status_code=400)
+    deadline = time.monotonic() + wait
+    with routes.completion_notifier.watch_async([req_id]) as watch:
+        payload = await lookup_result(req_id)
+        while payload is None or payload is routes.PROCESSING:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not await wait_for_completion(watch, remaining):
+                break
+            payload = await lookup_result(req_id)
+    if payload is None or payload is routes.PROCESSING:
+        return JSONResponse(marshal(routes.PROCESSING, result_model), status_code=202)
+    return JSONResponse(marshal(payload, result_model))
+
+@instrumented('/evaluation/history')
+async def get_history(request):
+    """
+    Return the history of evaluated expressions and their results, newest first.
+    """
+    args = request.query_params
+    latest = not args
+    if latest:
+        cached = routes.history_cache.get('latest')
+        if cached is not None:
+            return JSONResponse(cached)
+    try:
+        query = routes.parse_history_query(args)
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+    history_args = (query['limit'] + 1, query['before'], query['since'], query['until'], query['prefix'])
+    if result_reader:
+        results = await result_reader.history(*history_args)
+    else:
+        results = await run_in_threadpool(routes.result_store.history, *history_args)
+    response = routes.history_page(results, query['limit'])
+    if latest:
+        routes.history_cache.put('latest', response)
+    return JSONResponse(response)
+
+@contextlib.asynccontextmanager
+async def lifespan(_):
+    yield
+    if result_reader:
+        await result_reader.close()
+
+app = Starlette(
+    routes=[
+        Route('/evaluation/expression', submit_expression, methods=['POST']),
+        Route('/evaluation/variable', submit_variable_expression, methods=['POST']),
+        Route('/evaluation/result/{req_id}', get_result, methods=['GET']),
+        Route('/evaluation/history', get_history, methods=['GET']),
+        Mount('/', WSGIMiddleware(flask_app)),
+    ],
+    lifespan=lifespan,
+)
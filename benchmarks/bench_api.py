@@ -0,0 +1,155 @@
+"""
+End-to-end load generator against the Flask application.
+
+Runs the application in-process (its stream workers and result writer included)
+against a fresh SQLite file standing in for PostgreSQL, unless DATABASE_URL is
+set. Concurrent client threads each use their own test client to:
+
+- submit: submit expressions without waiting for their results.
+- round trip: submit an expression and long-poll its result.
+
+The memo is disabled so that every request is evaluated.
+
+Usage:
+    python -m benchmarks.bench_api [--requests 2000] [--concurrency 16] [--json]
+"""
+import argparse
+import atexit
+import json
+import os
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+
+# Submission latency under a saturating burst mostly measures thread scheduling,
+# so the regression check gates on submission throughput instead
+UNGATED = ('submit.p50_ms',)
+
+def load_app():
+    """
+    Import the application configured for benchmarking.
+
+    The application is imported once per process, so its database lives in a
+    temporary directory removed when the process exits.
+    """
+    if 'DATABASE_URL' not in os.environ:
+        directory = tempfile.mkdtemp(prefix='bench_api-')
+        atexit.register(shutil.rmtree, directory, ignore_errors=True)
+        os.environ['DATABASE_URL'] = f"sqlite:///{directory}/bench_api.db"
+    os.environ.setdefault('MEMO_SIZE', '0')
+    from app import app
+    return app
+
+def run_clients(app, requests, concurrency, request):
+    """
+    Issue `requests` requests from `concurrency` threads.
+
+    Args:
+        app: The Flask application.
+        requests (int): Total number of requests.
+        concurrency (int): Number of client threads.
+        request (callable): request(client, i) performing one request; returns False on failure.
+
+    Returns:
+        dict: Requests per second, latency percentiles in milliseconds and the error count.
+    """
+    latencies = []
+    errors = []
+    counter = iter(range(requests))
+    lock = threading.Lock()
+
+    def client_thread():
+        with app.test_client() as client:
+            while True:
+                with lock:
+                    i = next(counter, None)
+                if i is None:
+                    return
+                start = time.perf_counter()
+                ok = request(client, i)
+                with lock:
+                    (latencies if ok else errors).append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=client_thread) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    if not latencies:
+        return {'requests_per_second': 0.0, 'p50_ms': 0.0, 'p99_ms': 0.0, 'errors': len(errors)}
+    return {
+        'requests_per_second': len(latencies) / elapsed,
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p99_ms': latencies[max(int(len(latencies) * 0.99) - 1, 0)] * 1000,
+        'errors': len(errors),
+    }
+
+def submit(client, i):
+    response = client.post('/evaluation/expression', json={'expression': f'{i} * 7 + {i % 89}'})
+    return response.status_code == 200
+
+def round_trip(client, i):
+    response = client.post('/evaluation/expression', json={'expression': f'{i} * 3 - {i % 97}'})
+    if response.status_code != 200:
+        return False
+    req_id = response.get_json()['request_id']
+    for _ in range(10):
+        response = client.get(f'/evaluation/result/{req_id}?wait=10s')
+        if response.status_code == 200:
+            return 'result' in response.get_json()
+    return False
+
+def wait_until_idle(timeout=30):
+    """
+    Wait until queued jobs have been evaluated and written, so workloads do not overlap.
+    """
+    import routes
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if routes.expression_stream.size() == 0 and routes.result_writer.stats()['pending'] == 0:
+            return
+        time.sleep(0.05)
+
+def run(quick=False, requests=None, concurrency=16):
+    """
+    Run the end-to-end benchmarks.
+
+    Args:
+        quick (bool): Issue fewer requests, e.g. for a regression check.
+        requests (int): Requests per workload (overrides `quick`).
+        concurrency (int): Number of client threads.
+
+    Returns:
+        dict: Results by workload ('submit', 'round_trip').
+    """
+    requests = requests or (500 if quick else 2000)
+    app = load_app()
+    results = {'submit': run_clients(app, requests, concurrency, submit)}
+    wait_until_idle()
+    results['round_trip'] = run_clients(app, requests, concurrency, round_trip)
+    wait_until_idle()
+    return results
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument('--requests', type=int, default=2000)
+    argparser.add_argument('--concurrency', type=int, default=16)
+    argparser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = argparser.parse_args()
+
+    results = run(requests=args.requests, concurrency=args.concurrency)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'workload':<12}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for name, result in results.items():
+        print(f"{name:<12}{result['requests_per_second']:>10,.0f}{result['p50_ms']:>10,.1f}"
+              f"{result['p99_ms']:>10,.1f}{result['errors']:>8}")
+
+if __name__ == '__main__':
+    main()
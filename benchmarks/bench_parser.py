@@ -0,0 +1,127 @@
+"""
+Microbenchmarks of the expression parser over expression size and nesting depth.
+
+For each generated expression the benchmark measures compiling without the
+parser cache, evaluating the compiled tree, and a full parser() call served from
+the cache (the steady state of a repeated expression). Evaluation is timed on the
+same expression with 'x' as its first operand, evaluated for a value of 'x':
+constant expressions are folded once and their later evaluations are free. Variable expressions are
+measured per value through variable_parser() and batch_variable_parser().
+
+Usage:
+    python -m benchmarks.bench_parser [--quick] [--json]
+"""
+import argparse
+import json
+import time
+
+from utils.parser import (
+    _compile_tokens, batch_variable_parser, compile_variable_expression, normalize, parser, tokenize,
+    variable_parser,
+)
+
+# Operators cycled through the generated expressions
+OPERATORS = ('+', '*', '-', '/')
+
+def sized_expression(terms, first='1'):
+    """
+    Build a flat expression of `terms` operands, e.g. '1 + 2 * 3 - 4 / 5'.
+    """
+    parts = [first]
+    for i in range(1, terms):
+        parts.append(OPERATORS[i % len(OPERATORS)])
+        parts.append(str(i % 9 + 1))
+    return ' '.join(parts)
+
+def nested_expression(depth, first='1'):
+    """
+    Build an expression nested `depth` parentheses deep, e.g. '(((1 + 1) * 2) + 1)'.
+    """
+    expression = first
+    for i in range(depth):
+        expression = f"({expression} {OPERATORS[i % 2]} {i % 3 + 1})"
+    return expression
+
+def best_of(func, number, repeat=5):
+    """
+    Time `func` and return the best per-call duration in seconds over `repeat` runs of `number` calls.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+def bench_expression(expression, variable, number):
+    """
+    Measure compiling, evaluating and cached parsing of one expression.
+
+    Args:
+        expression (str): The expression.
+        variable (str): The same expression with 'x' as its first operand, for timing evaluation.
+        number (int): Calls per timing run.
+
+    Returns:
+        dict: Microseconds per call of each step, and cached parser() calls per second.
+    """
+    key = normalize(expression)
+    build = _compile_tokens.__wrapped__
+    compiled = compile_variable_expression(variable)
+    cached = best_of(lambda: parser(expression), number)
+    return {
+        'compile_us': best_of(lambda: build(tuple(tokenize(key)), 'float'), number) * 1e6,
+        'evaluate_us': best_of(lambda: compiled.calc(3), number) * 1e6,
+        'cached_parser_per_second': 1 / cached,
+    }
+
+def run(quick=False):
+    """
+    Run the parser benchmarks.
+
+    Args:
+        quick (bool): Use fewer iterations, e.g. for a regression check.
+
+    Returns:
+        dict: Results by case ('size_<terms>', 'depth_<levels>', 'variable', 'batch_variable').
+    """
+    number = 20 if quick else 100
+    results = {}
+    for terms in (10, 100, 1000):
+        results[f'size_{terms}'] = bench_expression(
+            sized_expression(terms), sized_expression(terms, 'x'), max(1, number * 10 // terms)
+        )
+    for depth in (10, 50, 100):
+        results[f'depth_{depth}'] = bench_expression(
+            nested_expression(depth), nested_expression(depth, 'x'), max(1, number * 10 // depth)
+        )
+
+    variable = 'x^3 - 2*x^2 + (x + 1) / (2*x - 1) + 7'
+    values = [i * 0.1 for i in range(1000)]
+    per_value = best_of(lambda: variable_parser(variable, 3.5), number * 10)
+    batch = best_of(lambda: batch_variable_parser(variable, values), max(1, number // 10))
+    results['variable'] = {'variable_parser_per_second': 1 / per_value}
+    results['batch_variable'] = {'values_per_second': len(values) / batch}
+    return results
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument('--quick', action='store_true', help='use fewer iterations')
+    argparser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = argparser.parse_args()
+
+    results = run(args.quick)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'case':<16}{'compile us':>14}{'evaluate us':>14}{'cached/s':>14}")
+    for name, result in results.items():
+        if 'compile_us' in result:
+            print(f"{name:<16}{result['compile_us']:>14,.1f}{result['evaluate_us']:>14,.1f}"
+                  f"{result['cached_parser_per_second']:>14,.0f}")
+    print(f"variable_parser: {results['variable']['variable_parser_per_second']:,.0f} calls/s")
+    print(f"batch_variable_parser: {results['batch_variable']['values_per_second']:,.0f} values/s")
+
+if __name__ == '__main__':
+    main()
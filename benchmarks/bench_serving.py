@@ -0,0 +1,171 @@
+"""
+Compare the WSGI (Flask threaded server) and ASGI (uvicorn) serving paths.
+
+Each server runs in its own process against a fresh SQLite database unless
+DATABASE_URL is set. Two workloads are measured:
+
+- submit: concurrent clients submitting expressions and long-polling each result;
+  reports requests per second and latency percentiles of the submit+result round trip.
+- idle pollers: a number of clients hold long-polls on results that never arrive
+  while the submit workload runs, showing how waiting clients affect everyone else.
+
+Usage:
+    python -m benchmarks.bench_serving [--requests 2000] [--concurrency 50] [--pollers 500] [--json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+# Commands serving the application on a port, by serving path
+SERVERS = {
+    'wsgi': [sys.executable, '-c',
+             "import sys; from werkzeug.serving import run_simple; from app import app; "
+             "run_simple('127.0.0.1', int(sys.argv[1]), app, threaded=True)"],
+    'asgi': [sys.executable, '-m', 'uvicorn', 'asgi:app', '--host', '127.0.0.1', '--log-level', 'warning', '--port'],
+}
+
+class HTTPError(Exception):
+    pass
+
+async def http_request(port, method, path, body=None):
+    """
+    Send one HTTP/1.1 request on a fresh connection and return (status, JSON body).
+
+    A minimal client keeps the benchmark's own overhead low and identical for both servers.
+    """
+    payload = json.dumps(body).encode() if body is not None else b''
+    try:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(
+            f"{method} {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n".encode() + payload
+        )
+        response = await reader.read()
+        writer.close()
+    except OSError as e:
+        raise HTTPError(str(e))
+    head, _, content = response.partition(b'\r\n\r\n')
+    if not head:
+        raise HTTPError("Empty response")
+    status = int(head.split(b' ', 2)[1])
+    if b'chunked' in head.lower():
+        content = dechunk(content)
+    return status, json.loads(content) if content else None
+
+def dechunk(content):
+    body = b''
+    while content:
+        size, _, content = content.partition(b'\r\n')
+        size = int(size, 16)
+        if size == 0:
+            break
+        body, content = body + content[:size], content[size + 2:]
+    return body
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def start_server(kind, port, env):
+    process = subprocess.Popen(SERVERS[kind] + [str(port)], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if asyncio.run(http_request(port, 'GET', '/health'))[0] == 200:
+                return process
+        except HTTPError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"{kind} server did not start")
+
+async def round_trip(port, i):
+    """
+    Submit an expression and long-poll its result; return the latency, or None on a failed request.
+    """
+    start = time.perf_counter()
+    try:
+        _, body = await http_request(port, 'POST', '/evaluation/expression', {'expression': f'{i} * 3 + {i % 97}'})
+        req_id = body['request_id']
+        while True:
+            status, _ = await http_request(port, 'GET', f'/evaluation/result/{req_id}?wait=10s')
+            if status == 200:
+                return time.perf_counter() - start
+    except (HTTPError, ValueError, KeyError, TypeError):
+        return None
+
+async def idle_poll(port, stop):
+    while not stop.is_set():
+        try:
+            await http_request(port, 'GET', '/evaluation/result/never-submitted?wait=2s')
+        except (HTTPError, ValueError):
+            await asyncio.sleep(0.1)
+
+async def run_workload(port, requests, concurrency, pollers):
+    stop = asyncio.Event()
+    idle = [asyncio.create_task(idle_poll(port, stop)) for _ in range(pollers)]
+    await asyncio.sleep(1 if pollers else 0)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(i):
+        async with semaphore:
+            return await round_trip(port, i)
+
+    start = time.perf_counter()
+    outcomes = await asyncio.gather(*(bounded(i) for i in range(requests)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await asyncio.gather(*idle, return_exceptions=True)
+    latencies = sorted(latency for latency in outcomes if latency is not None)
+    if not latencies:
+        return {'requests_per_second': 0.0, 'p50_ms': 0.0, 'p99_ms': 0.0, 'errors': requests}
+    return {
+        'requests_per_second': len(latencies) / elapsed,
+        'errors': requests - len(latencies),
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p99_ms': latencies[max(int(len(latencies) * 0.99) - 1, 0)] * 1000,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--pollers', type=int, default=500)
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for kind in SERVERS:
+            env = dict(os.environ, MEMO_SIZE='0')
+            env.setdefault('DATABASE_URL', f"sqlite:///{directory}/{kind}.db")
+            port = free_port()
+            server = start_server(kind, port, env)
+            try:
+                results[kind] = {
+                    'submit': asyncio.run(run_workload(port, args.requests, args.concurrency, 0)),
+                    'submit_with_idle_pollers': asyncio.run(run_workload(port, args.requests, args.concurrency, args.pollers)),
+                }
+            finally:
+                server.terminate()
+                server.wait()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'server':<8}{'workload':<28}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for kind, workloads in results.items():
+        for name, result in workloads.items():
+            print(f"{kind:<8}{name:<28}{result['requests_per_second']:>10,.0f}"
+                  f"{result['p50_ms']:>10,.1f}{result['p99_ms']:>10,.1f}{result['errors']:>8}")
+
+if __name__ == '__main__':
+    main()
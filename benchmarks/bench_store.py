@@ -0,0 +1,104 @@
+"""
+Benchmark the result store backends against each other.
+
+Measures batched writes (as issued by the result writer), point lookups by
+request ID and keyset-paginated history pages. The SQLAlchemy backend runs on
+a local SQLite file as a stand-in for PostgreSQL unless DATABASE_URL is set.
+
+Usage:
+    python -m benchmarks.bench_store [--rows 20000] [--batch 500] [--json]
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from flask import Flask
+from models import db
+from store import MemoryStore, SQLAlchemyStore, SQLiteStore
+
+def make_sqlalchemy_store(directory):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL') or f"sqlite:///{directory}/sqlalchemy.db"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    store = SQLAlchemyStore()
+    store.init_app(app)
+    return store
+
+def make_rows(count):
+    base = datetime(2024, 1, 1)
+    return [
+        {'id': str(uuid.uuid4()), 'expression': f'{i}*{i}', 'result': str(i * i), 'timestamp': base + timedelta(milliseconds=i)}
+        for i in range(count)
+    ]
+
+def bench_store(store, rows, batch):
+    """
+    Run the write, lookup and history workloads against one store.
+
+    Returns:
+        dict: Throughput in operations per second for each workload.
+    """
+    start = time.perf_counter()
+    for i in range(0, len(rows), batch):
+        store.write_many(rows[i:i + batch])
+    write_seconds = time.perf_counter() - start
+
+    sample = random.Random(0).sample(rows, min(2000, len(rows)))
+    start = time.perf_counter()
+    for row in sample:
+        store.get(row['id'])
+    get_seconds = time.perf_counter() - start
+
+    pages = 0
+    before = None
+    start = time.perf_counter()
+    while pages < 200:
+        page = store.history(20, before=before)
+        if not page:
+            break
+        before = (page[-1]['timestamp'], page[-1]['id'])
+        pages += 1
+    history_seconds = time.perf_counter() - start
+
+    return {
+        'writes_per_second': len(rows) / write_seconds,
+        'gets_per_second': len(sample) / get_seconds,
+        'history_pages_per_second': pages / history_seconds if history_seconds else 0.0,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--batch', type=int, default=500)
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        stores = {
+            'memory': MemoryStore(),
+            'sqlite': SQLiteStore(os.path.join(directory, 'store.db')),
+            'sqlalchemy': make_sqlalchemy_store(directory),
+        }
+        for name, store in stores.items():
+            results[name] = bench_store(store, rows, args.batch)
+            store.close()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'store':<12}{'writes/s':>14}{'gets/s':>14}{'pages/s':>14}")
+    for name, result in results.items():
+        print(f"{name:<12}{result['writes_per_second']:>14,.0f}{result['gets_per_second']:>14,.0f}"
+              f"{result['history_pages_per_second']:>14,.0f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Measure Stream throughput and queueing latency under different worker counts.
+
+Two workloads are run for each worker count:
+
+- cpu: each item evaluates an expression, so workers compete for the GIL.
+- io: each item also sleeps briefly, standing in for a database round trip,
+  so additional workers overlap their waits.
+
+Latency is measured from add() to the end of processing.
+
+Usage:
+    python -m benchmarks.bench_stream [--items 5000] [--workers 1 2 4 8] [--io-ms 1] [--json]
+"""
+import argparse
+import json
+import statistics
+import threading
+import time
+
+from utils.parser import parser
+from utils.stream import Stream
+
+def bench_stream(workers, items, io_seconds):
+    """
+    Push `items` items through a stream with `workers` workers.
+
+    Returns:
+        dict: Items processed per second and latency percentiles in milliseconds.
+    """
+    latencies = []
+    lock = threading.Lock()
+    done = threading.Event()
+
+    def process(item):
+        parser(item['expression'])
+        if io_seconds:
+            time.sleep(io_seconds)
+        latency = time.perf_counter() - item['added']
+        with lock:
+            latencies.append(latency)
+            if len(latencies) == items:
+                done.set()
+
+    stream = Stream(workers=workers)
+    stream.forEach(process)
+    start = time.perf_counter()
+    for i in range(items):
+        stream.add({'expression': f'{i} * 3 + {i % 97}', 'added': time.perf_counter()})
+    done.wait()
+    elapsed = time.perf_counter() - start
+    stream.stop()
+    latencies.sort()
+    return {
+        'items_per_second': items / elapsed,
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p99_ms': latencies[max(int(len(latencies) * 0.99) - 1, 0)] * 1000,
+    }
+
+def run(quick=False, items=None, workers=(1, 2, 4, 8), io_ms=1.0):
+    """
+    Run the stream benchmarks.
+
+    Args:
+        quick (bool): Use fewer items, e.g. for a regression check.
+        items (int): Items per run (overrides `quick`).
+        workers (tuple): Worker counts to measure.
+        io_ms (float): Simulated I/O per item of the 'io' workload, in milliseconds.
+
+    Returns:
+        dict: Results by case ('<workload>_<workers>w').
+    """
+    items = items or (1000 if quick else 5000)
+    results = {}
+    for workload, io_seconds in (('cpu', 0.0), ('io', io_ms / 1000)):
+        for count in workers:
+            # Sleeping items are slow to drain; fewer of them give a stable rate
+            runs = items if not io_seconds else max(count * 50, items // 10)
+            results[f'{workload}_{count}w'] = bench_stream(count, runs, io_seconds)
+    return results
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument('--items', type=int, default=5000)
+    argparser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    argparser.add_argument('--io-ms', type=float, default=1.0)
+    argparser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = argparser.parse_args()
+
+    results = run(items=args.items, workers=tuple(args.workers), io_ms=args.io_ms)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'case':<10}{'items/s':>12}{'p50 ms':>10}{'p99 ms':>10}")
+    for name, result in results.items():
+        print(f"{name:<10}{result['items_per_second']:>12,.0f}{result['p50_ms']:>10,.1f}{result['p99_ms']:>10,.1f}")
+
+if __name__ == '__main__':
+    main()
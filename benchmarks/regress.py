@@ -0,0 +1,274 @@
+"""
+Record benchmark baselines and fail when performance regresses against them.
+
+Runs the parser, stream and end-to-end API benchmarks in quick mode and compares
+each metric with the baseline stored in benchmarks/baselines/<suite>.json.
+Metrics ending in '_per_second' must not fall, and metrics ending in '_us' or
+'_ms' must not rise, by more than the suite's tolerance; latency percentiles, which
+measure scheduling as well as code, are allowed twice the tolerance. Tail latencies
+(p99 and max) are reported but not checked: a single stall moves them, so they vary
+too much between runs of unchanged code. Results are normalized by a calibration loop timed
+around each suite, so that a machine running slower or faster overall (CPU
+frequency scaling, noisy neighbours) is not mistaken for a change in the code. A
+suite that appears to regress is run again, up to --attempts times, keeping each
+metric's best value, so that only a regression that persists fails the check. The
+best of several runs is an optimistic measure, so after a retry each metric must
+stay within the tolerance by --margin as well. Baselines still depend on the
+machine, so record them on the machine that runs the check.
+
+Usage:
+    python -m benchmarks.regress --update                # record new baselines
+    python -m benchmarks.regress [--tolerance 0.5] [--attempts 3] [--margin 0.1]  # exit with status 1 on a regression
+    python -m benchmarks.regress --suite parser --suite stream
+"""
+import argparse
+import importlib
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime, timezone
+
+# Benchmark modules by suite name, each providing run(quick) and optionally UNGATED (metrics
+# reported but not checked), and their default tolerances;
+# the multi-threaded suites measure scheduling as well as code and vary more between runs
+SUITES = {
+    'parser': ('benchmarks.bench_parser', 0.5),
+    'stream': ('benchmarks.bench_stream', 0.5),
+    'api': ('benchmarks.bench_api', 0.5),
+}
+
+# Prefixes of the metric names of tail latencies, which are not checked
+TAIL_METRICS = ('p99', 'max')
+
+# Factor applied to the tolerance of latency percentiles (such as p50_ms)
+PERCENTILE_SLACK = 2.0
+
+# Directory holding one baseline file per suite
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+
+class _Node:
+    __slots__ = ('value', 'text')
+
+    def __init__(self, value, text):
+        self.value = value
+        self.text = text
+
+def calibrate(repeat=5):
+    """
+    Time a fixed pure-Python workload, as a measure of the machine's current speed.
+
+    The workload allocates small objects, strings and lists like the parser and
+    the request path do, so it slows down with them under memory pressure.
+
+    Returns:
+        float: The best time in seconds over `repeat` runs.
+    """
+    best_time = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        seen = {}
+        for i in range(30000):
+            node = _Node(i, str(i))
+            seen[node.text[:2]] = [node.value, ' '.join((node.text, '+', '1')).split()]
+        best_time = min(best_time, time.perf_counter() - start)
+    return best_time
+
+def run_suite(suite):
+    """
+    Run a suite in quick mode between two calibrations.
+
+    Returns:
+        tuple: (results, calibration seconds).
+    """
+    before = calibrate()
+    results = importlib.import_module(SUITES[suite][0]).run(quick=True)
+    return results, (before + calibrate()) / 2
+
+def ungated(suite):
+    """
+    Return the metrics of a suite that are reported but not checked.
+    """
+    return getattr(importlib.import_module(SUITES[suite][0]), 'UNGATED', ())
+
+def flatten(results, prefix=''):
+    """
+    Flatten nested results into {'case.metric': value}.
+    """
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}."))
+        else:
+            flat[name] = value
+    return flat
+
+def direction(metric):
+    """
+    Return 1 if a larger value of the metric is better, -1 if a smaller one is, or 0 if it is not compared.
+    """
+    if metric.endswith('_per_second'):
+        return 1
+    if metric.endswith(('_us', '_ms')):
+        return -1
+    return 0
+
+def normalize(results, speed):
+    """
+    Scale results to the baseline machine speed.
+
+    Args:
+        results (dict): Results of a suite.
+        speed (float): Current calibration time divided by the baseline's.
+
+    Returns:
+        dict: Flattened results; a slower machine (speed > 1) has its rates raised
+        and its durations lowered accordingly.
+    """
+    flat = flatten(results)
+    for metric, value in flat.items():
+        sign = direction(metric)
+        if sign:
+            flat[metric] = value * speed if sign > 0 else value / speed
+    return flat
+
+def best(first, second):
+    """
+    Merge two flattened results, keeping the better value of each compared metric.
+    """
+    merged = dict(first)
+    for metric, value in second.items():
+        sign = direction(metric)
+        if metric not in merged or (sign and (value - merged[metric]) * sign > 0):
+            merged[metric] = value
+    return merged
+
+def gated(metric):
+    """
+    Return whether a flattened metric is checked against its baseline (tail latencies are not).
+    """
+    return direction(metric) != 0 and not metric.rsplit('.', 1)[-1].startswith(TAIL_METRICS)
+
+def compare(baseline, current, tolerance, ignore=()):
+    """
+    Compare benchmark results with a baseline.
+
+    Args:
+        baseline (dict): Baseline results of a suite.
+        current (dict): Current results of the same suite.
+        tolerance (float): Allowed relative change in the worse direction (0.3 = 30%),
+            multiplied by PERCENTILE_SLACK for latency percentiles.
+        ignore (tuple): Flattened names of metrics not to compare.
+
+    Returns:
+        list: (metric, baseline value, current value, relative change) for every regression.
+    """
+    regressions = []
+    baseline, current = flatten(baseline), flatten(current)
+    for metric, before in baseline.items():
+        sign = direction(metric)
+        after = current.get(metric)
+        if not gated(metric) or after is None or not before or metric in ignore:
+            continue
+        change = (after - before) / before
+        name = metric.rsplit('.', 1)[-1]
+        allowed = tolerance * PERCENTILE_SLACK if name[:1] == 'p' and name[1:2].isdigit() else tolerance
+        if change * sign < -allowed:
+            regressions.append((metric, before, after, change))
+    return regressions
+
+def check(baseline, run, tolerance, attempts=3, margin=0.1, ignore=()):
+    """
+    Run a suite until it shows no regression against its baseline, or `attempts` times.
+
+    Args:
+        baseline (dict): The baseline document with 'results' and 'calibration_seconds'.
+        run (callable): Runs the suite once, returning (results, calibration seconds).
+        tolerance (float): Allowed relative change in the worse direction.
+        attempts (int): Maximum number of runs.
+        margin (float): Part of the tolerance a metric must stay clear of once the
+            suite has been retried, since the best of several runs is optimistic.
+        ignore (tuple): Flattened names of metrics not to compare.
+
+    Returns:
+        list: The regressions of the best results, as returned by compare().
+    """
+    current = {}
+    for attempt in range(max(1, attempts)):
+        results, calibration = run()
+        current = best(current, normalize(results, calibration / baseline['calibration_seconds']))
+        limit = tolerance - margin if attempt else tolerance
+        regressions = compare(baseline['results'], current, limit, ignore)
+        if not regressions:
+            break
+    return regressions
+
+def baseline_path(suite):
+    return os.path.join(BASELINE_DIR, f"{suite}.json")
+
+def load_baseline(suite):
+    """
+    Return the stored baseline of a suite, or None if none has been recorded.
+
+    Returns:
+        dict or None: The baseline document with 'results' and 'calibration_seconds'.
+    """
+    try:
+        with open(baseline_path(suite)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def save_baseline(suite, results, calibration):
+    """
+    Store the results of a suite as its baseline, with the environment they were recorded in.
+    """
+    os.makedirs(BASELINE_DIR, exist_ok=True)
+    document = {
+        'suite': suite,
+        'recorded_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'calibration_seconds': calibration,
+        'results': results,
+    }
+    with open(baseline_path(suite), 'w') as f:
+        json.dump(document, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument('--suite', action='append', choices=sorted(SUITES), help='suite to run (default: all)')
+    argparser.add_argument('--update', action='store_true', help='record the results as the new baselines')
+    argparser.add_argument('--tolerance', type=float, help="allowed relative slowdown (default: the suite's)")
+    argparser.add_argument('--attempts', type=int, default=3, help='runs of a suite before a regression is reported')
+    argparser.add_argument('--margin', type=float, default=0.1, help='part of the tolerance retried runs must stay clear of')
+    args = argparser.parse_args()
+
+    failed = False
+    for suite in args.suite or SUITES:
+        if args.update:
+            save_baseline(suite, *run_suite(suite))
+            print(f"{suite}: baseline recorded")
+            continue
+        baseline = load_baseline(suite)
+        if baseline is None:
+            print(f"{suite}: no baseline, run with --update to record one")
+            failed = True
+            continue
+        regressions = check(
+            baseline, lambda: run_suite(suite), args.tolerance or SUITES[suite][1],
+            args.attempts, args.margin, ungated(suite),
+        )
+        if not regressions:
+            print(f"{suite}: ok")
+        for metric, before, after, change in regressions:
+            print(f"{suite}: {metric} regressed from {before:,.2f} to {after:,.2f} ({change:+.0%})")
+            failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,433 @@
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import create_engine, delete, func, make_url, or_, select, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from models import EvaluationJob
+from store import pool_options
+from utils.stream import Stream
+import json
+import queue
+import threading
+import time
+import uuid
+
+def utc_now():
+    # Timestamps are stored as naive UTC, like the results
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+class DatabaseQueue:
+    """
+    Durable, restart-safe job queue backed by the evaluation_job table.
+
+    Jobs are claimed with SELECT ... FOR UPDATE SKIP LOCKED, so several processes and
+    hosts can share the table. Like the in-memory LaneQueue, each job is ranked by the
+    priority lane named by its 'priority' key, and a claim serves the lane whose oldest
+    waiting job has the best effective priority (its rank minus one per `aging`
+    seconds waited). With `fair`, a lane serves clients (the items' 'client' key)
+    round-robin: each job is given the next round of its client in the lane, never
+    earlier than the lane's current round, and a lane is claimed by round, oldest
+    job first within a round. A client with a large backlog therefore takes one
+    turn per round instead of starving the others. Concurrent submissions of one
+    client may share a round, so the rotation is approximate. Without `fair` a lane
+    is served oldest job first. A job is deleted only once every
+    request in it has been acknowledged (its result written or its error recorded);
+    a claim that is not acknowledged within the lease timeout, because its process
+    stopped or crashed, expires and the job is delivered again. Jobs left in the
+    table are therefore replayed on the next start.
+
+    Offers the same interface as Stream, so it can stand in for the in-memory queue.
+
+    Methods:
+        add(x, block, timeout): Persist an item in the queue.
+        forEach(f): Set the processing function and start claiming jobs.
+        onDrop(f): Set the function recording the failure of undeliverable jobs.
+        ack(request_ids): Acknowledge processed requests.
+        size(): Return the number of jobs waiting to be claimed.
+        lane_stats(): Return per-lane queue depth and wait time.
+        stop(drain, timeout): Stop the worker threads.
+    """
+    def __init__(self, url, workers=1, maxsize=0, lease=60, poll_interval=0.5, max_attempts=5, daemon=True,
+                 fair=False, lanes=None, aging=5.0, registry=None, name='stream'):
+        """
+        Args:
+            url (str): Database URL (a file or server database; not in-memory SQLite).
+            workers (int): Number of worker threads claiming jobs in this process.
+            maxsize (int): Maximum number of queued jobs (0 means unbounded).
+            lease (float): Seconds a claimed job may stay unacknowledged before it is redelivered.
+            poll_interval (float): Seconds an idle worker sleeps before checking for new jobs.
+            max_attempts (int): Claims after which a job is dropped as undeliverable
+                (after the function set with onDrop() has recorded its failure).
+            daemon (bool): Whether the worker threads are daemon threads.
+            fair (bool): Serve the jobs of each lane round-robin by their 'client' key.
+            lanes (tuple): Priority lane names, highest first, selected by the items'
+                'priority' key. None keeps a single lane.
+            aging (float): Seconds of waiting that raise a job by one lane (0 disables aging).
+            registry (Registry): Metrics registry receiving item counts, errors and
+                processing times (None disables instrumentation).
+            name (str): Queue name used as the metrics' 'stream' label.
+
+        Raises:
+            ValueError: If the configuration is invalid.
+        """
+        if workers < 1:
+            raise ValueError("A queue needs at least one worker.")
+        if not url:
+            raise ValueError("The database queue requires DATABASE_URL.")
+        parsed = make_url(url)
+        if parsed.get_backend_name() == 'sqlite' and parsed.database in (None, '', ':memory:'):
+            raise ValueError("The database queue cannot use an in-memory SQLite database.")
+        self.engine = create_engine(url, **pool_options(url, 'queue', pool_size=workers, max_overflow=2))
+        EvaluationJob.__table__.create(self.engine, checkfirst=True)
+        self.workers = workers
+        self.maxsize = maxsize
+        self.lease = timedelta(seconds=lease)
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.fair = fair
+        self.lanes = lanes
+        self._ranks = {lane: rank for rank, lane in enumerate(lanes or ('normal',))}
+        self._default_rank = len(self._ranks) // 2
+        self.aging = aging
+        # Claims and time waited per lane rank, by this process
+        self._served = {}
+        self._total_wait = {}
+        self._max_wait = {}
+        self.action_func = None
+        self.drop_func = None
+        self.stop_flag = False
+        self._ready = threading.Event()
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        # Request ID -> claimed job ID, and job ID -> request IDs not yet acknowledged
+        self._claimed_requests = {}
+        self._unacked = {}
+        self._processed = self._errors = self._seconds = None
+        if registry is not None:
+            self._processed = registry.counter('stream_items_total', 'Items processed by a stream', ('stream',)).labels(name)
+            self._errors = registry.counter('stream_errors_total', 'Items whose processing raised', ('stream',)).labels(name)
+            self._seconds = registry.histogram('stream_item_seconds', 'Time to process one item', ('stream',)).labels(name)
+        self.threads = [
+            threading.Thread(target=self._run, daemon=daemon)
+            for _ in range(workers)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    @staticmethod
+    def request_ids(item):
+        """
+        Return the request IDs of a queued item (a job or a batch of jobs).
+        """
+        jobs = item['batch'] if 'batch' in item else [item]
+        return [job['request_id'] for job in jobs]
+
+    def add(self, x, block=True, timeout=None):
+        """
+        Persist an item in the queue.
+
+        When the queue is full the call waits for free space, waits up to `timeout`
+        seconds, or fails immediately if `block` is False.
+
+        Args:
+            x (dict): The item to add; it must be JSON serializable.
+            block (bool): Whether to wait for free space when the queue is full.
+            timeout (float): Maximum number of seconds to wait for free space.
+
+        Raises:
+            queue.Full: If the queue stays full.
+            RuntimeError: If the queue has been stopped.
+        """
+        if self.stop_flag:
+            raise RuntimeError("Queue is stopped.")
+        if self.maxsize > 0:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while self.size() >= self.maxsize:
+                if not block or (deadline is not None and time.monotonic() >= deadline):
+                    raise queue.Full
+                time.sleep(self.poll_interval)
+        lane = x.get('priority') if isinstance(x, dict) else None
+        rank = self._ranks.get(lane, self._default_rank)
+        client = x.get('client') if self.fair and isinstance(x, dict) else None
+        with Session(self.engine) as session, session.begin():
+            client_round = self._next_round(session, rank, client) if self.fair else 0
+            session.add(EvaluationJob(
+                payload=json.dumps(x), created_at=utc_now(), priority=rank, client=client, client_round=client_round,
+            ))
+        self._wakeup.set()
+
+    def _next_round(self, session, rank, client):
+        """
+        Internal method: Return the round of a lane's round-robin in which a client's new job is served.
+        """
+        waiting = (EvaluationJob.priority == rank, EvaluationJob.claimed_at.is_(None))
+        current = session.scalar(select(func.min(EvaluationJob.client_round)).where(*waiting)) or 0
+        # Comparing with None renders IS NULL, so jobs without a client share one rotation
+        last = session.scalar(
+            select(func.max(EvaluationJob.client_round)).where(*waiting, EvaluationJob.client == client)
+        )
+        return current if last is None else max(current, last + 1)
+
+    def size(self):
+        """
+        Return the number of jobs waiting to be claimed.
+        """
+        with Session(self.engine) as session:
+            return session.scalar(
+                select(func.count()).select_from(EvaluationJob).where(EvaluationJob.claimed_at.is_(None))
+            )
+
+    def lane_stats(self):
+        """
+        Return per-lane queue depth and wait time (empty without lanes).
+
+        Depths are read from the table and cover every process; served counts and
+        wait times cover the jobs claimed by this process.
+
+        Returns:
+            dict: For each lane, 'depth', 'served', 'avg_wait_seconds' and 'max_wait_seconds'.
+        """
+        if not self.lanes:
+            return {}
+        with Session(self.engine) as session:
+            depths = dict(session.execute(
+                select(EvaluationJob.priority, func.count())
+                .where(EvaluationJob.claimed_at.is_(None))
+                .group_by(EvaluationJob.priority)
+            ).all())
+        with self._lock:
+            return {
+                lane: {
+                    'depth': depths.get(rank, 0),
+                    'served': self._served.get(rank, 0),
+                    'avg_wait_seconds': self._total_wait[rank] / self._served[rank] if self._served.get(rank) else 0.0,
+                    'max_wait_seconds': self._max_wait.get(rank, 0.0),
+                }
+                for lane, rank in self._ranks.items()
+            }
+
+    def _lanes_by_priority(self, session, claimable, now):
+        """
+        Internal method: Return the ranks of the lanes with claimable jobs, best effective priority first.
+        """
+        oldest = session.execute(
+            select(EvaluationJob.priority, func.min(EvaluationJob.created_at))
+            .where(claimable)
+            .group_by(EvaluationJob.priority)
+        ).all()
+        def score(lane):
+            rank, created_at = lane
+            waited = (now - created_at).total_seconds()
+            return rank - waited / self.aging if self.aging else rank
+        return [rank for rank, _ in sorted(oldest, key=score)]
+
+    def claim(self, limit=1):
+        """
+        Claim claimable jobs (pending jobs and jobs whose claim has expired) from
+        the lane with the best effective priority, by round-robin round and then oldest first.
+
+        Args:
+            limit (int): Maximum number of jobs to claim.
+
+        Returns:
+            list: (job ID, item) pairs.
+        """
+        now = utc_now()
+        claimable = or_(EvaluationJob.claimed_at.is_(None), EvaluationJob.claimed_at < now - self.lease)
+        token = str(uuid.uuid4())
+        try:
+            with Session(self.engine) as session, session.begin():
+                ids = []
+                # A lane whose jobs are all locked by other claimers gives way to the next
+                for rank in self._lanes_by_priority(session, claimable, now):
+                    ids = session.scalars(
+                        select(EvaluationJob.id)
+                        .where(claimable, EvaluationJob.priority == rank)
+                        .order_by(EvaluationJob.client_round, EvaluationJob.id)
+                        .limit(limit)
+                        .with_for_update(skip_locked=True)
+                    ).all()
+                    if ids:
+                        break
+                if not ids:
+                    return []
+                # Repeating the condition keeps claims exclusive on databases without row locks
+                session.execute(
+                    update(EvaluationJob)
+                    .where(EvaluationJob.id.in_(ids), claimable)
+                    .values(claimed_at=now, claimed_by=token, attempts=EvaluationJob.attempts + 1)
+                )
+                jobs = session.scalars(
+                    select(EvaluationJob).where(EvaluationJob.claimed_by == token).order_by(EvaluationJob.id)
+                ).all()
+                undeliverable = [job.id for job in jobs if job.attempts > self.max_attempts]
+                if undeliverable:
+                    print(f"Dropping undeliverable jobs: {undeliverable}")
+                    # If recording a failure raises, the claim is rolled back and the job kept
+                    if self.drop_func:
+                        for job in jobs:
+                            if job.id in undeliverable:
+                                self.drop_func(json.loads(job.payload))
+                    session.execute(delete(EvaluationJob).where(EvaluationJob.id.in_(undeliverable)))
+                claimed = [job for job in jobs if job.id not in undeliverable]
+                self._record_waits(claimed, now)
+                return [(job.id, json.loads(job.payload)) for job in claimed]
+        except OperationalError as e:
+            # E.g. SQLite reporting a concurrent writer; the jobs are claimed on a later poll
+            print(f"Error claiming jobs: {e}")
+            return []
+
+    def _record_waits(self, jobs, now):
+        """
+        Internal method: Count claimed jobs and the time they waited, per lane.
+        """
+        with self._lock:
+            for job in jobs:
+                waited = max(0.0, (now - job.created_at).total_seconds())
+                self._served[job.priority] = self._served.get(job.priority, 0) + 1
+                self._total_wait[job.priority] = self._total_wait.get(job.priority, 0.0) + waited
+                self._max_wait[job.priority] = max(self._max_wait.get(job.priority, 0.0), waited)
+
+    def ack(self, request_ids):
+        """
+        Acknowledge processed requests; a job is deleted once all of its requests are acknowledged.
+
+        Args:
+            request_ids (iterable): Request IDs whose result or error has been recorded.
+        """
+        done = []
+        with self._lock:
+            for req_id in request_ids:
+                job_id = self._claimed_requests.pop(req_id, None)
+                if job_id is None:
+                    continue
+                remaining = self._unacked[job_id]
+                remaining.discard(req_id)
+                if not remaining:
+                    del self._unacked[job_id]
+                    done.append(job_id)
+        if done:
+            with Session(self.engine) as session, session.begin():
+                session.execute(delete(EvaluationJob).where(EvaluationJob.id.in_(done)))
+
+    def _track(self, job_id, item):
+        """
+        Internal method: Remember which requests of a claimed job await acknowledgement.
+        """
+        req_ids = self.request_ids(item)
+        with self._lock:
+            self._unacked[job_id] = set(req_ids)
+            for req_id in req_ids:
+                self._claimed_requests[req_id] = job_id
+
+    def _untrack(self, job_id):
+        """
+        Internal method: Forget a job that failed to process; it is redelivered after its lease expires.
+        """
+        with self._lock:
+            for req_id in self._unacked.pop(job_id, ()):
+                self._claimed_requests.pop(req_id, None)
+
+    def _run(self):
+        """
+        Internal method: Claim and process jobs until the queue is stopped.
+        """
+        # Jobs are left in the table until a processing function has been set
+        self._ready.wait()
+        while not self.stop_flag:
+            try:
+                jobs = self.claim()
+            except Exception as e:
+                print(f"Error claiming jobs: {e}")
+                jobs = []
+            if not jobs:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            for job_id, item in jobs:
+                self._track(job_id, item)
+                start = time.perf_counter()
+                try:
+                    self.action_func(item)
+                except Exception as e:
+                    if self._errors is not None:
+                        self._errors.inc()
+                    print(f"Error processing stream item: {e}")
+                    self._untrack(job_id)
+                    continue
+                if self._seconds is not None:
+                    self._seconds.observe(time.perf_counter() - start)
+                    self._processed.inc()
+
+    def forEach(self, f):
+        """
+        Set a consumer-style function for processing jobs, and start claiming them.
+
+        Args:
+            f (callable): Function to process each item.
+        """
+        self.action_func = f
+        self._ready.set()
+
+    def onDrop(self, f):
+        """
+        Set a function recording the failure of jobs dropped as undeliverable.
+
+        It is called with each dropped item before the job is deleted, so that its
+        requests report an error instead of staying pending forever.
+
+        Args:
+            f (callable): Function called with each dropped item.
+        """
+        self.drop_func = f
+
+    def stop(self, drain=True, timeout=None):
+        """
+        Stop the worker threads after the jobs they hold have been processed.
+
+        Jobs still waiting stay in the table and are replayed on the next start,
+        so `drain` only exists for compatibility with Stream.
+
+        Args:
+            drain (bool): Ignored; queued jobs are never discarded.
+            timeout (float): Maximum number of seconds to wait for each worker to exit.
+        """
+        self.stop_flag = True
+        self._ready.set()
+        self._wakeup.set()
+        current = threading.current_thread()
+        for thread in self.threads:
+            if thread is not current:
+                thread.join(timeout)
+
+def create_queue(kind='memory', url=None, workers=1, maxsize=0, lease=60, poll_interval=0.5, fair=False,
+                 lanes=None, aging=5.0, registry=None):
+    """
+    Create the queue of submitted expressions by name.
+
+    Args:
+        kind (str): 'memory' (in-process Stream, lost on restart) or 'database'
+            (durable DatabaseQueue in the DATABASE_URL database).
+        url (str): Database URL of the 'database' queue.
+        workers (int): Number of worker threads.
+        maxsize (int): Maximum number of queued items (0 means unbounded).
+        lease (float): Seconds before an unacknowledged 'database' job is redelivered.
+        poll_interval (float): Seconds between polls of an idle 'database' worker.
+        fair (bool): Serve clients round-robin within each lane.
+        lanes (tuple): Priority lanes, highest first.
+        aging (float): Seconds of waiting that raise an item by one lane.
+        registry (Registry): Metrics registry for the queue's instrumentation.
+
+    Returns:
+        Stream or DatabaseQueue: The queue.
+
+    Raises:
+        ValueError: If the queue kind is unknown.
+    """
+    if kind == 'memory':
+        return Stream(workers=workers, maxsize=maxsize, fair=fair, lanes=lanes, aging=aging, registry=registry)
+    if kind == 'database':
+        return DatabaseQueue(
+            url, workers=workers, maxsize=maxsize, lease=lease, poll_interval=poll_interval, fair=fair,
+            lanes=lanes, aging=aging, registry=registry,
+        )
+    raise ValueError(f"Unknown queue backend: {kind}")
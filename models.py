@@ -1,4 +1,6 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateColumn
 from datetime import datetime, timezone
 
 db = SQLAlchemy()
@@ -10,10 +12,98 @@ class ExpressionResult(db.Model):
     Attributes:
         id (str): Unique request ID.
         expression (str): The original mathematical expression submitted for evaluation.
-        result (str): Evaluation result.
+        result (str): Evaluation result (None if the evaluation failed).
+        error (str): Evaluation error (None if the evaluation succeeded).
         timestamp (datetime): Timestamp of when the expression was evaluated.
+
+    Indexes:
+        (timestamp, id): Keyset pagination of the history, newest first.
+        expression: Expression prefix filters (text_pattern_ops on PostgreSQL so
+            LIKE 'prefix%' can use it).
     """
+    __table_args__ = (
+        db.Index('ix_expression_result_timestamp_id', 'timestamp', 'id'),
+        db.Index(
+            'ix_expression_result_expression', 'expression',
+            postgresql_ops={'expression': 'text_pattern_ops'},
+        ),
+    )
+
     id = db.Column(db.String(36), primary_key=True)
     expression = db.Column(db.String)
-    result = db.Column(db.String, nullable=True)    
-    timestamp = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
\ No newline at end of file
+    result = db.Column(db.String, nullable=True)
+    error = db.Column(db.String, nullable=True)
+    timestamp = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+
+class EvaluationJob(db.Model):
+    """
+    SQLAlchemy model for a queued evaluation job of the durable job queue.
+
+    A job stays in the table until every result it produces has been written, so
+    jobs queued or in flight when a process stops are replayed on the next start.
+
+    Attributes:
+        id (int): Queue position (claimed in ascending order).
+        payload (str): The queued item as JSON (a job or a batch of jobs).
+        created_at (datetime): When the job was queued.
+        claimed_at (datetime): When a worker last claimed the job (None while pending).
+        claimed_by (str): Token of the claim; a claim expires after the lease timeout.
+        attempts (int): Number of times the job has been claimed.
+        priority (int): Rank of the job's priority lane (0 is the highest).
+        client (str): The submitting client (None when clients are not served round-robin).
+        client_round (int): Round of the lane's round-robin in which the job is served.
+
+    Indexes:
+        (claimed_at, id): Finding claimable jobs in queue order.
+        (priority, claimed_at, id): Finding the claimable jobs of one lane in queue order.
+        (client, priority, client_round): Finding a client's last round in a lane.
+    """
+    __table_args__ = (
+        db.Index('ix_evaluation_job_claimed_at_id', 'claimed_at', 'id'),
+        db.Index('ix_evaluation_job_priority_claimed_at_id', 'priority', 'claimed_at', 'id'),
+        db.Index('ix_evaluation_job_client_priority_round', 'client', 'priority', 'client_round'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    payload = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+    claimed_at = db.Column(db.DateTime, nullable=True)
+    claimed_by = db.Column(db.String(36), nullable=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    priority = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    client = db.Column(db.String, nullable=True)
+    client_round = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+def upgrade_schema(engine):
+    """
+    Bring tables created by earlier versions up to date with the models.
+
+    db.create_all() only creates missing tables, so columns, indexes and constraints
+    added to the models later never reach existing tables. This adds them: missing
+    columns are added (ALTER TABLE ... ADD COLUMN, with their server default),
+    missing indexes are created (CREATE INDEX only where the index does not exist
+    yet), and on PostgreSQL rows without a timestamp are given the current time before
+    expression_result.timestamp is made NOT NULL (SQLite cannot alter a column;
+    the application always sets the timestamp). Every step is skipped when already
+    applied, so it is safe to run on every start, after db.create_all().
+
+    Args:
+        engine (Engine): Engine of the application database.
+    """
+    for table in db.metadata.sorted_tables:
+        existing = {column['name'] for column in inspect(engine).get_columns(table.name)}
+        missing = [column for column in table.columns if column.name not in existing]
+        if missing:
+            with engine.begin() as conn:
+                for column in missing:
+                    definition = CreateColumn(column).compile(dialect=engine.dialect)
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {definition}"))
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+    columns = {column['name']: column for column in inspect(engine).get_columns(ExpressionResult.__tablename__)}
+    if engine.dialect.name == 'postgresql' and columns['timestamp']['nullable']:
+        with engine.begin() as conn:
+            conn.execute(text(
+                "UPDATE expression_result SET timestamp = now() AT TIME ZONE 'utc' WHERE timestamp IS NULL"
+            ))
+            conn.execute(text("ALTER TABLE expression_result ALTER COLUMN timestamp SET NOT NULL"))
@@ -0,0 +1,99 @@
+from datetime import datetime, timedelta, timezone
+import threading
+import time
+
+class RetentionManager:
+    """
+    Background expiry of old results from a result store, with optional archival.
+
+    Rows older than the retention period are removed oldest first in small
+    batches, each in its own short transaction, so no long-running lock is held.
+    With an archive, every batch is written to its day partition before it is deleted.
+
+    Methods:
+        start(): Start the background thread.
+        run_once(): Expire every row older than the retention period.
+        stop(): Stop the background thread.
+    """
+    def __init__(self, store, retention_days, batch_size=1000, interval=3600, pause=0.05, archive=None):
+        """
+        Args:
+            store (ResultStore): The store holding the results.
+            retention_days (float): Age in days after which results expire.
+            batch_size (int): Number of rows expired per transaction.
+            interval (float): Seconds between retention runs.
+            pause (float): Seconds to sleep between batches, letting other writers in.
+            archive (ResultArchive): Archive receiving expired rows (None deletes them outright).
+        """
+        self.retention = timedelta(days=retention_days)
+        self.batch_size = batch_size
+        self.interval = interval
+        self.pause = pause
+        self.archive = archive
+        self.store = store
+        self.expired = 0
+        self._stop = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """
+        Start the background thread.
+        """
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        """
+        Internal method: Run retention every interval until stopped.
+        """
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Error expiring results: {e}")
+            self._stop.wait(self.interval)
+
+    def expire_batch(self, cutoff):
+        """
+        Archive and delete one batch of rows older than the cutoff.
+
+        Args:
+            cutoff (datetime): Rows evaluated before this time expire.
+
+        Returns:
+            int: The number of rows expired.
+        """
+        rows = self.store.oldest(cutoff, self.batch_size)
+        if not rows:
+            return 0
+        if self.archive:
+            self.archive.append(rows)
+        self.store.delete(row['id'] for row in rows)
+        return len(rows)
+
+    def run_once(self):
+        """
+        Expire every row older than the retention period.
+
+        Returns:
+            int: The number of rows expired.
+        """
+        # Timestamps are stored as naive UTC
+        cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - self.retention
+        total = 0
+        while not self._stop.is_set():
+            count = self.expire_batch(cutoff)
+            total += count
+            if count < self.batch_size:
+                break
+            time.sleep(self.pause)
+        self.expired += total
+        return total
+
+    def stop(self):
+        """
+        Stop the background thread.
+        """
+        self._stop.set()
+        if self.thread:
+            self.thread.join()
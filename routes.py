@@ -1,43 +1,631 @@
-from flask import Blueprint, request, jsonify, render_template
+from flask import Blueprint, Response, g, request, jsonify, render_template, stream_with_context
 from flask_restx import Resource
-from models import db, ExpressionResult
-from utils.parser import parser, variable_parser
-from utils.stream import Stream
-from utils.validation import is_valid_expression, is_valid_variable_expression
+from utils.parser import (
+    parser, variable_parser, batch_variable_parser, normalize, compile_submission, estimate_cost,
+    check_cost,
+)
+from utils.numeric import get_engine
+from utils.executor import create_evaluator
+from utils.writer import BatchWriter
+from utils.notify import CompletionNotifier, CompletionPoller
+from utils.cache import LRUCache
+from utils.memo import ResultMemo
+from utils.archive import ResultArchive
+from utils.ratelimit import TokenBucketLimiter
+from utils.metrics import REGISTRY
+from store import create_store
+from job_queue import create_queue
+from datetime import datetime, timezone
+import base64
+import json
+import math
+import os
+import queue
+import re
+import time
 import uuid
 
-from api import evaluation_ns, health_ns, evaluate_model, evaluate_variable_model, result_model
+from api import (
+    evaluation_ns, health_ns, evaluate_model, evaluate_variable_model, result_model,
+    tabulate_model, tabulate_response_model, batch_model, batch_response_model,
+    history_response_model,
+)
 
 # Create a Blueprint for the main application
 bp = Blueprint('main', __name__)
 
-# Create a global stream for processing expressions
-expression_stream = Stream()
+# Priority lanes of queued work, highest first
+PRIORITY_LANES = ('high', 'normal', 'low')
+
+# Maximum deadline in seconds a submission may set
+DEADLINE_MAX = float(os.getenv('DEADLINE_MAX', '3600'))
+
+# Queue backend: 'memory' (this process only) or 'database' (shared by every process using it)
+QUEUE_BACKEND = os.getenv('QUEUE_BACKEND', 'memory')
+
+# Whether other processes may claim the jobs this process queues
+SHARED_QUEUE = QUEUE_BACKEND == 'database'
+
+# Create a global queue for processing expressions: an in-memory stream, or a durable
+# queue in the database that survives restarts and can be shared by several processes
+expression_stream = create_queue(
+    QUEUE_BACKEND,
+    url=os.getenv('DATABASE_URL'),
+    workers=int(os.getenv('STREAM_WORKERS', '1')),
+    maxsize=int(os.getenv('STREAM_MAX_QUEUE', '10000')),
+    lease=float(os.getenv('QUEUE_LEASE_SECONDS', '60')),
+    poll_interval=float(os.getenv('QUEUE_POLL_INTERVAL', '0.5')),
+    # Serve clients round-robin so one client's backlog cannot starve the others
+    fair=os.getenv('STREAM_FAIR', '1') == '1',
+    lanes=PRIORITY_LANES,
+    aging=float(os.getenv('STREAM_AGING_SECONDS', '5')),
+    registry=REGISTRY,
+)
+
+# Pipeline metrics exposed at /metrics
+jobs_expired = REGISTRY.counter('jobs_expired_total', 'Jobs expired before evaluation', ('lane',))
+job_latency = REGISTRY.histogram(
+    'job_latency_seconds', 'Time from enqueue to completed evaluation', ('lane',),
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+evaluation_errors = REGISTRY.counter('evaluation_errors_total', 'Failed evaluations by error type', ('type',))
+result_commit_seconds = REGISTRY.histogram('result_commit_seconds', 'Time to commit a batch of results')
+http_requests = REGISTRY.counter('http_requests_total', 'HTTP requests served', ('endpoint', 'method', 'status'))
+http_request_seconds = REGISTRY.histogram('http_request_seconds', 'Time to serve an HTTP request', ('endpoint',))
+
+# Per-client token buckets for submissions, costing one token per expression
+rate_limiter = TokenBucketLimiter(
+    rate=float(os.getenv('RATE_LIMIT_PER_SECOND', '0')),
+    burst=float(os.getenv('RATE_LIMIT_BURST', '100')),
+)
+
+# Request header identifying a client for rate limiting (otherwise its address is used)
+RATE_LIMIT_KEY_HEADER = os.getenv('RATE_LIMIT_KEY_HEADER', 'X-API-Key')
+
+# API keys accepted in that header (comma-separated); a request with any other key is
+# identified by its address, so clients cannot mint new identities to dodge their limits
+API_KEYS = frozenset(key.strip() for key in os.getenv('API_KEYS', '').split(',') if key.strip())
+
+# Queue depth above which submissions are turned away (0 disables), and the Retry-After sent then
+ADMISSION_MAX_BACKLOG = int(os.getenv('ADMISSION_MAX_BACKLOG', '0'))
+ADMISSION_RETRY_AFTER = int(os.getenv('ADMISSION_RETRY_AFTER', '1'))
+
+# Create the group-commit writer that persists evaluation results in batches
+result_writer = BatchWriter(
+    max_batch=int(os.getenv('WRITER_MAX_BATCH', '500')),
+    max_delay=float(os.getenv('WRITER_MAX_DELAY', '0.05')),
+)
+
+# Create the notifier that wakes long-poll and event-stream clients when results are written
+completion_notifier = CompletionNotifier()
+
+# Create the caches in front of result and history lookups
+result_cache = LRUCache(
+    maxsize=int(os.getenv('RESULT_CACHE_SIZE', '10000')),
+    ttl=float(os.getenv('RESULT_CACHE_TTL', '3600')) or None,
+)
+history_cache = LRUCache(maxsize=1, ttl=float(os.getenv('HISTORY_CACHE_TTL', '2')))
+
+# Create the content-addressed memo that answers repeated expressions without evaluation
+result_memo = ResultMemo(
+    maxsize=int(os.getenv('MEMO_SIZE', '10000')),
+    policy=os.getenv('MEMO_POLICY', 'lru'),
+    ttl=float(os.getenv('MEMO_TTL', '0')) or None,
+)
+
+# Create the store that persists evaluation results (bound to the app in app.py)
+result_store = create_store(
+    os.getenv('RESULT_STORE', 'sqlalchemy'),
+    path=os.getenv('RESULT_STORE_PATH', 'results.db'),
+    # Dedicated writer pool: one connection for the result writer, one spare for retention
+    writer_pool={
+        'pool_size': int(os.getenv('DB_WRITER_POOL_SIZE', '1')),
+        'max_overflow': int(os.getenv('DB_WRITER_MAX_OVERFLOW', '1')),
+        'timeout': float(os.getenv('DB_POOL_TIMEOUT', '30')),
+        'recycle': int(os.getenv('DB_POOL_RECYCLE', '1800')),
+        'pre_ping': os.getenv('DB_POOL_PRE_PING', '1') == '1',
+    },
+)
+
+# Archive of expired results, still consulted by result lookups
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', '')
+result_archive = ResultArchive(ARCHIVE_DIR) if ARCHIVE_DIR else None
+
+# Cached status of a request that has been queued but not yet written
+PROCESSING = {'status': 'processing'}
+
+# Create the executor that parses and evaluates expressions for the stream
+memory_limit_mb = int(os.getenv('EVALUATION_MEMORY_LIMIT_MB', '0'))
+evaluator = create_evaluator(
+    os.getenv('EVALUATION_EXECUTOR', 'inline'),
+    processes=int(os.getenv('EVALUATION_PROCESSES', '0')) or None,
+    cpu_limit=float(os.getenv('EVALUATION_CPU_LIMIT', '5')),
+    memory_limit=memory_limit_mb * 1024 * 1024 or None,
+    timeout=float(os.getenv('EVALUATION_TIMEOUT', '30')),
+)
+
+# Maximum number of values accepted by the tabulation endpoint
+TABULATE_MAX_VALUES = int(os.getenv('TABULATE_MAX_VALUES', '100000'))
+
+# Maximum number of expressions accepted by the batch endpoint
+BATCH_MAX_EXPRESSIONS = int(os.getenv('BATCH_MAX_EXPRESSIONS', '1000'))
+
+# Maximum seconds a long-poll request or result event stream may stay open
+LONG_POLL_MAX_WAIT = float(os.getenv('LONG_POLL_MAX_WAIT', '30'))
+STREAM_MAX_WAIT = float(os.getenv('RESULT_STREAM_MAX_WAIT', '300'))
+
+# Maximum number of request IDs watched by one result event stream
+STREAM_MAX_IDS = int(os.getenv('RESULT_STREAM_MAX_IDS', '1000'))
+
+# Default and maximum number of entries per history page
+HISTORY_PAGE_SIZE = int(os.getenv('HISTORY_PAGE_SIZE', '20'))
+HISTORY_MAX_PAGE_SIZE = int(os.getenv('HISTORY_MAX_PAGE_SIZE', '100'))
+
+# Seconds a submission may wait for room in a full queue before it is rejected
+ENQUEUE_TIMEOUT = float(os.getenv('STREAM_ENQUEUE_TIMEOUT', '1'))
+
+# Whether this process evaluates queued expressions itself; with EMBEDDED_WORKER=0
+# the web tier only validates and enqueues, and `python -m worker` processes evaluate
+EMBEDDED_WORKER = os.getenv('EMBEDDED_WORKER', '1') == '1'
+
+def evaluates_every_job():
+    """
+    Return whether this process evaluates every job it queues.
+
+    Only then does it see every result as it is written: with a shared queue, any
+    process may claim a job, and its results complete in the result store.
+    """
+    return EMBEDDED_WORKER and not SHARED_QUEUE
+
+# Seconds between result store checks while waiting on results evaluated by other processes
+RESULT_POLL_INTERVAL = float(os.getenv('RESULT_POLL_INTERVAL', '0.25'))
+
+# Create the poller that checks the result store once per interval for every waiting
+# client, announcing results written by other processes through the completion notifier
+result_poller = CompletionPoller(completion_notifier, result_store.existing, RESULT_POLL_INTERVAL)
+
+# Error reported for the requests of a queued job dropped after too many failed deliveries
+UNDELIVERABLE_ERROR = 'Evaluation abandoned: the job failed on every delivery attempt.'
+
+def memo_key(job):
+    """
+    Return the content key under which a job's result is memoized.
+
+    Args:
+        job (dict): Job with 'expression', optionally 'mode' and, for variable expressions, 'value'.
+
+    Returns:
+        str: The numeric mode and normalized expression, plus the value for variable
+        expressions as read by the mode.
+    """
+    engine = get_engine(job.get('mode'))
+    # Jobs are validated before they are keyed, so whitespace carries no meaning here
+    key = f"{engine.name}:" + ''.join(normalize(job['expression']).split())
+    if 'value' in job:
+        key += f"|x={engine.value(job['value'])!r}"
+    return key
+
+def identify_client(api_key, address):
+    """
+    Identify a client by its API key if the key is one of API_KEYS, or else by its address.
+
+    Args:
+        api_key (str): The RATE_LIMIT_KEY_HEADER header of the request, or None.
+        address (str): The client's address, or None.
+
+    Returns:
+        str: The client key used for rate limiting and fair scheduling.
+    """
+    if api_key and api_key in API_KEYS:
+        return api_key
+    return address or 'anonymous'
+
+def client_key():
+    """
+    Identify the client of the current request (see identify_client()).
+    """
+    return identify_client(request.headers.get(RATE_LIMIT_KEY_HEADER), request.remote_addr)
+
+def admit(client, cost, backlog=True):
+    """
+    Apply per-client rate limiting and, for queued work, queue-depth admission control.
+
+    Args:
+        client (str): The client key.
+        cost (int): Number of expressions in the request.
+        backlog (bool): Whether the request queues work and is subject to the backlog limit.
+
+    Returns:
+        tuple or None: A 400, 429 or 503 error response (with Retry-After), or None if admitted.
+    """
+    wait = rate_limiter.acquire(client, cost)
+    if wait == math.inf:
+        return {'error': f'Requests are limited to {rate_limiter.burst:g} expressions at once.'}, 400
+    if wait:
+        return {'error': 'Rate limit exceeded, please retry later.'}, 429, {'Retry-After': str(math.ceil(wait))}
+    if backlog and ADMISSION_MAX_BACKLOG and expression_stream.size() >= ADMISSION_MAX_BACKLOG:
+        return {'error': 'Server is busy, please retry later.'}, 503, {'Retry-After': str(ADMISSION_RETRY_AFTER)}
+    return None
+
+def parse_mode(data):
+    """
+    Read the numeric mode of a submission.
+
+    Args:
+        data (dict): The request body, optionally with 'mode'.
+
+    Returns:
+        str: 'float', 'exact' or 'decimal' (NUMERIC_MODE when none is given).
+
+    Raises:
+        ValueError: If the mode is unknown.
+    """
+    return get_engine(data.get('mode')).name
+
+def parse_scheduling(data, default_priority='normal'):
+    """
+    Parse the optional 'priority' and 'deadline' of a submission.
+
+    Args:
+        data (dict): The request body.
+        default_priority (str): Lane used when no priority is given.
+
+    Returns:
+        tuple: (priority lane, deadline as a Unix time or None).
+
+    Raises:
+        ValueError: If the priority or deadline is invalid.
+    """
+    priority = data.get('priority') or default_priority
+    if priority not in PRIORITY_LANES:
+        raise ValueError(f"Priority must be one of: {', '.join(PRIORITY_LANES)}.")
+    deadline = data.get('deadline')
+    if deadline is None:
+        return priority, None
+    if isinstance(deadline, bool) or not isinstance(deadline, (int, float, str)):
+        raise ValueError("Deadline must be a duration such as 5, '5s' or '500ms'.")
+    seconds = parse_duration(str(deadline), DEADLINE_MAX)
+    if seconds <= 0:
+        raise ValueError("Deadline must be positive.")
+    # Wall-clock time, so deadlines hold across processes sharing a database queue
+    return priority, time.time() + seconds
+
+def submit(jobs, client=None, priority='normal', deadline=None):
+    """
+    Serve jobs from the result memo where possible and queue the rest as one unit.
+
+    The submission is first subject to admission control (see admit()).
+    Memoized results are written for the new request IDs without evaluation, and
+    jobs identical to one already in flight, in the same lane and with the same
+    deadline, wait for its result instead of being queued again. The remaining jobs
+    are added to the expression stream, applying backpressure when the queue is
+    full. Without an embedded worker the memo is
+    never filled, so every job is queued; with a shared queue the job in flight may
+    be evaluated by another process, so identical jobs are queued rather than coalesced.
+
+    Args:
+        jobs (list): Jobs {'request_id', 'expression'[, 'value']}.
+        client (str): The submitting client, used for rate limiting and fair scheduling.
+        priority (str): The priority lane of the jobs.
+        deadline (float): Unix time after which the jobs expire instead of being evaluated.
+
+    Returns:
+        tuple or None: An error response if the submission is not admitted or the
+        queue is full, otherwise None.
+    """
+    rejected = admit(client, len(jobs))
+    if rejected:
+        return rejected
+    hits = []
+    leaders = []
+    for job in jobs:
+        job['key'] = memo_key(job)
+        if deadline:
+            job['deadline'] = deadline
+        if EMBEDDED_WORKER:
+            status, result = result_memo.claim(
+                job['key'], (job['request_id'], job['expression']), coalesce=evaluates_every_job(),
+                terms=coalescing_terms(job, priority),
+            )
+        else:
+            status, result = ResultMemo.LEADER, None
+        if status == ResultMemo.HIT:
+            hits.append(result_row(job['request_id'], job['expression'], result))
+        else:
+            result_cache.put(job['request_id'], PROCESSING)
+            if status == ResultMemo.LEADER:
+                leaders.append(job)
+    if leaders:
+        try:
+            item = leaders[0] if len(leaders) == 1 else {'batch': leaders}
+            item['client'] = client
+            item['priority'] = priority
+            item['enqueued_at'] = time.time()
+            expression_stream.add(item, timeout=ENQUEUE_TIMEOUT)
+        except queue.Full:
+            error = 'Server is busy, please retry later.'
+            for job in leaders:
+                result_cache.pop(job['request_id'])
+                followers = result_memo.fail(job['key'], coalescing_terms(job, priority))
+                fail_requests([req_id for req_id, _ in followers], error)
+            return {'error': error}, 503, {'Retry-After': str(ADMISSION_RETRY_AFTER)}
+    for row in hits:
+        result_cache.put(row['id'], result_payload(row))
+    store_rows(hits)
+    return None
+
+def coalescing_terms(job, lane):
+    """
+    Return the scheduling terms under which identical jobs share one evaluation: the
+    lane and deadline, so that no request waits in a lower lane or expires early.
+    """
+    return lane, job.get('deadline')
+
+def result_row(req_id, expr, result, error=None):
+    """
+    Build an ExpressionResult row for the result writer: a result, or the error of a failed evaluation.
+    """
+    return {'id': req_id, 'expression': expr, 'result': result, 'error': error, 'timestamp': datetime.now(timezone.utc)}
+
+def result_payload(row):
+    """
+    Turn a result row into the response payload of its request: {'result': ...} or {'error': ...}.
+    """
+    if row.get('error') is not None:
+        return {'error': row['error']}
+    return {'result': row['result']}
+
+def fail_requests(req_ids, error):
+    """
+    Fail requests whose submission was refused, and wake anyone waiting on them.
+
+    These errors are not stored; they are kept in the result cache only. Errors of
+    evaluations are stored as result rows (see error_rows()).
+    """
+    for req_id in req_ids:
+        result_cache.put(req_id, {'error': error})
+    expression_stream.ack(req_ids)
+    completion_notifier.notify(req_ids)
+
+def cached_result(req_id):
+    """
+    Return the outcome of a request from the result cache, if it can be trusted.
+
+    Args:
+        req_id (str): The request ID.
+
+    Returns:
+        dict or None: The cached payload, or None if the result store must be consulted.
+    """
+    cached = result_cache.get(req_id)
+    # Requests evaluated by other processes complete in the store, not in this cache
+    if cached is not None and (cached is not PROCESSING or evaluates_every_job()):
+        return cached
+    return None
+
+def stored_result(req_id, row):
+    """
+    Turn a stored or archived row into a result payload and cache it.
+
+    Args:
+        req_id (str): The request ID.
+        row (dict): The row, or None if the request is unknown.
+
+    Returns:
+        dict or None: {'result': ...} or {'error': ...}, or None if there is no row.
+    """
+    if row is None and result_archive:
+        row = result_archive.get(req_id)
+    if row:
+        payload = result_payload(row)
+        result_cache.put(req_id, payload)
+        return payload
+    return None
+
+def lookup_result(req_id):
+    """
+    Look up the outcome of a request, consulting the result cache before the result
+    store and the store before the archive of expired results.
+
+    Args:
+        req_id (str): The request ID.
+
+    Returns:
+        dict or None: {'result': ...}, {'error': ...}, PROCESSING for a request known
+        to be in flight, or None if the request is unknown.
+    """
+    cached = cached_result(req_id)
+    if cached is not None:
+        return cached
+    return stored_result(req_id, result_store.get(req_id))
+
+def validate_submission(expr, value=None, variable=False, mode=None, values=None):
+    """
+    Validate a submitted expression before it is queued.
+
+    The expression is validated and tokenized in a single pass, and compiled from
+    those tokens into the parser cache, so that evaluating it in this process does
+    not read it again. Its cost is estimated, so that expressions over the evaluation
+    budgets are rejected without being evaluated. Nothing is evaluated on the
+    request thread: errors that only evaluation reveals, such as division by zero,
+    are reported in the result by the worker.
+
+    Args:
+        expr (str): The submitted expression.
+        value: The value for 'x' (variable expressions only).
+        variable (bool): Whether the expression is a variable expression.
+        mode (str): The numeric mode the expression is evaluated in.
+        values (list): The values for 'x' of a tabulation, instead of `value`; the
+            cost is estimated for the largest one, and budgeted across all of them.
+
+    Returns:
+        str or None: An error message, or None if the expression is valid.
+    """
+    if not isinstance(expr, str):
+        return "Expression must be a string."
+    try:
+        tree = compile_submission(expr, variable, mode)
+        xs = ()
+        if variable:
+            engine = get_engine(mode)
+            xs = tuple(map(engine.value, values)) if values is not None else (engine.value(value),)
+        check_cost(estimate_cost(tree, mode, xs), max(len(xs), 1))
+    except Exception as e:
+        return str(e)
+    return None
+
+def wait_for_completion(watch, timeout):
+    """
+    Wait until watched requests may have completed.
+
+    Results evaluated in this process are announced by the completion notifier.
+    Results written by other processes are not, so unless this process evaluates
+    every job it queues, the shared result poller is started to find them in the
+    result store and announce them.
+
+    Args:
+        watch (Watch): Subscription to the pending request IDs.
+        timeout (float): Maximum number of seconds to wait.
+
+    Returns:
+        list: Request IDs to look up again (empty on timeout).
+    """
+    if not evaluates_every_job():
+        result_poller.start()
+    return watch.wait(timeout)
+
+def parse_duration(text, maximum):
+    """
+    Parse a wait duration such as '5', '5s' or '500ms' into seconds.
+
+    Args:
+        text (str): The duration, or None/empty for no wait.
+        maximum (float): Upper bound applied to the parsed duration.
+
+    Returns:
+        float: The duration in seconds, capped at `maximum`.
+
+    Raises:
+        ValueError: If the duration is malformed.
+    """
+    if not text:
+        return 0.0
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*(ms|s)?\s*', text)
+    if not match:
+        raise ValueError(f"Invalid duration: {text}")
+    seconds = float(match.group(1))
+    if match.group(2) == 'ms':
+        seconds /= 1000
+    return min(seconds, maximum)
+
+def evaluate_job(job):
+    """
+    Evaluate a single job with the configured executor.
+
+    Args:
+        job (dict): Job with 'expression', optionally 'mode' and, for variable expressions, 'value'.
+
+    Returns:
+        The evaluation result.
+    """
+    if 'value' in job:
+        return evaluator.run(variable_parser, job['expression'], job['value'], job.get('mode'))
+    return evaluator.run(parser, job['expression'], job.get('mode'))
+
+def write_results(rows):
+    """
+    Persist a batch of evaluation results in the result store, then acknowledge
+    their jobs and publish them to the result cache and to anyone waiting on them.
+
+    Args:
+        rows (list): Dicts with 'id', 'expression', 'result', 'error' and 'timestamp'.
+    """
+    with result_commit_seconds.time():
+        result_store.write_many(rows)
+    expression_stream.ack([row['id'] for row in rows])
+    for row in rows:
+        result_cache.put(row['id'], result_payload(row))
+    history_cache.clear()
+    completion_notifier.notify(row['id'] for row in rows)
+
+def store_rows(rows):
+    """
+    Hand result rows to the group-commit writer, or write them directly if it has been stopped.
+    """
+    if not rows:
+        return
+    try:
+        result_writer.add(rows)
+    except RuntimeError:
+        write_results(rows)
+
+def error_rows(job, error, lane='normal'):
+    """
+    Build error rows for a job that failed and for the requests coalesced onto it.
+
+    Args:
+        job (dict): The failed job.
+        error (str): The error message.
+        lane (str): The priority lane the job was queued in.
+
+    Returns:
+        list: Result rows carrying the error.
+    """
+    followers = result_memo.fail(job.get('key') or memo_key(job), coalescing_terms(job, lane))
+    return [result_row(req_id, expr, None, error) for req_id, expr in [(job['request_id'], job['expression'])] + followers]
+
+def fail_dropped_item(item):
+    """
+    Store an error for every request of a queued item dropped as undeliverable.
+
+    The rows are written directly rather than through the group-commit writer,
+    because the queue deletes the item once this returns.
+
+    Args:
+        item (dict): The dropped job or {'batch': [job, ...]}.
+    """
+    jobs = item['batch'] if 'batch' in item else [item]
+    lane = item.get('priority', 'normal')
+    write_results([row for job in jobs for row in error_rows(job, UNDELIVERABLE_ERROR, lane)])
 
 # Function to process expressions in the background
 def process_expression(item, app):
     """
-    Background task to process an expression or variable expression.
+    Background task to process an expression, a variable expression or a batch of them.
+
+    Each result is also recorded for the identical requests that were coalesced onto
+    the job while it was in flight. Jobs whose deadline has passed are not evaluated;
+    they and their coalesced requests are marked expired. Results, and the errors of
+    failed or expired jobs, are handed to the group-commit result writer; if the
+    writer has been stopped (e.g. during shutdown) they are written directly.
 
     Args:
-        item: Tuple containing expression data.
+        item (dict): A job {'request_id', 'expression'[, 'value'], 'key'[, 'deadline']},
+            or {'batch': [job, ...]} for a batch submitted as one unit.
+        app: The Flask application (kept for the stream's consumer signature).
     """
-    with app.app_context():
+    jobs = item['batch'] if 'batch' in item else [item]
+    lane = item.get('priority', 'normal')
+    rows = []
+    for job in jobs:
+        key = job.get('key') or memo_key(job)
+        if job.get('deadline') and time.time() > job['deadline']:
+            jobs_expired.labels(lane).inc()
+            rows.extend(error_rows(job, 'Deadline expired before evaluation.', lane))
+            continue
         try:
-            if isinstance(item, tuple) and item[0] == 'variable':
-                _, expr, value, req_id = item
-                result = variable_parser(expr, value)
-            else:
-                expr, req_id = item
-                result = parser(expr)
-            entry = ExpressionResult(id=req_id, expression=expr, result=str(result))
-            db.session.merge(entry)
-            db.session.commit()
+            result = str(evaluate_job(job))
         except Exception as e:
-            print(f"Error processing expression: {e}")         
-
-# Set the stream to use the processing function
-expression_stream.forEach(process_expression)
+            print(f"Error processing expression: {e}")
+            evaluation_errors.labels(type(e).__name__).inc()
+            rows.extend(error_rows(job, str(e), lane))
+            continue
+        followers = result_memo.complete(key, result)
+        for req_id, expr in [(job['request_id'], job['expression'])] + followers:
+            rows.append(result_row(req_id, expr, result))
+    if 'enqueued_at' in item:
+        job_latency.labels(lane).observe(max(0.0, time.time() - item['enqueued_at']))
+    store_rows(rows)
 
 @bp.route('/')
 def index():
@@ -55,38 +643,182 @@ class HealthResource(Resource):
         """Health check endpoint"""
         return {'status': 'ok'}
 
+@health_ns.route('/pipeline')
+class PipelineResource(Resource):
+    def get(self):
+        """Queue depth, result writer, cache and connection pool metrics"""
+        return {
+            'queue_depth': expression_stream.size(),
+            'writer': result_writer.stats(),
+            'result_cache': result_cache.stats(),
+            'history_cache': history_cache.stats(),
+            'memo': result_memo.stats(),
+            'db_pool': result_store.pool_stats(),
+            'rate_limit': rate_limiter.stats(),
+            'lanes': expression_stream.lane_stats(),
+            'expired': {lane: jobs_expired.labels(lane).value for lane in PRIORITY_LANES},
+        }
+
+# Gauges read when /metrics is scraped
+REGISTRY.gauge('queue_depth', 'Items waiting in the expression queue', callback=lambda: expression_stream.size())
+REGISTRY.gauge(
+    'queue_lane_depth', 'Items waiting in each priority lane', ('lane',),
+    callback=lambda: {lane: stats['depth'] for lane, stats in expression_stream.lane_stats().items()},
+)
+REGISTRY.gauge('writer_pending_rows', 'Result rows waiting for the group-commit writer',
+               callback=lambda: result_writer.stats()['pending'])
+REGISTRY.gauge('memo_in_flight', 'Distinct expressions being evaluated', callback=lambda: result_memo.stats()['in_flight'])
+REGISTRY.gauge(
+    'cache_entries', 'Entries in each cache', ('cache',),
+    callback=lambda: {'result': result_cache.stats()['size'], 'history': history_cache.stats()['size']},
+)
+
+@bp.before_app_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@bp.after_app_request
+def record_request(response):
+    """
+    Count every HTTP request by route, method and status, and time it by route.
+    """
+    started = g.pop('request_started', None)
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    http_requests.labels(endpoint, request.method, response.status_code).inc()
+    if started is not None:
+        http_request_seconds.labels(endpoint).observe(time.perf_counter() - started)
+    return response
+
+@bp.route('/metrics', methods=['GET'])
+def metrics():
+    """Pipeline metrics in the Prometheus text exposition format."""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+def submit_expression(data, variable=False, client=None):
+    """
+    Validate and queue a single standard or variable expression submission.
+
+    Args:
+        data (dict): The request body with 'expression' and, for variable expressions, 'value'.
+        variable (bool): Whether the expression is a variable expression.
+        client (str): The submitting client.
+
+    Returns:
+        dict or tuple: {'request_id': ...}, or an error response.
+    """
+    if not isinstance(data, dict):
+        return {'error': 'Request body must be a JSON object.'}, 400
+    expr = data.get('expression', '')
+    try:
+        mode = parse_mode(data)
+    except ValueError as e:
+        return {'error': str(e)}, 400
+    job = {'request_id': str(uuid.uuid4()), 'expression': expr, 'mode': mode}
+    if variable:
+        job['value'] = data.get('value', 0)
+    error = validate_submission(expr, job.get('value'), variable, mode)
+    if error:
+        return {'error': error}, 400
+    try:
+        priority, deadline = parse_scheduling(data)
+    except ValueError as e:
+        return {'error': str(e)}, 400
+    busy = submit([job], client, priority, deadline)
+    if busy:
+        return busy
+    return {'request_id': job['request_id']}
+
 @evaluation_ns.route('/expression')
 class EvaluateResource(Resource):
     @evaluation_ns.expect(evaluate_model)
     def post(self):
         """Submit a standard mathematical expression for evaluation"""
-        data = evaluation_ns.payload
-        expr = data.get('expression', '')
-        result = is_valid_expression(expr)
-        if result is not True:
-            return {'error': result}, 400
-        req_id = str(uuid.uuid4())
-        try:            
-            parser(expr)
-        except Exception as e:
-            return {'error': str(e)}, 400
-        expression_stream.add((expr, req_id))
-        return {'request_id': req_id}
+        return submit_expression(evaluation_ns.payload, client=client_key())
 
 @evaluation_ns.route('/variable')
 class EvaluateVariableResource(Resource):
     @evaluation_ns.expect(evaluate_variable_model)
     def post(self):
         """Submit a variable math expression and value for evaluation"""
+        return submit_expression(request.get_json(), variable=True, client=client_key())
+
+@evaluation_ns.route('/batch')
+class EvaluateBatchResource(Resource):
+    @evaluation_ns.expect(batch_model)
+    @evaluation_ns.response(200, 'Success', batch_response_model)
+    def post(self):
+        """Submit a batch of standard and variable expressions for evaluation"""
         data = request.get_json()
+        if not isinstance(data, dict):
+            return {'error': 'Request body must be a JSON object.'}, 400
+        items = data.get('expressions')
+        if not isinstance(items, list) or not items:
+            return {'error': 'Expressions must be a non-empty list.'}, 400
+        if len(items) > BATCH_MAX_EXPRESSIONS:
+            return {'error': f'At most {BATCH_MAX_EXPRESSIONS} expressions are allowed.'}, 400
+        try:
+            mode = parse_mode(data)
+        except ValueError as e:
+            return {'error': str(e)}, 400
+        errors = []
+        jobs = []
+        for index, entry in enumerate(items):
+            if not isinstance(entry, dict):
+                errors.append({'index': index, 'error': 'Each entry must be an object.'})
+                continue
+            expr = entry.get('expression', '')
+            variable = 'value' in entry
+            error = validate_submission(expr, entry.get('value'), variable, mode)
+            if error:
+                errors.append({'index': index, 'error': error})
+                continue
+            job = {'request_id': str(uuid.uuid4()), 'expression': expr, 'mode': mode}
+            if variable:
+                job['value'] = entry['value']
+            jobs.append(job)
+        if errors:
+            return {'error': 'Invalid expressions in batch.', 'errors': errors}, 400
+        try:
+            # Batches default to the low lane so they do not delay interactive requests
+            priority, deadline = parse_scheduling(data, default_priority='low')
+        except ValueError as e:
+            return {'error': str(e)}, 400
+        busy = submit(jobs, client_key(), priority, deadline)
+        if busy:
+            return busy
+        return {'request_ids': [job['request_id'] for job in jobs]}
+
+@evaluation_ns.route('/tabulate')
+class TabulateResource(Resource):
+    @evaluation_ns.expect(tabulate_model)
+    @evaluation_ns.response(200, 'Success', tabulate_response_model)
+    def post(self):
+        """Evaluate a variable math expression for an array of values"""
+        data = request.get_json()
+        if not isinstance(data, dict):
+            return {'error': 'Request body must be a JSON object.'}, 400
         expr = data.get('expression', '')
-        value = data.get('value', 0)
-        result = is_valid_variable_expression(expr)
-        if result is not True:
-            return {'error': result}, 400
-        req_id = str(uuid.uuid4())
-        expression_stream.add(('variable', expr, value, req_id))
-        return {'request_id': req_id}
+        values = data.get('values')
+        if not isinstance(values, list):
+            return {'error': 'Values must be a list.'}, 400
+        if len(values) > TABULATE_MAX_VALUES:
+            return {'error': f'At most {TABULATE_MAX_VALUES} values are allowed.'}, 400
+        try:
+            mode = parse_mode(data)
+        except ValueError as e:
+            return {'error': str(e)}, 400
+        error = validate_submission(expr, variable=True, mode=mode, values=values)
+        if error:
+            return {'error': error}, 400
+        # Every value is evaluated, so each costs one token like a submitted expression
+        rejected = admit(client_key(), max(len(values), 1), backlog=False)
+        if rejected:
+            return rejected
+        try:
+            results = evaluator.run(batch_variable_parser, expr, values, mode)
+        except Exception as e:
+            return {'error': str(e)}, 400
+        return {'results': results}
 
 @evaluation_ns.route('/result/<string:req_id>')
 class ResultResource(Resource):
@@ -95,41 +827,199 @@ class ResultResource(Resource):
         """
         Poll for the result of an evaluated expression.
 
+        With `?wait=5s` the request is held open (long-poll) until the result is
+        written or the wait expires, instead of answering 'processing' at once.
+
         Args:
             req_id (str): The request ID.
 
         Returns:
-            JSON with result or error, or status 'processing'.
+            JSON with result or error, or status 'processing'. Requests known to be
+            in flight are answered from the result cache without a database read.
         """
-        entry = db.session.get(ExpressionResult, req_id)
-        if entry:
-            return {'result': entry.result}, 200
-        else:
-            return {'status': 'processing'}, 202
-        
+        try:
+            wait = parse_duration(request.args.get('wait'), LONG_POLL_MAX_WAIT)
+        except ValueError as e:
+            return {'error': str(e)}, 400
+        deadline = time.monotonic() + wait
+        with completion_notifier.watch([req_id]) as watch:
+            payload = lookup_result(req_id)
+            while payload is None or payload is PROCESSING:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not wait_for_completion(watch, remaining):
+                    break
+                payload = lookup_result(req_id)
+        if payload is None or payload is PROCESSING:
+            return PROCESSING, 202
+        return payload, 200
+
+@evaluation_ns.route('/results/stream')
+class ResultStreamResource(Resource):
+    def get(self):
+        """
+        Stream results for a set of request IDs as Server-Sent Events.
+
+        Query parameters: `ids` (comma-separated request IDs) and `timeout`
+        (e.g. '30s'). Each completed result (or evaluation error) is sent as a
+        'result' event; a final 'end' event lists the request IDs still pending
+        when the stream closes.
+        """
+        req_ids = [i for i in request.args.get('ids', '').split(',') if i]
+        if not req_ids:
+            return {'error': 'At least one request ID is required.'}, 400
+        if len(req_ids) > STREAM_MAX_IDS:
+            return {'error': f'At most {STREAM_MAX_IDS} request IDs are allowed.'}, 400
+        try:
+            timeout = parse_duration(request.args.get('timeout', '30s'), STREAM_MAX_WAIT)
+        except ValueError as e:
+            return {'error': str(e)}, 400
+
+        def event(name, data):
+            return f"event: {name}\ndata: {json.dumps(data)}\n\n"
+
+        def generate():
+            pending = set(req_ids)
+            deadline = time.monotonic() + timeout
+            with completion_notifier.watch(req_ids) as watch:
+                ready = list(pending)
+                while True:
+                    for req_id in ready:
+                        payload = lookup_result(req_id)
+                        if payload not in (None, PROCESSING) and req_id in pending:
+                            pending.discard(req_id)
+                            yield event('result', dict(payload, request_id=req_id))
+                    remaining = deadline - time.monotonic()
+                    if not pending or remaining <= 0:
+                        break
+                    ready = [i for i in wait_for_completion(watch, remaining) if i in pending]
+            yield event('end', {'pending': sorted(pending)})
+
+        return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache'})
+
+def encode_cursor(row):
+    """
+    Encode the keyset position (timestamp, id) of a history row as an opaque cursor.
+    """
+    raw = f"{row['timestamp'].isoformat()}|{row['id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor):
+    """
+    Decode a history cursor into its (timestamp, id) keyset position.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        timestamp, req_id = raw.split('|', 1)
+        return datetime.fromisoformat(timestamp), req_id
+    except Exception:
+        raise ValueError("Invalid cursor.")
+
+def parse_timestamp(text):
+    """
+    Parse an ISO 8601 timestamp into the naive UTC form stored in the database.
+
+    Raises:
+        ValueError: If the timestamp is malformed.
+    """
+    try:
+        value = datetime.fromisoformat(text)
+    except ValueError:
+        raise ValueError(f"Invalid timestamp: {text}")
+    if value.tzinfo:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def parse_history_query(args):
+    """
+    Parse the query parameters of a history request.
+
+    Args:
+        args (Mapping): The query parameters.
+
+    Returns:
+        dict: 'limit', 'before' (keyset position), 'since', 'until' and 'prefix'.
+
+    Raises:
+        ValueError: If a parameter is malformed.
+    """
+    limit = args.get('limit', HISTORY_PAGE_SIZE)
+    try:
+        limit = min(int(limit), HISTORY_MAX_PAGE_SIZE)
+    except ValueError:
+        raise ValueError(f"Invalid limit: {limit}")
+    if limit < 1:
+        raise ValueError("Limit must be positive.")
+    return {
+        'limit': limit,
+        'before': decode_cursor(args['cursor']) if args.get('cursor') else None,
+        'since': parse_timestamp(args['since']) if args.get('since') else None,
+        'until': parse_timestamp(args['until']) if args.get('until') else None,
+        'prefix': args.get('prefix'),
+    }
+
+def history_page(results, limit):
+    """
+    Build a history response from up to `limit` + 1 rows, newest first.
+
+    Args:
+        results (list): Rows fetched with one extra row to detect a following page.
+        limit (int): The page size.
+
+    Returns:
+        dict: 'history' entries and the 'next_cursor' (None on the last page).
+    """
+    history = [
+        {
+            "id": row['id'],
+            "expression": row['expression'],
+            "result": row['result'],
+            "timestamp": row['timestamp'].isoformat() if row['timestamp'] else None,
+        }
+        for row in results[:limit]
+    ]
+    return {
+        "history": history,
+        "next_cursor": encode_cursor(results[limit - 1]) if len(results) > limit else None,
+    }
+
 @evaluation_ns.route('/history')
 class HistoryResource(Resource):
+    @evaluation_ns.doc(params={
+        'limit': f'Number of entries per page (default {HISTORY_PAGE_SIZE}, at most {HISTORY_MAX_PAGE_SIZE})',
+        'cursor': 'Cursor returned as next_cursor by the previous page',
+        'since': 'Only entries evaluated at or after this ISO 8601 timestamp',
+        'until': 'Only entries evaluated before this ISO 8601 timestamp',
+        'prefix': 'Only expressions starting with this text',
+    })
+    @evaluation_ns.response(200, 'Success', history_response_model)
     def get(self):
         """
-        Return the history of evaluated expressions and their results.
+        Return the history of evaluated expressions and their results, newest first.
+
+        Pages are keyset-paginated on (timestamp, id): pass the returned
+        next_cursor to fetch the following page. Each page is an index range
+        scan, so deep pages cost the same as the first one.
         """
-        # Get the last 20 results
-        results = (
-            db.session.query(ExpressionResult)
-            .order_by(ExpressionResult.timestamp.desc())
-            .limit(20)
-            .all()
-        )
-        history = [
-            {
-                "id": entry.id,
-                "expression": entry.expression,
-                "result": entry.result,
-                "timestamp": entry.timestamp.isoformat() if entry.timestamp else None,
-            }
-            for entry in results
-        ]
-        return {"history": history}
+        args = request.args
+        latest = not args
+        if latest:
+            cached = history_cache.get('latest')
+            if cached is not None:
+                return cached
+        try:
+            query = parse_history_query(args)
+        except ValueError as e:
+            return {'error': str(e)}, 400
+        # Fetch one extra row to find out whether another page follows
+        results = result_store.history(query['limit'] + 1, query['before'], query['since'], query['until'], query['prefix'])
+        response = history_page(results, query['limit'])
+        if latest:
+            history_cache.put('latest', response)
+        return response
 
 # Export for api.py
-__all__ = ['bp', 'process_expression', 'expression_stream']
\ No newline at end of file
+__all__ = ['bp', 'process_expression', 'fail_dropped_item', 'write_results', 'expression_stream', 'result_writer', 'completion_notifier', 'result_cache', 'result_memo', 'result_archive', 'result_store', 'evaluator']
\ No newline at end of file
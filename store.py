@@ -0,0 +1,593 @@
+from abc import ABC, abstractmethod
+from bisect import bisect_left, insort
+from datetime import datetime, timezone
+from sqlalchemy import create_engine, make_url, select, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import QueuePool
+from models import db, ExpressionResult
+import sqlite3
+import threading
+import time
+
+class PoolMetrics:
+    """
+    Checkout counters and wait times of one connection pool.
+    """
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, wait, timed_out=False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    def stats(self):
+        """
+        Return checkout and wait-time metrics.
+
+        Returns:
+            dict: Checkouts, timeouts and average/maximum/total wait in seconds.
+        """
+        with self._lock:
+            count = self.checkouts + self.timeouts
+            return {
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'avg_wait_seconds': self.total_wait / count if count else 0.0,
+                'max_wait_seconds': self.max_wait,
+                'total_wait_seconds': self.total_wait,
+            }
+
+# Metrics of every timed pool, keyed by the pool's logging name
+POOL_METRICS = {}
+
+class TimedQueuePool(QueuePool):
+    """
+    QueuePool that records how long each checkout waits for a connection.
+
+    Metrics are kept in POOL_METRICS under the pool's logging name
+    (the `pool_logging_name` engine option), which survives pool recreation.
+    """
+    def _do_get(self):
+        metrics = POOL_METRICS.setdefault(self._orig_logging_name or 'default', PoolMetrics())
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            metrics.record(time.perf_counter() - start, timed_out=True)
+            raise
+        metrics.record(time.perf_counter() - start)
+        return connection
+
+def pool_options(url, name, pool_size=5, max_overflow=10, timeout=30, recycle=1800, pre_ping=True):
+    """
+    Build engine options for an explicitly configured, timed connection pool.
+
+    In-memory SQLite databases keep SQLAlchemy's default single-connection pool,
+    since every pooled connection would open a separate empty database.
+
+    Args:
+        url (str): The database URL.
+        name (str): Pool name used for its metrics.
+        pool_size (int): Number of connections kept open.
+        max_overflow (int): Extra connections allowed under load.
+        timeout (float): Seconds to wait for a free connection.
+        recycle (int): Seconds after which connections are replaced (-1 disables).
+        pre_ping (bool): Whether to test connections on checkout.
+
+    Returns:
+        dict: Keyword arguments for create_engine (or SQLALCHEMY_ENGINE_OPTIONS).
+    """
+    parsed = make_url(url)
+    if parsed.get_backend_name() == 'sqlite' and parsed.database in (None, '', ':memory:'):
+        return {}
+    return {
+        'poolclass': TimedQueuePool,
+        'pool_logging_name': name,
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_timeout': timeout,
+        'pool_recycle': recycle,
+        'pool_pre_ping': pre_ping,
+    }
+
+def history_statement(limit, before=None, since=None, until=None, prefix=None):
+    """
+    Build the keyset-paginated history query of the ExpressionResult table.
+
+    See ResultStore.history() for the arguments.
+    """
+    # Failed evaluations are kept for their result lookups but not listed
+    query = select(ExpressionResult).where(ExpressionResult.error.is_(None))
+    if before:
+        query = query.where(tuple_(ExpressionResult.timestamp, ExpressionResult.id) < before)
+    if since:
+        query = query.where(ExpressionResult.timestamp >= since)
+    if until:
+        query = query.where(ExpressionResult.timestamp < until)
+    if prefix:
+        query = query.where(ExpressionResult.expression.startswith(prefix, autoescape=True))
+    return query.order_by(ExpressionResult.timestamp.desc(), ExpressionResult.id.desc()).limit(limit)
+
+def to_utc_naive(timestamp):
+    """
+    Convert a timestamp to the naive UTC form used by every store.
+    """
+    if timestamp is not None and timestamp.tzinfo:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+class ResultStore(ABC):
+    """
+    Storage backend for evaluation results.
+
+    Rows are dicts with 'id', 'expression', 'result', 'error' and 'timestamp' (naive
+    UTC datetime). A failed evaluation is stored with its error and no result; its
+    row is returned by get() but not by history().
+
+    Methods:
+        write_many(rows): Insert or replace a batch of rows.
+        get(req_id): Return one row by request ID.
+        existing(req_ids): Return the request IDs that have a row.
+        history(limit, before, since, until, prefix): Return rows newest first.
+        oldest(cutoff, limit): Return the oldest rows evaluated before a cutoff.
+        delete(req_ids): Delete rows by request ID.
+    """
+    @abstractmethod
+    def write_many(self, rows):
+        pass
+
+    @abstractmethod
+    def get(self, req_id):
+        pass
+
+    def existing(self, req_ids):
+        """
+        Return the request IDs that have a row, out of a list of them.
+        """
+        return [req_id for req_id in req_ids if self.get(req_id) is not None]
+
+    @abstractmethod
+    def history(self, limit, before=None, since=None, until=None, prefix=None):
+        """
+        Return rows newest first, ordered by (timestamp, id).
+
+        Args:
+            limit (int): Maximum number of rows.
+            before (tuple): Keyset position (timestamp, id); only rows strictly before it are returned.
+            since (datetime): Only rows evaluated at or after this time.
+            until (datetime): Only rows evaluated before this time.
+            prefix (str): Only rows whose expression starts with this text.
+
+        Returns:
+            list: Row dicts.
+        """
+        pass
+
+    @abstractmethod
+    def oldest(self, cutoff, limit):
+        pass
+
+    @abstractmethod
+    def delete(self, req_ids):
+        pass
+
+    def init_app(self, app):
+        """
+        Bind the store to the application (only needed by database-backed stores).
+        """
+
+    def pool_stats(self):
+        """
+        Return connection pool metrics (empty for stores without a pool).
+        """
+        return {}
+
+    def close(self):
+        """
+        Release the store's resources.
+        """
+
+class SQLAlchemyStore(ResultStore):
+    """
+    Result store backed by the application's Flask-SQLAlchemy database (PostgreSQL in production).
+
+    Reads run on the request-handling engine. Writes and expiry run on a dedicated
+    engine with its own small pool and one long-lived session, so background
+    writers never compete with requests for connections.
+    """
+    # Dialect-specific INSERT constructs supporting ON CONFLICT
+    UPSERT_DIALECTS = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+
+    def __init__(self, writer_pool=None):
+        """
+        Args:
+            writer_pool (dict): Keyword arguments for pool_options() of the writer engine.
+        """
+        self.app = None
+        self.writer_pool = writer_pool or {'pool_size': 1, 'max_overflow': 1}
+        self.engine = None
+        self._owns_engine = False
+        self._session = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """
+        Bind the store to the application and create the dedicated writer engine.
+        """
+        self.app = app
+        url = app.config['SQLALCHEMY_DATABASE_URI']
+        parsed = make_url(url)
+        if parsed.get_backend_name() == 'sqlite' and parsed.database in (None, '', ':memory:'):
+            # A separate engine would open a separate in-memory database
+            with app.app_context():
+                self.engine = db.engine
+        else:
+            self.engine = create_engine(url, **pool_options(url, 'writer', **self.writer_pool))
+            self._owns_engine = True
+        self._session = Session(self.engine, expire_on_commit=False)
+
+    @staticmethod
+    def _row(entry):
+        return {
+            'id': entry.id, 'expression': entry.expression, 'result': entry.result, 'error': entry.error,
+            'timestamp': entry.timestamp,
+        }
+
+    def write_many(self, rows):
+        """
+        Persist a batch of rows with a single multi-row INSERT ... ON CONFLICT.
+        """
+        insert = self.UPSERT_DIALECTS.get(self.engine.dialect.name)
+        # Every row of a multi-row INSERT needs the same columns
+        rows = [dict(row, error=row.get('error')) for row in rows]
+        with self._lock:
+            try:
+                if insert:
+                    stmt = insert(ExpressionResult).values(rows)
+                    stmt = stmt.on_conflict_do_update(
+                        index_elements=[ExpressionResult.id],
+                        set_={
+                            'expression': stmt.excluded.expression,
+                            'result': stmt.excluded.result,
+                            'error': stmt.excluded.error,
+                            'timestamp': stmt.excluded.timestamp,
+                        },
+                    )
+                    self._session.execute(stmt)
+                else:
+                    self._session.execute(db.insert(ExpressionResult), rows)
+                self._session.commit()
+            except Exception:
+                self._session.rollback()
+                raise
+
+    def get(self, req_id):
+        with self.app.app_context():
+            entry = db.session.get(ExpressionResult, req_id)
+            return self._row(entry) if entry else None
+
+    def existing(self, req_ids):
+        with self.app.app_context():
+            return db.session.scalars(
+                select(ExpressionResult.id).where(ExpressionResult.id.in_(list(req_ids)))
+            ).all()
+
+    def history(self, limit, before=None, since=None, until=None, prefix=None):
+        with self.app.app_context():
+            entries = db.session.scalars(history_statement(limit, before, since, until, prefix)).all()
+            return [self._row(entry) for entry in entries]
+
+    def oldest(self, cutoff, limit):
+        with self._lock:
+            try:
+                entries = (
+                    self._session.query(ExpressionResult)
+                    .filter(ExpressionResult.timestamp < cutoff)
+                    .order_by(ExpressionResult.timestamp, ExpressionResult.id)
+                    .limit(limit)
+                    .all()
+                )
+                rows = [self._row(entry) for entry in entries]
+            finally:
+                self._session.rollback()
+            return rows
+
+    def delete(self, req_ids):
+        with self._lock:
+            try:
+                self._session.query(ExpressionResult).filter(
+                    ExpressionResult.id.in_(list(req_ids))
+                ).delete(synchronize_session=False)
+                self._session.commit()
+            except Exception:
+                self._session.rollback()
+                raise
+
+    def pool_stats(self):
+        """
+        Return metrics of the request-handling and writer connection pools.
+        """
+        stats = {name: metrics.stats() for name, metrics in POOL_METRICS.items()}
+        if self.engine is not None:
+            stats.setdefault('writer', {})['status'] = self.engine.pool.status()
+        return stats
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+            if self._owns_engine:
+                self.engine.dispose()
+
+class AsyncResultReader:
+    """
+    Asynchronous, read-only access to the results of the SQLAlchemy store, used by
+    the ASGI serving mode so that lookups do not block the event loop.
+
+    The database URL is mapped to an asyncio driver (asyncpg for PostgreSQL,
+    aiosqlite for SQLite).
+
+    Methods:
+        get(req_id): Return one row by request ID.
+        history(limit, before, since, until, prefix): Return rows newest first.
+        close(): Dispose of the engine.
+    """
+    # Asyncio drivers by database backend
+    ASYNC_DRIVERS = {'postgresql': 'postgresql+asyncpg', 'sqlite': 'sqlite+aiosqlite'}
+
+    def __init__(self, url, pool_size=5, max_overflow=10, timeout=30, recycle=1800, pre_ping=True):
+        """
+        Args:
+            url (str): The database URL of the SQLAlchemy store.
+            pool_size (int): Number of connections kept open.
+            max_overflow (int): Extra connections allowed under load.
+            timeout (float): Seconds to wait for a free connection.
+            recycle (int): Seconds after which connections are replaced.
+            pre_ping (bool): Whether to test connections on checkout.
+
+        Raises:
+            ValueError: If the database has no supported asyncio driver.
+        """
+        parsed = make_url(url)
+        driver = self.ASYNC_DRIVERS.get(parsed.get_backend_name())
+        if driver is None:
+            raise ValueError(f"No asyncio driver for database: {parsed.get_backend_name()}")
+        if parsed.get_backend_name() == 'sqlite' and parsed.database in (None, '', ':memory:'):
+            raise ValueError("Asynchronous access cannot share an in-memory SQLite database.")
+        options = {}
+        if parsed.get_backend_name() != 'sqlite':
+            options = {
+                'pool_size': pool_size,
+                'max_overflow': max_overflow,
+                'pool_timeout': timeout,
+                'pool_recycle': recycle,
+                'pool_pre_ping': pre_ping,
+            }
+        self.engine = create_async_engine(parsed.set(drivername=driver), **options)
+
+    async def get(self, req_id):
+        async with AsyncSession(self.engine) as session:
+            entry = await session.get(ExpressionResult, req_id)
+            return SQLAlchemyStore._row(entry) if entry else None
+
+    async def history(self, limit, before=None, since=None, until=None, prefix=None):
+        async with AsyncSession(self.engine) as session:
+            entries = (await session.scalars(history_statement(limit, before, since, until, prefix))).all()
+            return [SQLAlchemyStore._row(entry) for entry in entries]
+
+    async def close(self):
+        await self.engine.dispose()
+
+class MemoryStore(ResultStore):
+    """
+    In-process result store: a dict by request ID plus a sorted (timestamp, id) index.
+
+    Results do not survive a restart; intended for tests and single-process edge deployments.
+    """
+    def __init__(self):
+        self._rows = {}
+        self._keys = []
+        self._lock = threading.Lock()
+
+    def write_many(self, rows):
+        with self._lock:
+            for row in rows:
+                row = dict(row, error=row.get('error'), timestamp=to_utc_naive(row['timestamp']))
+                previous = self._rows.get(row['id'])
+                if previous:
+                    key = (previous['timestamp'], previous['id'])
+                    del self._keys[bisect_left(self._keys, key)]
+                self._rows[row['id']] = row
+                insort(self._keys, (row['timestamp'], row['id']))
+
+    def get(self, req_id):
+        row = self._rows.get(req_id)
+        return dict(row) if row else None
+
+    def history(self, limit, before=None, since=None, until=None, prefix=None):
+        rows = []
+        with self._lock:
+            end = len(self._keys)
+            if until:
+                end = bisect_left(self._keys, (until,))
+            if before:
+                end = min(end, bisect_left(self._keys, before))
+            start = bisect_left(self._keys, (since,)) if since else 0
+            for index in range(end - 1, start - 1, -1):
+                row = self._rows[self._keys[index][1]]
+                if row.get('error') is not None:
+                    continue
+                if prefix and not (row['expression'] or '').startswith(prefix):
+                    continue
+                rows.append(dict(row))
+                if len(rows) >= limit:
+                    break
+        return rows
+
+    def oldest(self, cutoff, limit):
+        with self._lock:
+            end = bisect_left(self._keys, (cutoff,))
+            return [dict(self._rows[req_id]) for _, req_id in self._keys[:min(end, limit)]]
+
+    def delete(self, req_ids):
+        with self._lock:
+            for req_id in req_ids:
+                row = self._rows.pop(req_id, None)
+                if row:
+                    del self._keys[bisect_left(self._keys, (row['timestamp'], row['id']))]
+
+class SQLiteStore(ResultStore):
+    """
+    Embedded result store in a local SQLite file in WAL mode.
+
+    WAL lets readers proceed while the result writer commits, and
+    synchronous=NORMAL avoids an fsync per commit.
+    """
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS expression_result ("
+        " id TEXT PRIMARY KEY, expression TEXT, result TEXT, error TEXT, timestamp TEXT NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS ix_expression_result_timestamp_id ON expression_result (timestamp, id)",
+        "CREATE INDEX IF NOT EXISTS ix_expression_result_expression ON expression_result (expression)",
+    )
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): Path of the SQLite database file.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        for statement in self.SCHEMA:
+            self._conn.execute(statement)
+        # Files created before errors were stored lack the error column
+        columns = [column[1] for column in self._conn.execute("PRAGMA table_info(expression_result)")]
+        if 'error' not in columns:
+            self._conn.execute("ALTER TABLE expression_result ADD COLUMN error TEXT")
+        self._conn.commit()
+
+    # Timestamps are stored as fixed-width ISO strings so text order is time order
+    @staticmethod
+    def _format(timestamp):
+        return to_utc_naive(timestamp).isoformat(sep=' ', timespec='microseconds')
+
+    # Columns read into row dicts, in _row() order
+    COLUMNS = "id, expression, result, error, timestamp"
+
+    @staticmethod
+    def _row(record):
+        req_id, expression, result, error, timestamp = record
+        return {
+            'id': req_id, 'expression': expression, 'result': result, 'error': error,
+            'timestamp': datetime.fromisoformat(timestamp),
+        }
+
+    def write_many(self, rows):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO expression_result (id, expression, result, error, timestamp) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (id) DO UPDATE SET expression = excluded.expression, "
+                "result = excluded.result, error = excluded.error, timestamp = excluded.timestamp",
+                [(r['id'], r['expression'], r['result'], r.get('error'), self._format(r['timestamp'])) for r in rows],
+            )
+
+    def get(self, req_id):
+        with self._lock:
+            record = self._conn.execute(
+                f"SELECT {self.COLUMNS} FROM expression_result WHERE id = ?", (req_id,)
+            ).fetchone()
+        return self._row(record) if record else None
+
+    def existing(self, req_ids):
+        req_ids = list(req_ids)
+        if not req_ids:
+            return []
+        with self._lock:
+            records = self._conn.execute(
+                f"SELECT id FROM expression_result WHERE id IN ({', '.join('?' * len(req_ids))})", req_ids
+            ).fetchall()
+        return [req_id for req_id, in records]
+
+    def history(self, limit, before=None, since=None, until=None, prefix=None):
+        clauses = ["error IS NULL"]
+        params = []
+        if before:
+            clauses.append("(timestamp, id) < (?, ?)")
+            params += [self._format(before[0]), before[1]]
+        if since:
+            clauses.append("timestamp >= ?")
+            params.append(self._format(since))
+        if until:
+            clauses.append("timestamp < ?")
+            params.append(self._format(until))
+        if prefix:
+            escaped = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            clauses.append("expression LIKE ? ESCAPE '\\'")
+            params.append(escaped + '%')
+        where = f"WHERE {' AND '.join(clauses)} "
+        with self._lock:
+            records = self._conn.execute(
+                f"SELECT {self.COLUMNS} FROM expression_result {where}"
+                "ORDER BY timestamp DESC, id DESC LIMIT ?",
+                params + [limit],
+            ).fetchall()
+        return [self._row(record) for record in records]
+
+    def oldest(self, cutoff, limit):
+        with self._lock:
+            records = self._conn.execute(
+                f"SELECT {self.COLUMNS} FROM expression_result "
+                "WHERE timestamp < ? ORDER BY timestamp, id LIMIT ?",
+                (self._format(cutoff), limit),
+            ).fetchall()
+        return [self._row(record) for record in records]
+
+    def delete(self, req_ids):
+        req_ids = list(req_ids)
+        if not req_ids:
+            return
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"DELETE FROM expression_result WHERE id IN ({', '.join('?' * len(req_ids))})", req_ids
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def create_store(kind='sqlalchemy', path='results.db', writer_pool=None):
+    """
+    Create a result store by name.
+
+    Args:
+        kind (str): 'sqlalchemy' (the application database), 'memory' or 'sqlite'.
+        path (str): Database file of the 'sqlite' store.
+        writer_pool (dict): Writer pool options of the 'sqlalchemy' store.
+
+    Returns:
+        ResultStore: The store.
+
+    Raises:
+        ValueError: If the store kind is unknown.
+    """
+    if kind == 'sqlalchemy':
+        return SQLAlchemyStore(writer_pool)
+    if kind == 'memory':
+        return MemoryStore()
+    if kind == 'sqlite':
+        return SQLiteStore(path)
+    raise ValueError(f"Unknown result store: {kind}")
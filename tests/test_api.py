@@ -1,7 +1,29 @@
+import gzip
+import json
+import os
 import pytest
+import queue
+import sqlite3
+import threading
 import time
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+from utils.executor import EvaluationLimitError, create_evaluator
+from utils.parser import parser, variable_parser
 from utils.stream import Stream
+from utils.writer import BatchWriter
 from app import app, db
+from models import ExpressionResult
+from routes import PROCESSING, result_cache, result_memo, write_results
+from utils.cache import LRUCache
+from utils.memo import ResultMemo
+from utils.notify import CompletionNotifier, CompletionPoller
+from utils.ratelimit import TokenBucketLimiter
+from utils.metrics import Registry
+from utils.archive import ResultArchive
+import utils.archive as archive_module
+from retention import RetentionManager
+import routes
 
 @pytest.fixture(scope="session", autouse=True)
 def setup_db():
@@ -139,8 +161,8 @@ def test_parser_unary_minus(client):
 
 def test_parser_division_by_zero(client):
     response = client.post('/evaluation/expression', json={'expression': '2/0'})
-    assert response.status_code == 400
-    data = response.get_json()
+    assert response.status_code == 200
+    data = wait_for_result(client, response.get_json()['request_id'])
     assert 'error' in data
     assert 'division' in data['error'].lower() or 'zero' in data['error'].lower()
 
@@ -149,6 +171,8 @@ def test_invalid_expression(client):
     assert response.status_code == 400
     data = response.get_json()
     assert 'error' in data
+    response = client.post('/evaluation/variable', json={'expression': '(x + 1', 'value': 1})
+    assert response.get_json()['error'] == 'Unbalanced parenthesis at position 1.'
 
 # Variable expression tests
 def test_evaluate_variable_and_result(client):
@@ -199,6 +223,18 @@ def test_variable_parser_invalid_characters(client):
     data = response.get_json()
     assert 'error' in data
 
+def test_non_finite_values_are_rejected(client):
+    for mode in ('float', 'exact', 'decimal'):
+        for value in ('nan', 'inf', '-Infinity'):
+            response = client.post('/evaluation/variable', json={'expression': 'x+1', 'value': value, 'mode': mode})
+            assert response.status_code == 400
+            assert response.get_json()['error'] == f'Invalid variable value: {value}'
+        response = client.post('/evaluation/tabulate', json={'expression': 'x+1', 'values': [1, 'nan'], 'mode': mode})
+        assert response.status_code == 400
+    # Finite in the exact and decimal modes, but an overflow to infinity as a float
+    response = client.post('/evaluation/variable', json={'expression': 'x+1', 'value': '1e400', 'mode': 'float'})
+    assert response.status_code == 400
+
 # Result endpoint status test
 def test_result_processing_status(client):
     response = client.post('/evaluation/expression', json={'expression': '2+2'})
@@ -253,4 +289,678 @@ def test_stream_stop():
     s = Stream()
     s.forEach(lambda x: None)
     s.stop()
-    assert s.stop_flag is True
\ No newline at end of file
+    assert s.stop_flag is True
+
+def test_stream_backpressure_rejects_when_full():
+    s = Stream(maxsize=1)
+    s.add(1)
+    with pytest.raises(queue.Full):
+        s.add(2, block=False)
+    with pytest.raises(queue.Full):
+        s.add(3, timeout=0.01)
+    s.stop(drain=False)
+
+def test_stream_multiple_workers():
+    results = []
+    s = Stream(workers=4)
+    s.forEach(lambda x: results.append(x))
+    for i in range(100):
+        s.add(i)
+    s.stop()
+    assert sorted(results) == list(range(100))
+    assert all(not t.is_alive() for t in s.threads)
+
+def test_stream_stop_drains_pending_items():
+    results = []
+    s = Stream()
+    for i in range(5):
+        s.add(i)
+    s.forEach(lambda x: (time.sleep(0.01), results.append(x)))
+    s.stop()
+    assert results == [0, 1, 2, 3, 4]
+    with pytest.raises(RuntimeError):
+        s.add(5)
+
+def test_fair_stream_round_robin_across_clients():
+    results = []
+    s = Stream(fair=True)
+    for i in range(3):
+        s.add({'client': 'noisy', 'n': i})
+    s.add({'client': 'quiet', 'n': 0})
+    s.add({'client': 'other', 'n': 0})
+    s.forEach(lambda x: results.append((x['client'], x['n'])))
+    s.stop()
+    assert results == [('noisy', 0), ('quiet', 0), ('other', 0), ('noisy', 1), ('noisy', 2)]
+
+def test_stream_priority_lanes_with_aging():
+    results = []
+    s = Stream(lanes=('high', 'normal', 'low'), aging=0.05)
+    s.add({'priority': 'low', 'n': 'old-low'})
+    time.sleep(0.12)
+    s.add({'priority': 'low', 'n': 'new-low'})
+    s.add({'priority': 'normal', 'n': 'normal'})
+    s.add({'priority': 'high', 'n': 'high'})
+    s.forEach(lambda x: results.append(x['n']))
+    s.stop()
+    # The old low-priority item has aged past both lanes; the fresh one has not
+    assert results == ['old-low', 'high', 'normal', 'new-low']
+    stats = s.lane_stats()
+    assert stats['low']['served'] == 2 and stats['low']['max_wait_seconds'] >= 0.1
+    assert stats['high']['depth'] == 0
+
+def test_process_evaluator_returns_result():
+    evaluator = create_evaluator('process', processes=1)
+    try:
+        assert evaluator.run(parser, '2^5+1') == 33
+        assert evaluator.run(variable_parser, 'x*2', 5) == 10
+    finally:
+        evaluator.shutdown()
+
+def test_process_evaluator_kills_runaway_evaluation():
+    evaluator = create_evaluator('process', processes=1, cpu_limit=1)
+    try:
+        with pytest.raises(EvaluationLimitError):
+            evaluator.run(pow, 9, 9 ** 10)
+        # The pool is rebuilt and keeps serving requests
+        assert evaluator.run(parser, '2+3') == 5
+    finally:
+        evaluator.shutdown()
+
+def test_process_evaluator_retries_tasks_queued_behind_a_runaway():
+    evaluator = create_evaluator('process', processes=1, cpu_limit=1)
+    try:
+        with ThreadPoolExecutor(max_workers=2) as threads:
+            runaway = threads.submit(evaluator.run, pow, 9, 9 ** 10)
+            time.sleep(0.2)
+            queued = threads.submit(evaluator.run, parser, '2+3')
+            # Only the task that broke the pool fails; the queued one runs on the new pool
+            with pytest.raises(EvaluationLimitError):
+                runaway.result()
+            assert queued.result() == 5
+    finally:
+        evaluator.shutdown()
+
+def test_unknown_evaluator():
+    with pytest.raises(ValueError):
+        create_evaluator('gpu')
+
+# Tabulation endpoint tests
+def test_tabulate_expression(client):
+    response = client.post('/evaluation/tabulate', json={'expression': 'x^2 + 2*x + 1', 'values': [0, 1, 2, 3]})
+    assert response.status_code == 200
+    assert response.get_json()['results'] == [1, 4, 9, 16]
+
+def test_tabulate_invalid_values(client):
+    response = client.post('/evaluation/tabulate', json={'expression': 'x*2', 'values': 5})
+    assert response.status_code == 400
+    response = client.post('/evaluation/tabulate', json={'expression': 'x*2', 'values': ['a']})
+    assert response.status_code == 400
+
+def test_tabulate_invalid_requests(client):
+    response = client.post('/evaluation/tabulate', json=[{'expression': 'x*2', 'values': [1]}])
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Request body must be a JSON object.'
+    response = client.post('/evaluation/tabulate', json={'expression': '(x*2', 'values': [1]})
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Unbalanced parenthesis at position 1.'
+    response = client.post('/evaluation/tabulate', json={'expression': 'x*-2', 'values': [1]})
+    assert response.status_code == 400
+
+def test_tabulate_budgets_steps_across_values(client):
+    # About 2000 steps per value: within the per-value budget, not for 10000 values
+    expression = '+'.join(['x'] * 2000)
+    response = client.post('/evaluation/tabulate', json={'expression': expression, 'values': [1] * 10})
+    assert response.status_code == 200
+    response = client.post('/evaluation/tabulate', json={'expression': expression, 'values': [1] * 10000})
+    assert response.status_code == 400
+    assert 'Tabulation is too long' in response.get_json()['error']
+
+# Batch endpoint tests
+def wait_for_result(client, req_id):
+    result_resp = client.get(f'/evaluation/result/{req_id}?wait=5s')
+    assert result_resp.status_code == 200, f"No result for {req_id}"
+    return result_resp.get_json()
+
+def test_batch_submission(client):
+    response = client.post('/evaluation/batch', json={'expressions': [
+        {'expression': '2+2'},
+        {'expression': 'x*3', 'value': 4},
+        {'expression': '(1+2)^2'},
+    ]})
+    assert response.status_code == 200
+    req_ids = response.get_json()['request_ids']
+    assert len(req_ids) == 3
+    results = [wait_for_result(client, req_id)['result'] for req_id in req_ids]
+    assert results == ['4', '12', '9']
+
+def test_batch_rejects_invalid_entries(client):
+    response = client.post('/evaluation/batch', json={'expressions': [
+        {'expression': '2+2'},
+        {'expression': '2++2'},
+        {'expression': 'x*2', 'value': 'abc'},
+    ]})
+    assert response.status_code == 400
+    data = response.get_json()
+    assert [e['index'] for e in data['errors']] == [1, 2]
+
+def test_batch_requires_list(client):
+    response = client.post('/evaluation/batch', json={'expressions': []})
+    assert response.status_code == 400
+
+def test_batch_requires_json_object(client):
+    for body in ([{'expression': '2+2'}], '2+2', 7):
+        response = client.post('/evaluation/batch', json=body)
+        assert response.status_code == 400
+        assert response.get_json()['error'] == 'Request body must be a JSON object.'
+
+# Result writer tests
+def test_writer_flushes_full_batch():
+    batches = []
+    writer = BatchWriter(max_batch=3, max_delay=10)
+    writer.forEach(lambda rows: batches.append(rows))
+    writer.add([1, 2])
+    writer.add([3, 4])
+    time.sleep(0.1)
+    assert batches == [[1, 2, 3]]
+    writer.stop()
+    assert batches == [[1, 2, 3], [4]]
+
+def test_writer_flushes_after_delay():
+    batches = []
+    writer = BatchWriter(max_batch=100, max_delay=0.02)
+    writer.forEach(lambda rows: batches.append(rows))
+    writer.add([1])
+    time.sleep(0.2)
+    assert batches == [[1]]
+    stats = writer.stats()
+    assert stats['batches'] == 1 and stats['avg_batch_size'] == 1
+    writer.stop()
+
+def test_write_results_upserts(client):
+    row = {'id': 'upsert-test', 'expression': '1+1', 'result': '2', 'timestamp': datetime.now(timezone.utc)}
+    write_results([row])
+    write_results([dict(row, result='3')])
+    with app.app_context():
+        assert db.session.get(ExpressionResult, 'upsert-test').result == '3'
+
+def test_pipeline_health(client):
+    response = client.get('/health/pipeline')
+    assert response.status_code == 200
+    data = response.get_json()
+    assert 'queue_depth' in data and 'batches' in data['writer']
+    assert 'db_pool' in data
+
+# Metrics tests
+def test_metrics_registry_renders_prometheus_text():
+    registry = Registry()
+    errors = registry.counter('errors_total', 'Errors', ('type',))
+    errors.labels('ValueError').inc()
+    errors.labels('ValueError').inc()
+    latency = registry.histogram('latency_seconds', 'Latency', buckets=(0.1, 1.0))
+    latency.observe(0.05)
+    latency.observe(0.5)
+    registry.gauge('depth', 'Depth', callback=lambda: 3)
+    assert registry.counter('errors_total', 'Errors', ('type',)) is errors
+    text = registry.render()
+    assert '# TYPE errors_total counter' in text
+    assert 'errors_total{type="ValueError"} 2.0' in text
+    assert 'latency_seconds_bucket{le="0.1"} 1.0' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 2.0' in text
+    assert 'latency_seconds_count 2.0' in text
+    assert 'depth 3.0' in text
+    with pytest.raises(ValueError):
+        errors.labels()
+
+def test_metrics_endpoint(client):
+    response = client.post('/evaluation/expression', json={'expression': '2*21'})
+    assert wait_for_result(client, response.get_json()['request_id'])['result'] == '42'
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    text = response.get_data(as_text=True)
+    for name in ('queue_depth', 'job_latency_seconds_bucket', 'expression_parse_seconds_count',
+                 'expression_evaluate_seconds_count', 'result_commit_seconds_count', 'stream_items_total'):
+        assert name in text
+    assert 'http_requests_total{endpoint="/evaluation/expression",method="POST",status="200"}' in text
+
+# Result delivery tests
+def test_result_long_poll(client):
+    response = client.post('/evaluation/expression', json={'expression': '6*7'})
+    req_id = response.get_json()['request_id']
+    result_resp = client.get(f'/evaluation/result/{req_id}?wait=5s')
+    assert result_resp.status_code == 200
+    assert result_resp.get_json()['result'] == '42'
+
+def test_result_long_poll_times_out(client):
+    start = time.monotonic()
+    result_resp = client.get('/evaluation/result/unknown-id?wait=100ms')
+    assert result_resp.status_code == 202
+    assert time.monotonic() - start >= 0.1
+
+def test_result_long_poll_invalid_wait(client):
+    result_resp = client.get('/evaluation/result/unknown-id?wait=soon')
+    assert result_resp.status_code == 400
+
+def test_result_event_stream(client):
+    req_ids = [
+        client.post('/evaluation/expression', json={'expression': expr}).get_json()['request_id']
+        for expr in ('1+1', '2*3')
+    ]
+    response = client.get(f'/evaluation/results/stream?ids={",".join(req_ids)},missing&timeout=1s')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    events = [block.split('\n') for block in response.get_data(as_text=True).strip().split('\n\n')]
+    results = {}
+    for name, data in events[:-1]:
+        assert name == 'event: result'
+        payload = json.loads(data[len('data: '):])
+        results[payload['request_id']] = payload['result']
+    assert results == {req_ids[0]: '2', req_ids[1]: '6'}
+    assert events[-1][0] == 'event: end'
+    assert json.loads(events[-1][1][len('data: '):]) == {'pending': ['missing']}
+
+# Result cache tests
+def test_lru_cache_evicts_and_counts():
+    cache = LRUCache(maxsize=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+    assert cache.get('b') is None
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'size': 2, 'maxsize': 2}
+
+def test_lru_cache_ttl():
+    cache = LRUCache(maxsize=2, ttl=0.01)
+    cache.put('a', 1)
+    time.sleep(0.02)
+    assert cache.get('a') is None
+
+def test_result_served_from_cache(client):
+    response = client.post('/evaluation/expression', json={'expression': '3*3'})
+    req_id = response.get_json()['request_id']
+    wait_for_result(client, req_id)
+    hits = result_cache.hits
+    assert client.get(f'/evaluation/result/{req_id}').get_json()['result'] == '9'
+    assert result_cache.hits == hits + 1
+
+def test_in_flight_request_answers_processing_from_cache(client):
+    result_cache.put('in-flight-id', PROCESSING)
+    response = client.get('/evaluation/result/in-flight-id')
+    assert response.status_code == 202
+    result_cache.pop('in-flight-id')
+
+def test_evaluation_error_is_reported(client):
+    response = client.post('/evaluation/variable', json={'expression': '1/x', 'value': 0})
+    req_id = response.get_json()['request_id']
+    data = wait_for_result(client, req_id)
+    assert 'zero' in data['error'].lower()
+
+# Result memo tests
+def test_memo_claims_and_coalesces():
+    memo = ResultMemo(maxsize=10)
+    assert memo.claim('1+1', 'a') == (ResultMemo.LEADER, None)
+    assert memo.claim('1+1', 'b') == (ResultMemo.FOLLOWER, None)
+    assert memo.complete('1+1', '2') == ['b']
+    assert memo.claim('1+1', 'c') == (ResultMemo.HIT, '2')
+    assert memo.stats()['coalesced'] == 1
+
+def test_memo_without_coalescing():
+    memo = ResultMemo(maxsize=10)
+    assert memo.claim('1+1', 'a', coalesce=False) == (ResultMemo.LEADER, None)
+    assert memo.claim('1+1', 'b', coalesce=False) == (ResultMemo.LEADER, None)
+    assert memo.stats()['in_flight'] == 0
+    memo.complete('1+1', '2')
+    assert memo.claim('1+1', 'c', coalesce=False) == (ResultMemo.HIT, '2')
+
+def test_memo_failure_releases_followers():
+    memo = ResultMemo(maxsize=10)
+    memo.claim('1/0', 'a')
+    memo.claim('1/0', 'b')
+    assert memo.fail('1/0') == ['b']
+    assert memo.claim('1/0', 'c') == (ResultMemo.LEADER, None)
+
+def test_memo_coalesces_on_equal_terms_only():
+    memo = ResultMemo(maxsize=10)
+    assert memo.claim('1+1', 'a', terms=('low', 1.0)) == (ResultMemo.LEADER, None)
+    assert memo.claim('1+1', 'b', terms=('high', None)) == (ResultMemo.LEADER, None)
+    assert memo.claim('1+1', 'c', terms=('high', None)) == (ResultMemo.FOLLOWER, None)
+    # An expired leader fails only its own followers
+    assert memo.fail('1+1', ('low', 1.0)) == []
+    assert memo.complete('1+1', '2') == ['c']
+    assert memo.stats()['in_flight'] == 0
+
+def test_memo_disabled():
+    memo = ResultMemo(maxsize=0)
+    memo.claim('1+1', 'a')
+    memo.complete('1+1', '2')
+    assert memo.claim('1+1', 'b') == (ResultMemo.LEADER, None)
+
+def test_repeated_expression_is_memoized(client):
+    first = client.post('/evaluation/expression', json={'expression': '12345*6789'}).get_json()['request_id']
+    assert wait_for_result(client, first)['result'] == str(12345 * 6789)
+    hits = result_memo.results.hits
+    second = client.post('/evaluation/expression', json={'expression': ' 12345 * 6789 '}).get_json()['request_id']
+    assert second != first
+    assert result_memo.results.hits == hits + 1
+    assert wait_for_result(client, second)['result'] == str(12345 * 6789)
+
+def test_variable_memo_key_includes_value(client):
+    response = client.post('/evaluation/batch', json={'expressions': [
+        {'expression': 'x*7', 'value': 2},
+        {'expression': 'x*7', 'value': 2},
+        {'expression': 'x*7', 'value': 3},
+    ]})
+    req_ids = response.get_json()['request_ids']
+    assert [wait_for_result(client, req_id)['result'] for req_id in req_ids] == ['14', '14', '21']
+
+# Numeric mode tests
+def test_numeric_modes(client):
+    cases = [('float', '0.1+0.2', '0.30000000000000004'), ('exact', '0.1+0.2', '3/10'), ('decimal', '1/4', '0.25')]
+    for mode, expression, expected in cases:
+        response = client.post('/evaluation/expression', json={'expression': expression, 'mode': mode})
+        assert response.status_code == 200
+        assert wait_for_result(client, response.get_json()['request_id'])['result'] == expected
+    response = client.post('/evaluation/variable', json={'expression': 'x/3', 'value': '0.3', 'mode': 'exact'})
+    assert wait_for_result(client, response.get_json()['request_id'])['result'] == '1/10'
+
+def test_numeric_mode_validation(client):
+    response = client.post('/evaluation/expression', json={'expression': '1+1', 'mode': 'complex'})
+    assert response.status_code == 400
+    response = client.post('/evaluation/expression', json={'expression': '2^0.5', 'mode': 'exact'})
+    assert response.status_code == 200
+    assert 'error' in wait_for_result(client, response.get_json()['request_id'])
+    response = client.post('/evaluation/expression', json={'expression': '10^(10^10)', 'mode': 'exact'})
+    assert response.status_code == 400
+    assert 'maximum size' in response.get_json()['error']
+
+def test_over_budget_submissions_are_rejected(client):
+    start = time.perf_counter()
+    response = client.post('/evaluation/expression', json={'expression': '9^9^9^9'})
+    assert response.status_code == 400
+    assert 'too costly' in response.get_json()['error']
+    response = client.post('/evaluation/variable', json={'expression': 'x^x', 'value': 100000})
+    assert response.status_code == 400
+    response = client.post('/evaluation/tabulate', json={'expression': 'x^5000', 'values': [1, 1024]})
+    assert response.status_code == 400
+    assert time.perf_counter() - start < 1
+
+def test_memo_key_includes_mode():
+    assert routes.memo_key({'expression': '1/3', 'mode': 'exact'}) != routes.memo_key({'expression': '1/3', 'mode': 'float'})
+    assert routes.memo_key({'expression': 'x', 'value': '0.10', 'mode': 'exact'}) == \
+        routes.memo_key({'expression': 'x', 'value': 0.1, 'mode': 'exact'})
+
+def test_tabulate_exact_mode(client):
+    response = client.post('/evaluation/tabulate', json={'expression': '1/x', 'values': [3, 0], 'mode': 'exact'})
+    assert response.get_json() == {'results': ['1/3', None]}
+
+# History endpoint tests
+def test_history_keyset_pagination(client):
+    base = datetime(2020, 1, 1)
+    rows = [
+        {'id': f'page-{i:02d}', 'expression': f'{i}+0', 'result': str(i), 'timestamp': base + timedelta(seconds=i // 2)}
+        for i in range(7)
+    ]
+    write_results(rows)
+    until = (base + timedelta(days=1)).isoformat()
+    seen = []
+    cursor = None
+    while True:
+        query = f'/evaluation/history?limit=3&since={base.isoformat()}&until={until}'
+        query += f'&cursor={cursor}' if cursor else ''
+        data = client.get(query).get_json()
+        seen.extend(item['id'] for item in data['history'])
+        cursor = data['next_cursor']
+        if not cursor:
+            break
+    assert seen == [f'page-{i:02d}' for i in reversed(range(7))]
+
+def test_history_filters(client):
+    base = datetime(2019, 6, 1)
+    write_results([
+        {'id': 'filter-a', 'expression': '77*1', 'result': '77', 'timestamp': base},
+        {'id': 'filter-b', 'expression': '77*2', 'result': '154', 'timestamp': base + timedelta(hours=1)},
+        {'id': 'filter-c', 'expression': '78*2', 'result': '156', 'timestamp': base + timedelta(hours=2)},
+    ])
+    data = client.get('/evaluation/history?prefix=77*&since=2019-06-01T00:30:00').get_json()
+    assert [item['id'] for item in data['history']] == ['filter-b']
+
+def test_history_invalid_cursor(client):
+    assert client.get('/evaluation/history?cursor=nonsense').status_code == 400
+
+def test_history_invalid_parameters(client):
+    for query, error in [
+        ('limit=ten', 'Invalid limit: ten'),
+        ('limit=0', 'Limit must be positive.'),
+        ('cursor=bm90LWEtY3Vyc29y', 'Invalid cursor.'),
+        ('since=yesterday', 'Invalid timestamp: yesterday'),
+    ]:
+        response = client.get(f'/evaluation/history?{query}')
+        assert response.status_code == 400
+        assert response.get_json() == {'error': error}
+
+# Retention and archive tests
+def test_retention_archives_and_expires_old_rows(client, tmp_path):
+    old = datetime(2000, 1, 2, 12, 0)
+    write_results([
+        {'id': f'expired-{i}', 'expression': f'{i}*2', 'result': str(i * 2), 'timestamp': old}
+        for i in range(5)
+    ])
+    archive = ResultArchive(str(tmp_path))
+    retention = RetentionManager(routes.result_store, retention_days=365, batch_size=2, pause=0, archive=archive)
+    assert retention.run_once() >= 5
+    with app.app_context():
+        assert db.session.get(ExpressionResult, 'expired-3') is None
+    assert 'results-2000-01-02.jsonl.gz' in [os.path.basename(p) for p in archive.partitions()]
+    record = archive.get('expired-3')
+    assert record['result'] == '6' and record['timestamp'] == old
+
+def test_result_lookup_falls_back_to_archive(client, tmp_path, monkeypatch):
+    archive = ResultArchive(str(tmp_path))
+    archive.append([{'id': 'archived-id', 'expression': '5*5', 'result': '25', 'timestamp': datetime(2001, 1, 1)}])
+    monkeypatch.setattr(routes, 'result_archive', archive)
+    response = client.get('/evaluation/result/archived-id')
+    assert response.status_code == 200
+    assert response.get_json()['result'] == '25'
+
+def test_archive_lookups_read_one_block(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive_module, 'BLOCK_RECORDS', 100)
+    archive = ResultArchive(str(tmp_path))
+    archive.append([
+        {'id': f'rec-{i}', 'expression': f'{i}+0', 'result': str(i), 'timestamp': datetime(2001, 1, 1)}
+        for i in range(250)
+    ] + [{'id': 'day-2', 'expression': '2+2', 'result': '4', 'timestamp': datetime(2001, 1, 2)}])
+    read = []
+    monkeypatch.setattr(archive, '_read_block', lambda *block: read.append(block) or ResultArchive._read_block(archive, *block))
+    assert archive.get('never-archived') is None
+    assert read == []
+    assert archive.get('rec-150')['result'] == '150'
+    # Only the member holding the record is read, not the whole partition
+    [(path, offset, size)] = read
+    assert os.path.basename(path) == 'results-2001-01-01.jsonl.gz'
+    assert offset > 0 and size < os.path.getsize(path) / 2
+    archive.close()
+    # Partitions still read as a whole gzip file
+    with gzip.open(tmp_path / 'results-2001-01-01.jsonl.gz', 'rt') as f:
+        assert sum(1 for _ in f) == 250
+
+def test_archive_indexes_partitions_written_before_the_index(tmp_path):
+    # A partition appended to as one gzip stream per batch, and an index without record locations
+    with gzip.open(tmp_path / 'results-2001-01-03.jsonl.gz', 'at') as f:
+        f.write(json.dumps({'id': 'old-1', 'expression': '1', 'result': '1', 'timestamp': None}) + '\n')
+    with gzip.open(tmp_path / 'results-2001-01-03.jsonl.gz', 'at') as f:
+        for i in (2, 3):
+            f.write(json.dumps({'id': f'old-{i}', 'expression': str(i), 'result': str(i), 'timestamp': None}) + '\n')
+    conn = sqlite3.connect(tmp_path / 'index.db')
+    conn.execute("CREATE TABLE archived (id TEXT PRIMARY KEY, day TEXT NOT NULL)")
+    conn.execute("CREATE TABLE indexed_partition (day TEXT PRIMARY KEY)")
+    conn.execute("INSERT INTO indexed_partition VALUES ('2001-01-03')")
+    conn.commit()
+    conn.close()
+    archive = ResultArchive(str(tmp_path))
+    assert [archive.get(f'old-{i}')['result'] for i in (1, 2, 3)] == ['1', '2', '3']
+    assert archive.get('never-archived') is None
+    archive.close()
+
+# Separate worker process tests
+def test_one_poller_serves_every_waiting_client():
+    notifier = CompletionNotifier()
+    lookups = []
+    def lookup(req_ids):
+        lookups.append(len(req_ids))
+        return [req_id for req_id in req_ids if req_id == 'poll-3']
+    poller = CompletionPoller(notifier, lookup, batch_size=4)
+    watches = [notifier.watch([f'poll-{i}']) for i in range(6)]
+    for watch in watches:
+        watch.__enter__()
+    try:
+        poller.poll()
+        # Six waiting clients cost two batched lookups, and only the finished one is woken
+        assert lookups == [4, 2]
+        assert watches[3].wait(0) == ['poll-3']
+        assert watches[0].wait(0) == []
+    finally:
+        for watch in watches:
+            watch.__exit__(None, None, None)
+
+def test_remote_worker_results_polled_from_store(client, monkeypatch):
+    monkeypatch.setattr(routes, 'EMBEDDED_WORKER', False)
+    monkeypatch.setattr(routes.result_poller, 'interval', 0.05)
+    req_id = 'remote-worker-result'
+    result_cache.put(req_id, PROCESSING)
+    assert client.get(f'/evaluation/result/{req_id}').status_code == 202
+    # Simulate a worker process writing the result: no in-process notification
+    row = routes.result_row(req_id, '6*7', '42')
+    threading.Timer(0.2, routes.result_store.write_many, args=([row],)).start()
+    response = client.get(f'/evaluation/result/{req_id}?wait=5s')
+    assert response.status_code == 200
+    assert response.get_json()['result'] == '42'
+
+def test_remote_worker_errors_polled_from_store(client, monkeypatch):
+    monkeypatch.setattr(routes, 'EMBEDDED_WORKER', False)
+    monkeypatch.setattr(routes.result_poller, 'interval', 0.05)
+    req_id = 'remote-worker-error'
+    result_cache.put(req_id, PROCESSING)
+    row = routes.result_row(req_id, '1/0', None, 'division by zero')
+    threading.Timer(0.2, routes.result_store.write_many, args=([row],)).start()
+    response = client.get(f'/evaluation/result/{req_id}?wait=5s')
+    assert response.status_code == 200
+    assert response.get_json()['error'] == 'division by zero'
+    # Failed evaluations are not listed in the history
+    assert req_id not in [item['id'] for item in client.get('/evaluation/history?limit=100').get_json()['history']]
+
+def test_dropped_jobs_report_an_error(client):
+    routes.fail_dropped_item({'batch': [
+        {'request_id': 'dropped-1', 'expression': '1+1'},
+        {'request_id': 'dropped-2', 'expression': 'x', 'value': 1},
+    ]})
+    for req_id in ('dropped-1', 'dropped-2'):
+        assert routes.result_store.get(req_id)['error'] == routes.UNDELIVERABLE_ERROR
+        assert wait_for_result(client, req_id)['error'] == routes.UNDELIVERABLE_ERROR
+
+def test_remote_worker_submissions_bypass_memo(client, monkeypatch):
+    monkeypatch.setattr(routes, 'EMBEDDED_WORKER', False)
+    queued = []
+    monkeypatch.setattr(routes.expression_stream, 'add', lambda item, **kwargs: queued.append(item))
+    for _ in range(2):
+        assert client.post('/evaluation/expression', json={'expression': '77 + 1'}).status_code == 200
+    assert len(queued) == 2
+
+def test_shared_queue_with_embedded_worker(client, monkeypatch):
+    # Another process consuming the same database queue may evaluate this process's jobs
+    monkeypatch.setattr(routes, 'SHARED_QUEUE', True)
+    monkeypatch.setattr(routes.result_poller, 'interval', 0.05)
+    queued = []
+    monkeypatch.setattr(routes.expression_stream, 'add', lambda item, **kwargs: queued.append(item))
+    ids = [client.post('/evaluation/expression', json={'expression': '78 + 1'}).get_json()['request_id'] for _ in range(2)]
+    # Identical submissions are not coalesced onto a job this process may never see complete
+    assert len(queued) == 2
+    assert result_memo.stats()['in_flight'] == 0
+    # The cached 'processing' status gives way to the result written by the other process
+    row = routes.result_row(ids[0], '78 + 1', '79')
+    threading.Timer(0.2, routes.result_store.write_many, args=([row],)).start()
+    response = client.get(f'/evaluation/result/{ids[0]}?wait=5s')
+    assert response.get_json()['result'] == '79'
+
+def test_coalescing_keeps_each_requests_lane_and_deadline(client, monkeypatch):
+    queued = []
+    monkeypatch.setattr(routes.expression_stream, 'add', lambda item, **kwargs: queued.append(item))
+    low = client.post('/evaluation/expression', json={'expression': '80 + 1', 'priority': 'low', 'deadline': '100ms'})
+    high = client.post('/evaluation/expression', json={'expression': '80 + 1', 'priority': 'high'})
+    # The urgent request without a deadline does not follow the low-lane job that expires
+    assert [item['priority'] for item in queued] == ['low', 'high']
+    time.sleep(0.15)
+    for item in queued:
+        routes.process_expression(item, app)
+    assert wait_for_result(client, low.get_json()['request_id'])['error'] == 'Deadline expired before evaluation.'
+    assert wait_for_result(client, high.get_json()['request_id'])['result'] == '81'
+
+# Admission control tests
+def test_token_bucket_limiter():
+    limiter = TokenBucketLimiter(rate=10, burst=2)
+    assert limiter.acquire('a') == 0 and limiter.acquire('a') == 0
+    wait = limiter.acquire('a')
+    assert 0 < wait <= 0.1
+    assert limiter.acquire('b') == 0
+    assert limiter.acquire('a', cost=3) == float('inf')
+    assert TokenBucketLimiter(rate=0, burst=1).acquire('a', cost=100) == 0
+    assert limiter.stats()['limited'] == 2
+
+def test_rate_limited_submission(client, monkeypatch):
+    monkeypatch.setattr(routes, 'rate_limiter', TokenBucketLimiter(rate=0.5, burst=2))
+    monkeypatch.setattr(routes, 'API_KEYS', frozenset({'flooder', 'polite', 'big'}))
+    headers = {'X-API-Key': 'flooder'}
+    for _ in range(2):
+        assert client.post('/evaluation/expression', json={'expression': '1+2'}, headers=headers).status_code == 200
+    response = client.post('/evaluation/expression', json={'expression': '1+2'}, headers=headers)
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+    # Other clients keep their own budget
+    assert client.post('/evaluation/expression', json={'expression': '1+2'}, headers={'X-API-Key': 'polite'}).status_code == 200
+    batch = client.post('/evaluation/batch', json={'expressions': [{'expression': '1'}] * 3}, headers={'X-API-Key': 'big'})
+    assert batch.status_code == 400
+
+def test_unknown_api_keys_share_the_address_budget(client, monkeypatch):
+    monkeypatch.setattr(routes, 'rate_limiter', TokenBucketLimiter(rate=0.5, burst=2))
+    monkeypatch.setattr(routes, 'API_KEYS', frozenset({'known'}))
+    for key in ('made-up-1', 'made-up-2'):
+        assert client.post('/evaluation/expression', json={'expression': '1+2'}, headers={'X-API-Key': key}).status_code == 200
+    response = client.post('/evaluation/expression', json={'expression': '1+2'}, headers={'X-API-Key': 'made-up-3'})
+    assert response.status_code == 429
+    assert client.post('/evaluation/expression', json={'expression': '1+2'}, headers={'X-API-Key': 'known'}).status_code == 200
+
+def test_rate_limited_tabulation(client, monkeypatch):
+    monkeypatch.setattr(routes, 'rate_limiter', TokenBucketLimiter(rate=0.5, burst=2))
+    headers = {'X-API-Key': 'tabulator'}
+    # A tabulation costs one token per value
+    response = client.post('/evaluation/tabulate', json={'expression': 'x+1', 'values': [1, 2]}, headers=headers)
+    assert response.status_code == 200
+    response = client.post('/evaluation/tabulate', json={'expression': 'x+1', 'values': [1]}, headers=headers)
+    assert response.status_code == 429
+    response = client.post('/evaluation/tabulate', json={'expression': 'x+1', 'values': [1, 2, 3]}, headers={'X-API-Key': 'wide'})
+    assert response.status_code == 400
+
+def test_backlog_admission(client, monkeypatch):
+    monkeypatch.setattr(routes, 'ADMISSION_MAX_BACKLOG', 1)
+    monkeypatch.setattr(routes.expression_stream, 'size', lambda: 5)
+    response = client.post('/evaluation/variable', json={'expression': 'x+1', 'value': 1})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == str(routes.ADMISSION_RETRY_AFTER)
+
+# Priority and deadline tests
+def test_submission_priority_and_deadline_validation(client):
+    response = client.post('/evaluation/expression', json={'expression': '1+1', 'priority': 'urgent'})
+    assert response.status_code == 400
+    response = client.post('/evaluation/expression', json={'expression': '1+1', 'deadline': 'soon'})
+    assert response.status_code == 400
+    response = client.post('/evaluation/expression', json={'expression': '1+1', 'priority': 'high', 'deadline': '5s'})
+    assert response.status_code == 200
+    assert wait_for_result(client, response.get_json()['request_id'])['result'] == '2'
+
+def test_expired_job_not_evaluated(client):
+    expired_before = routes.jobs_expired.labels('high').value
+    job = {'request_id': 'expired-job', 'expression': '40+2', 'key': 'expired-key', 'deadline': time.time() - 1}
+    routes.process_expression(dict(job, priority='high'), app)
+    assert wait_for_result(client, 'expired-job')['error'] == 'Deadline expired before evaluation.'
+    assert routes.jobs_expired.labels('high').value == expired_before + 1
+    data = client.get('/health/pipeline').get_json()
+    assert set(data['lanes']) == {'high', 'normal', 'low'}
@@ -0,0 +1,49 @@
+import pytest
+from starlette.testclient import TestClient
+from asgi import app
+import routes
+
+@pytest.fixture
+def asgi_client():
+    with TestClient(app) as client:
+        yield client
+
+def test_asgi_submit_and_long_poll(asgi_client):
+    response = asgi_client.post('/evaluation/expression', json={'expression': '6 * 7 + 1'})
+    assert response.status_code == 200
+    req_id = response.json()['request_id']
+    result = asgi_client.get(f'/evaluation/result/{req_id}?wait=5s')
+    assert result.status_code == 200
+    assert result.json()['result'] == '43'
+
+def test_asgi_variable_expression(asgi_client):
+    response = asgi_client.post('/evaluation/variable', json={'expression': 'x*x', 'value': 12})
+    req_id = response.json()['request_id']
+    assert asgi_client.get(f'/evaluation/result/{req_id}?wait=5s').json()['result'] == '144'
+
+def test_asgi_validation_errors(asgi_client):
+    assert asgi_client.post('/evaluation/expression', json={'expression': '2++2'}).status_code == 400
+    assert asgi_client.post('/evaluation/expression', content=b'not json').status_code == 400
+    assert asgi_client.get('/evaluation/result/x?wait=soon').status_code == 400
+
+def test_asgi_pending_result(asgi_client):
+    response = asgi_client.get('/evaluation/result/unknown-request?wait=100ms')
+    assert response.status_code == 202
+    assert response.json()['status'] == 'processing'
+
+def test_asgi_history(asgi_client):
+    response = asgi_client.get('/evaluation/history?limit=2')
+    assert response.status_code == 200
+    assert 'history' in response.json() and 'next_cursor' in response.json()
+    assert asgi_client.get('/evaluation/history?cursor=bad').status_code == 400
+
+def test_asgi_mounts_flask_routes(asgi_client):
+    assert asgi_client.get('/health').json() == {'status': 'ok'}
+    assert asgi_client.get('/health/pipeline').status_code == 200
+
+def test_asgi_native_routes_are_counted(asgi_client):
+    counted = routes.http_requests.labels('/evaluation/result/<string:req_id>', 'GET', 202)
+    before = counted.value
+    asgi_client.get('/evaluation/result/unknown-request')
+    assert counted.value == before + 1
+    assert 'http_requests_total' in asgi_client.get('/metrics').text
@@ -0,0 +1,48 @@
+from benchmarks.bench_parser import nested_expression, sized_expression
+from benchmarks.regress import best, check, compare, normalize
+from utils.parser import parser
+
+def test_generated_expressions_evaluate():
+    assert parser(sized_expression(1)) == 1
+    assert sized_expression(5) == '1 * 2 - 3 / 4 + 5'
+    assert parser(sized_expression(5)) == 1 * 2 - 3 / 4 + 5
+    assert nested_expression(2) == '((1 + 1) * 2)'
+    assert sized_expression(3, 'x') == 'x * 2 - 3'
+    assert nested_expression(2, 'x') == '((x + 1) * 2)'
+
+def test_compare_flags_regressions_in_both_directions():
+    baseline = {'case': {'ops_per_second': 1000, 'p50_ms': 10, 'errors': 0}}
+    assert compare(baseline, {'case': {'ops_per_second': 800, 'p50_ms': 12, 'errors': 5}}, 0.3) == []
+    regressions = compare(baseline, {'case': {'ops_per_second': 500, 'p50_ms': 20}}, 0.3)
+    assert [metric for metric, *_ in regressions] == ['case.ops_per_second', 'case.p50_ms']
+    # Metrics missing from the current results or ignored are not compared
+    assert compare(baseline, {}, 0.3) == []
+    assert compare(baseline, {'case': {'ops_per_second': 500}}, 0.3, ignore=('case.ops_per_second',)) == []
+
+def test_normalize_and_best_favour_the_faster_run():
+    # A machine twice as slow as the baseline's: rates double, durations halve
+    assert normalize({'a': {'ops_per_second': 100, 'p50_ms': 10, 'errors': 1}}, 2.0) == {
+        'a.ops_per_second': 200, 'a.p50_ms': 5.0, 'a.errors': 1,
+    }
+    merged = best({'ops_per_second': 100, 'p50_ms': 10}, {'ops_per_second': 150, 'p50_ms': 12})
+    assert merged == {'ops_per_second': 150, 'p50_ms': 10}
+
+def test_compare_allows_percentiles_more_slack_and_ignores_tails():
+    baseline = {'case': {'p50_ms': 10, 'p99_ms': 20, 'compile_us': 10}}
+    assert compare(baseline, {'case': {'p50_ms': 19, 'p99_ms': 60, 'compile_us': 14}}, 0.5) == []
+    regressions = compare(baseline, {'case': {'p50_ms': 21, 'compile_us': 16}}, 0.5)
+    assert [metric for metric, *_ in regressions] == ['case.p50_ms', 'case.compile_us']
+
+def test_check_retries_and_requires_a_margin():
+    baseline = {'calibration_seconds': 1.0, 'results': {'case': {'ops_per_second': 1000}}}
+    def runs(*rates):
+        results = iter(rates)
+        return lambda: ({'case': {'ops_per_second': next(results)}}, 1.0)
+    # A noisy first run passes once a retry comes back clear of the tolerance
+    assert check(baseline, runs(400, 950), 0.5) == []
+    # A retry only just within the tolerance is not enough
+    assert [metric for metric, *_ in check(baseline, runs(400, 550, 580), 0.5)] == ['case.ops_per_second']
+    # A persistent regression fails after every attempt
+    assert len(check(baseline, runs(300, 300, 300), 0.5)) == 1
+    # A first run within the tolerance needs no margin
+    assert check(baseline, runs(550), 0.5) == []
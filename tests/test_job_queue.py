@@ -0,0 +1,125 @@
+import pytest
+import queue
+import threading
+import time
+from job_queue import DatabaseQueue, create_queue
+
+@pytest.fixture
+def url(tmp_path):
+    return f"sqlite:///{tmp_path / 'jobs.db'}"
+
+def make_queue(url, **kwargs):
+    kwargs.setdefault('poll_interval', 0.05)
+    return DatabaseQueue(url, **kwargs)
+
+def test_jobs_processed_and_acknowledged(url):
+    jobs = make_queue(url)
+    done = threading.Event()
+    seen = []
+
+    def process(item):
+        seen.append(item)
+        jobs.ack(DatabaseQueue.request_ids(item))
+        if len(seen) == 2:
+            done.set()
+
+    jobs.add({'request_id': 'a', 'expression': '1+1'})
+    jobs.add({'batch': [{'request_id': 'b', 'expression': '2'}, {'request_id': 'c', 'expression': '3'}]})
+    assert jobs.size() == 2
+    jobs.forEach(process)
+    assert done.wait(5)
+    jobs.stop()
+    assert seen[0]['request_id'] == 'a' and len(seen[1]['batch']) == 2
+    assert jobs.claim() == []
+
+def test_batch_deleted_after_every_request_acknowledged(url):
+    jobs = make_queue(url)
+    jobs.add({'batch': [{'request_id': 'b', 'expression': '2'}, {'request_id': 'c', 'expression': '3'}]})
+    [(job_id, item)] = jobs.claim()
+    jobs._track(job_id, item)
+    jobs.ack(['b'])
+    # A partially acknowledged job is redelivered once its lease expires
+    jobs.lease = jobs.lease * 0
+    assert [job_id for job_id, _ in jobs.claim()] == [job_id]
+    jobs.ack(['c'])
+    assert jobs.claim() == []
+    jobs.stop()
+
+def test_unacknowledged_jobs_replayed_after_restart(url):
+    first = make_queue(url, lease=0.2)
+    first.add({'request_id': 'r1', 'expression': '6*7'})
+    assert len(first.claim()) == 1
+    # The claiming process "crashes" without acknowledging the job
+    first.stop()
+    second = make_queue(url, lease=0.2)
+    assert second.claim() == []
+    replayed = threading.Event()
+    second.forEach(lambda item: replayed.set() if item['request_id'] == 'r1' else None)
+    assert replayed.wait(5)
+    second.stop()
+
+def test_full_database_queue(url):
+    jobs = make_queue(url, maxsize=1)
+    jobs.add({'request_id': 'x', 'expression': '1'})
+    with pytest.raises(queue.Full):
+        jobs.add({'request_id': 'y', 'expression': '2'}, timeout=0.1)
+    jobs.stop()
+    with pytest.raises(RuntimeError):
+        jobs.add({'request_id': 'z', 'expression': '3'})
+
+def test_queue_configuration_errors():
+    with pytest.raises(ValueError):
+        DatabaseQueue('sqlite://')
+    with pytest.raises(ValueError):
+        DatabaseQueue(None)
+    with pytest.raises(ValueError):
+        create_queue('kafka')
+
+def test_database_queue_claims_by_priority_lane(url):
+    jobs = make_queue(url, lanes=('high', 'normal', 'low'), aging=0)
+    jobs.add({'request_id': 'l', 'expression': '1', 'priority': 'low'})
+    jobs.add({'request_id': 'n', 'expression': '2'})
+    jobs.add({'request_id': 'h', 'expression': '3', 'priority': 'high'})
+    assert {lane: stats['depth'] for lane, stats in jobs.lane_stats().items()} == {'high': 1, 'normal': 1, 'low': 1}
+    assert [item['request_id'] for _ in range(3) for _, item in jobs.claim()] == ['h', 'n', 'l']
+    stats = jobs.lane_stats()
+    assert stats['low']['depth'] == 0 and stats['low']['served'] == 1
+    jobs.stop()
+
+def test_database_queue_ages_waiting_jobs(url):
+    jobs = make_queue(url, lanes=('high', 'normal', 'low'), aging=0.05)
+    jobs.add({'request_id': 'old-low', 'expression': '1', 'priority': 'low'})
+    time.sleep(0.2)
+    jobs.add({'request_id': 'new-high', 'expression': '2', 'priority': 'high'})
+    # Waiting four aging periods raised the low job above the new high one
+    assert [item['request_id'] for _, item in jobs.claim()] == ['old-low']
+    jobs.stop()
+
+def test_database_queue_serves_clients_round_robin(url):
+    jobs = make_queue(url, fair=True)
+    for i in range(3):
+        jobs.add({'request_id': f'a{i}', 'expression': '1', 'client': 'a'})
+    jobs.add({'request_id': 'b0', 'expression': '2', 'client': 'b'})
+    [(job_id, item)] = jobs.claim()
+    assert item['request_id'] == 'a0'
+    # A client arriving later joins the current round (b0 is still waiting in round 0)
+    jobs.add({'request_id': 'c0', 'expression': '3', 'client': 'c'})
+    jobs.add({'request_id': 'c1', 'expression': '3', 'client': 'c'})
+    order = [item['request_id'] for _ in range(6) for _, item in jobs.claim()]
+    assert order == ['b0', 'c0', 'a1', 'c1', 'a2']
+    jobs.stop()
+
+def test_undeliverable_jobs_recorded_before_deletion(url):
+    jobs = make_queue(url, lease=0, max_attempts=1)
+    dropped = []
+    jobs.add({'request_id': 'poison', 'expression': '1'})
+    assert len(jobs.claim()) == 1
+    # Recording the failure raises: the job is kept and dropped on a later claim
+    jobs.onDrop(lambda item: 1 / 0)
+    with pytest.raises(ZeroDivisionError):
+        jobs.claim()
+    jobs.onDrop(dropped.append)
+    assert jobs.claim() == []
+    assert [item['request_id'] for item in dropped] == ['poison']
+    assert jobs.size() == 0 and jobs.claim() == []
+    jobs.stop()
@@ -0,0 +1,259 @@
+import pytest
+import re
+import time
+import tracemalloc
+from decimal import Decimal
+from fractions import Fraction
+import utils.parser as parser_module
+from utils.parser import (
+    CostLimitError, Div, Neg, Num, Plus, Pow, batch_variable_parser, compile_expression, compile_submission,
+    compile_tokens, compile_variable_expression, estimate_cost, parser, tokenize, variable_parser,
+)
+
+# Compilation tests
+def test_compile_builds_expression_tree():
+    tree = compile_expression('1+2/3')
+    assert isinstance(tree, Plus)
+    assert isinstance(tree.left, Num)
+    assert isinstance(tree.right, Div)
+
+def test_compile_is_cached_by_normalized_expression():
+    assert compile_expression('7 *  (1+2)') is compile_expression(' 7 * (1+2) ')
+    assert compile_expression('2**3') is compile_expression('2^3')
+
+def test_power_is_right_associative():
+    tree = compile_expression('2^3^2')
+    assert isinstance(tree, Pow) and isinstance(tree.right, Pow)
+    assert parser('2^3^2') == 512
+
+def test_unary_minus_applies_to_whole_operand():
+    assert isinstance(compile_expression('-(2+3)'), Neg)
+    assert parser('-(2+3)') == -5
+    assert parser('-2^2') == -4
+
+@pytest.mark.parametrize('expr', ['2 3', '()', '2+', '(2', '2)', '2(3)'])
+def test_compile_rejects_malformed_expressions(expr):
+    with pytest.raises(ValueError):
+        compile_expression(expr)
+
+@pytest.mark.parametrize('expr, message', [
+    ('2 3', 'Missing operator before position 3.'),
+    ('(1+2', 'Unbalanced parenthesis at position 1.'),
+    ('1+2)', 'Unbalanced parenthesis at position 4.'),
+    ('1 + ()', 'Missing operand before position 6.'),
+    ('2 $ 3', "Unsafe character '$' at position 3."),
+    ('1.2.3', "Invalid number '1.2.3' at position 1."),
+])
+def test_tokenize_reports_error_positions(expr, message):
+    with pytest.raises(ValueError, match=re.escape(message)):
+        tokenize(expr)
+
+def test_tokenize_marks_unary_operators_and_implicit_multiplication():
+    assert tokenize('-2x^2 + x3', variable=True) == ['u-', 2, '*', 'x', '**', 2, '+', 'x', '*', 3]
+    assert compile_tokens(tokenize('1+2/3')) is compile_expression('1 + 2/3')
+    assert tokenize('2**3') == [2, '**', 3]
+    with pytest.raises(ValueError, match='Consecutive operators'):
+        tokenize('2**3', strict=True)
+    assert tokenize('2 * -3', strict=True) == [2, '*', 'u-', 3]
+
+def test_division_by_zero():
+    with pytest.raises(ZeroDivisionError):
+        parser('1/(2-2)')
+
+# Variable expression tests
+def test_variable_expression_is_compiled_once():
+    tree = compile_variable_expression('2x+1')
+    assert tree is compile_variable_expression(' 2x+1 ')
+    assert [tree.calc(x) for x in (0, 1, 2)] == [1, 3, 5]
+
+def test_variable_parser_negative_value():
+    assert variable_parser('2*x', -5) == -10
+
+def test_batch_variable_parser():
+    assert batch_variable_parser('x^2+1', [0, 1, 2, 3]) == [1, 2, 5, 10]
+    assert batch_variable_parser('2^10', [1, 2]) == [1024, 1024]
+
+def test_batch_variable_parser_marks_failed_values():
+    assert batch_variable_parser('1/x', [2, 0, 4]) == [0.5, None, 0.25]
+
+# Numeric mode tests
+def test_decimal_literals():
+    assert parser('1.5+1') == 2.5
+    assert parser('.5*4') == 2
+    with pytest.raises(ValueError):
+        parser('1.2.3')
+
+def test_exact_mode():
+    assert parser('1/3 + 1/6', 'exact') == Fraction(1, 2)
+    assert parser('0.1 + 0.2', 'exact') == Fraction(3, 10)
+    assert parser('6/3', 'exact') == 2 and isinstance(parser('6/3', 'exact'), int)
+    assert parser('4^0.5', 'exact') == 2
+    assert parser('(-8)^(1/3)', 'exact') == -2
+    assert parser('(4/9)^(-3/2)', 'exact') == Fraction(27, 8)
+    with pytest.raises(ArithmeticError):
+        parser('2^0.5', 'exact')
+    assert variable_parser('x/3', '0.3', 'exact') == Fraction(1, 10)
+
+def test_decimal_mode():
+    assert parser('0.1 + 0.2', 'decimal') == Decimal('0.3')
+    assert str(parser('1/3', 'decimal')) == '0.' + '3' * 28
+    assert parser('0^0', 'decimal') == Decimal(1) == parser('0^0', 'float') == parser('0^0', 'exact')
+    with pytest.raises(ZeroDivisionError):
+        parser('1/0', 'decimal')
+
+def test_modes_are_cached_separately():
+    assert compile_expression('1/3', 'exact') is not compile_expression('1/3', 'float')
+    assert compile_expression('1/3', 'exact') is compile_expression(' 1/3 ', 'exact')
+    with pytest.raises(ValueError):
+        compile_expression('1', 'complex')
+
+@pytest.mark.parametrize('mode', ['float', 'exact', 'decimal'])
+def test_huge_powers_are_rejected_before_computing(mode):
+    # The float and exact modes reject them statically, the decimal mode on overflow
+    with pytest.raises((OverflowError, CostLimitError)):
+        parser('10^(10^10)', mode)
+    with pytest.raises((OverflowError, CostLimitError)):
+        parser('9^9^9', mode)
+
+def test_float_mode_rejects_overflow_and_complex_results():
+    with pytest.raises(OverflowError):
+        parser('10.0^400')
+    with pytest.raises(OverflowError):
+        parser('10.0^300 * 10.0^300')
+    with pytest.raises(CostLimitError):
+        parser('2^9000 * 2^9000')
+    with pytest.raises(ArithmeticError):
+        parser('(-8)^(1/3)')
+
+def test_batch_variable_parser_in_exact_mode():
+    assert batch_variable_parser('1/x', [2, 0, '0.1'], 'exact') == ['1/2', None, '10']
+
+def test_estimate_cost_bounds_result_sizes():
+    steps, bits = estimate_cost(compile_expression('2^100 * 2^100'))
+    # The repeated power is one node: 2, 100, 2^100 and the product
+    assert steps == 4 and bits == pytest.approx(200)
+    # Sums grow by at most a bit, and long sums of small numbers stay small
+    assert estimate_cost(compile_expression('+'.join(['9'] * 1000)))[1] < 14
+    # Quotients are floats in the float mode, and only their powers' exponents count
+    assert estimate_cost(compile_expression('(1/3)^5000'))[1] < 14
+    assert estimate_cost(compile_expression('(1/3)^5000', 'exact'), 'exact')[1] > 5000
+    # Decimals have a fixed precision
+    assert estimate_cost(compile_expression('2^100000', 'decimal'), 'decimal')[1] == 0
+    # The largest value of 'x' determines the estimate
+    tree = compile_variable_expression('x^100')
+    assert estimate_cost(tree, 'float', [2, 2 ** 20])[1] == pytest.approx(2000)
+    assert estimate_cost(tree, 'float', [0.5])[1] < 7
+
+def test_over_budget_expressions_are_rejected_without_evaluating():
+    start = time.perf_counter()
+    with pytest.raises(CostLimitError) as error:
+        parser('9^9^9^9')
+    assert 'maximum size' in str(error.value)
+    with pytest.raises(ValueError):
+        variable_parser('x^5000', 2 ** 10)
+    with pytest.raises(ValueError):
+        batch_variable_parser('x^5000', [1, 2 ** 10])
+    assert time.perf_counter() - start < 1
+    assert batch_variable_parser('x^5000', [1, -1]) == [1, 1]
+
+def test_step_budget(monkeypatch):
+    monkeypatch.setattr(parser_module, 'MAX_EVALUATION_STEPS', 9)
+    assert parser('1+2+3+4+5') == 15
+    with pytest.raises(CostLimitError):
+        parser('1+2+3+4+5+6')
+
+def test_default_step_budget(monkeypatch):
+    assert parser_module.MAX_EVALUATION_STEPS == 100000
+    monkeypatch.setattr(parser_module, 'MAX_EXPRESSION_LENGTH', 10 ** 6)
+    # 60000 distinct numbers and 59999 additions
+    expression = '+'.join(str(i) for i in range(60000))
+    with pytest.raises(CostLimitError, match='above the limit of 100000'):
+        parser(expression)
+    assert parser('+'.join(str(i) for i in range(40000))) == sum(range(40000))
+
+def test_tabulate_step_budget(monkeypatch):
+    monkeypatch.setattr(parser_module, 'MAX_TABULATE_STEPS', 30)
+    # 'x+1' takes 3 steps per value
+    assert batch_variable_parser('x+1', list(range(10))) == list(range(1, 11))
+    with pytest.raises(ValueError, match='Tabulation is too long'):
+        batch_variable_parser('x+1', list(range(11)))
+
+def test_identical_subexpressions_are_shared_and_evaluated_once():
+    tree = compile_expression('(3^20+7)*(3^20+7)-(3^20+7)')
+    assert tree.left.left is tree.left.right is tree.right
+    assert len(tree.program().nodes) == 7
+    assert parser('(3^20+7)*(3^20+7)-(3^20+7)') == (3 ** 20 + 7) ** 2 - (3 ** 20 + 7)
+    # Equal decimals written differently stay distinct in the decimal mode
+    assert str(parser('1.0 + 1.00', 'decimal')) == '2.00'
+
+def test_constants_are_folded_once():
+    tree = compile_variable_expression('x * (2^10 + 1) + 3^3')
+    power = tree.left.right.left
+    calls = []
+    power.apply = lambda a, b: calls.append((a, b)) or a ** b
+    assert [tree.calc(x) for x in (1, 2)] == [1052, 2077]
+    assert tree.calc_batch([1, 2]) == [1052, 2077]
+    assert calls == [(2, 10)]
+    # Only the product and the sum are computed for each value of 'x'
+    assert len(tree.program().steps) == 2
+
+def test_batch_run_drops_results_after_their_last_use():
+    # Holding every node's per-value results would take tens of MB here
+    terms, values = 500, list(range(1000, 3000))
+    tracemalloc.start()
+    try:
+        assert batch_variable_parser('+'.join(['x'] * terms), values)[-1] == 2999 * terms
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert peak < 2_000_000
+
+# Stress tests: long and deep expressions are handled iteratively, in linear time (they
+# exceed the default length limit, which is raised for them)
+def test_long_flat_expression(monkeypatch):
+    monkeypatch.setattr(parser_module, 'MAX_EXPRESSION_LENGTH', 10 ** 6)
+    n = 50_000
+    assert parser('+'.join(['1'] * n)) == n
+    assert batch_variable_parser('+'.join(['x'] * n), [1, 2]) == [n, 2 * n]
+
+def test_deeply_nested_expressions(monkeypatch):
+    monkeypatch.setattr(parser_module, 'MAX_EXPRESSION_LENGTH', 10 ** 6)
+    n = 50_000
+    assert parser('(' * n + '2' + ')' * n) == 2
+    assert parser('-(' * n + '2' + ')' * n) == 2
+    assert parser('+'.join(['(1'] * n) + ')' * n) == n
+    assert parser('^'.join(['1'] * n)) == 1
+    expression = '(' * n + 'x' + '+1)' * n
+    assert variable_parser(expression, 1) == n + 1
+    assert batch_variable_parser(expression, [0, 1]) == [n, n + 1]
+
+def test_compile_and_evaluate_time_is_linear(monkeypatch):
+    monkeypatch.setattr(parser_module, 'MAX_EXPRESSION_LENGTH', 10 ** 6)
+    def timed(n):
+        best = float('inf')
+        for i in range(3):
+            # A different expression each time, so the parser cache does not serve it
+            expression = f'{i}+' + '+'.join(['(1*2'] * n) + ')' * n
+            start = time.perf_counter()
+            parser(expression)
+            best = min(best, time.perf_counter() - start)
+        return best
+    # Four times the input takes about four times as long; quadratic behaviour would take sixteen
+    assert timed(20_000) < 8 * timed(5_000)
+
+def test_submissions_are_tokenized_once(monkeypatch):
+    calls = []
+    original = parser_module.tokenize
+    monkeypatch.setattr(parser_module, 'tokenize', lambda *args, **kwargs: calls.append(kwargs) or original(*args, **kwargs))
+    tree = compile_submission('7 *  x+ 13', variable=True, mode='exact')
+    assert compile_variable_expression('7 *  x+ 13', 'exact') is tree
+    assert variable_parser('7 * x+ 13', 2, 'exact') == 27
+    assert calls == [{'strict': True}]
+    with pytest.raises(ValueError, match='Consecutive operators'):
+        compile_submission('7**x', variable=True)
+
+def test_expression_length_limit(monkeypatch):
+    monkeypatch.setattr(parser_module, 'MAX_EXPRESSION_LENGTH', 10)
+    assert tokenize('1+2+3+4+5') == [1, '+', 2, '+', 3, '+', 4, '+', 5]
+    with pytest.raises(ValueError, match='too long'):
+        tokenize('1+2+3+4+5+6')
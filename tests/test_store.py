@@ -0,0 +1,122 @@
+import pytest
+from datetime import datetime, timedelta
+from app import app
+from sqlalchemy import create_engine, inspect, text
+from models import db, upgrade_schema
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from store import POOL_METRICS, MemoryStore, SQLAlchemyStore, SQLiteStore, create_store, pool_options
+
+@pytest.fixture(params=['memory', 'sqlite', 'sqlalchemy'])
+def store(request, tmp_path):
+    if request.param == 'memory':
+        store = MemoryStore()
+    elif request.param == 'sqlite':
+        store = SQLiteStore(str(tmp_path / 'results.db'))
+    else:
+        store = SQLAlchemyStore()
+        store.init_app(app)
+    yield store
+    store.close()
+
+def make_rows(prefix, count, base=datetime(1990, 1, 1)):
+    return [
+        {'id': f'{prefix}-{i:03d}', 'expression': f'{i}+{i}', 'result': str(2 * i), 'timestamp': base + timedelta(minutes=i)}
+        for i in range(count)
+    ]
+
+def test_store_write_and_get(store):
+    store.write_many(make_rows('get', 3))
+    store.write_many([dict(make_rows('get', 1)[0], result='changed')])
+    assert store.get('get-000')['result'] == 'changed'
+    assert store.get('get-002')['timestamp'] == datetime(1990, 1, 1, 0, 2)
+    assert store.get('missing') is None
+
+def test_store_existing(store):
+    store.write_many(make_rows('exists', 2))
+    assert sorted(store.existing(['exists-001', 'missing', 'exists-000'])) == ['exists-000', 'exists-001']
+    assert list(store.existing([])) == []
+
+def test_store_keeps_errors_out_of_history(store):
+    row = dict(make_rows('failed', 1, base=datetime(1992, 1, 1))[0], result=None, error='division by zero')
+    store.write_many([row])
+    assert store.get('failed-000')['error'] == 'division by zero'
+    assert store.history(10, since=datetime(1992, 1, 1), until=datetime(1992, 1, 2)) == []
+    store.write_many(make_rows('failed', 1, base=datetime(1992, 1, 1)))
+    assert store.get('failed-000')['error'] is None
+    assert [row['id'] for row in store.history(10, since=datetime(1992, 1, 1), until=datetime(1992, 1, 2))] == ['failed-000']
+
+def test_store_history_keyset(store):
+    store.write_many(make_rows('hist', 5, base=datetime(1991, 1, 1)))
+    until = datetime(1991, 1, 2)
+    first = store.history(2, until=until, since=datetime(1991, 1, 1))
+    assert [row['id'] for row in first] == ['hist-004', 'hist-003']
+    last = first[-1]
+    second = store.history(2, before=(last['timestamp'], last['id']), until=until)
+    assert [row['id'] for row in second] == ['hist-002', 'hist-001']
+    assert [row['id'] for row in store.history(5, until=until, prefix='3+')] == ['hist-003']
+
+def test_store_oldest_and_delete(store):
+    store.write_many(make_rows('old', 4, base=datetime(1980, 1, 1)))
+    oldest = store.oldest(datetime(1980, 1, 1, 0, 2), 10)
+    assert [row['id'] for row in oldest] == ['old-000', 'old-001']
+    store.delete(row['id'] for row in oldest)
+    assert store.get('old-000') is None
+    assert store.get('old-002') is not None
+    store.delete(['old-002', 'old-003'])
+
+def test_unknown_store():
+    with pytest.raises(ValueError):
+        create_store('redis')
+
+def test_pool_options(tmp_path):
+    assert pool_options('sqlite://', 'test') == {}
+    options = pool_options(f"sqlite:///{tmp_path / 'pool.db'}", 'test', pool_size=2, max_overflow=0)
+    assert options['pool_size'] == 2 and options['pool_logging_name'] == 'test'
+
+def test_timed_pool_metrics(tmp_path):
+    url = f"sqlite:///{tmp_path / 'pool.db'}"
+    engine = create_engine(url, **pool_options(url, 'timed-test', pool_size=1, max_overflow=0, timeout=0.05))
+    with engine.connect() as conn:
+        conn.execute(text('SELECT 1'))
+        with pytest.raises(PoolTimeoutError):
+            engine.connect()
+    stats = POOL_METRICS['timed-test'].stats()
+    assert stats['checkouts'] == 1 and stats['timeouts'] == 1
+    assert stats['max_wait_seconds'] >= 0.05
+    engine.dispose()
+
+def test_sqlalchemy_store_pool_stats(store):
+    stats = store.pool_stats()
+    if isinstance(store, SQLAlchemyStore):
+        store.write_many(make_rows('pool', 1, base=datetime(1985, 1, 1)))
+        assert 'status' in store.pool_stats()['writer']
+        store.delete(['pool-000'])
+    else:
+        assert stats == {}
+
+def test_upgrade_schema_adds_missing_columns_and_indexes(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    # The table as created before the history indexes were added to the model
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE expression_result (id VARCHAR(36) PRIMARY KEY, expression VARCHAR, "
+            "result VARCHAR, timestamp DATETIME)"
+        ))
+        conn.execute(text(
+            "CREATE TABLE evaluation_job (id INTEGER PRIMARY KEY, payload TEXT NOT NULL, created_at DATETIME NOT NULL, "
+            "claimed_at DATETIME, claimed_by VARCHAR(36), attempts INTEGER NOT NULL)"
+        ))
+        conn.execute(text("INSERT INTO evaluation_job (payload, created_at, attempts) VALUES ('{}', '2000-01-01', 0)"))
+    db.metadata.create_all(engine)
+    assert inspect(engine).get_indexes('expression_result') == []
+    upgrade_schema(engine)
+    upgrade_schema(engine)
+    names = {index['name'] for index in inspect(engine).get_indexes('expression_result')}
+    assert names == {'ix_expression_result_timestamp_id', 'ix_expression_result_expression'}
+    assert {index['name'] for index in inspect(engine).get_indexes('evaluation_job')} == {
+        'ix_evaluation_job_claimed_at_id', 'ix_evaluation_job_priority_claimed_at_id',
+        'ix_evaluation_job_client_priority_round',
+    }
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT priority FROM evaluation_job")).scalar() == 0
+    engine.dispose()
@@ -0,0 +1,202 @@
+import gzip
+import json
+import os
+import sqlite3
+import threading
+import zlib
+from datetime import datetime
+
+# Maximum number of records compressed together in one gzip member; a lookup
+# decompresses a single member, so this bounds the work and memory of one lookup
+BLOCK_RECORDS = int(os.getenv('ARCHIVE_BLOCK_RECORDS', '256'))
+
+# Read a file's gzip members one at a time, yielding the offset, compressed size and
+# decompressed data of each; a member cut short (e.g. by a crash) ends the file
+def _members(path, chunk_size=65536):
+    with open(path, 'rb') as f:
+        offset = 0
+        data = b''
+        while True:
+            decompressor = zlib.decompressobj(wbits=31)
+            chunks = []
+            size = 0
+            while not decompressor.eof:
+                if not data:
+                    data = f.read(chunk_size)
+                    if not data:
+                        return
+                chunks.append(decompressor.decompress(data))
+                size += len(data) - len(decompressor.unused_data)
+                data = decompressor.unused_data
+            yield offset, size, b''.join(chunks)
+            offset += size
+
+class ResultArchive:
+    """
+    Compressed, day-partitioned JSON Lines archive of expired evaluation results.
+
+    Each day of results is appended to its own gzip file
+    (results-YYYY-MM-DD.jsonl.gz), in gzip members of at most BLOCK_RECORDS records;
+    appending adds new members, so files never need to be rewritten. Where each
+    request ID is stored (its partition, the offset and size of its member, and its
+    line in the member) is recorded at archive time in a SQLite index (index.db), so a
+    lookup decompresses a single member and a request that was never archived is
+    answered without reading any file.
+
+    Methods:
+        append(rows): Archive rows into their day partitions.
+        get(req_id): Look up an archived result by request ID.
+        partitions(): List the archive files, newest first.
+        close(): Close the ID index.
+    """
+    # Tables of the ID index: the location of each archived request, and the partitions indexed
+    INDEX_SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS archived ("
+        "id TEXT PRIMARY KEY, day TEXT NOT NULL, block_offset INTEGER NOT NULL, "
+        "block_size INTEGER NOT NULL, line INTEGER NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS indexed_partition (day TEXT PRIMARY KEY)",
+    )
+
+    def __init__(self, directory):
+        """
+        Partitions written before the ID index existed, or indexed without record
+        locations, are indexed once, on opening.
+
+        Args:
+            directory (str): Directory holding the archive files.
+        """
+        self.directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(directory, 'index.db'), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(archived)")}
+        if columns and 'line' not in columns:
+            # An index of partitions only: rebuilt with the location of every record
+            self._conn.execute("DROP TABLE archived")
+            self._conn.execute("DROP TABLE IF EXISTS indexed_partition")
+        for statement in self.INDEX_SCHEMA:
+            self._conn.execute(statement)
+        self._conn.commit()
+        self._backfill()
+
+    def _path(self, day):
+        return os.path.join(self.directory, f"results-{day}.jsonl.gz")
+
+    def _index_records(self, entries, days):
+        """
+        Internal method: Record the locations of archived records and their partitions.
+        """
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO archived (id, day, block_offset, block_size, line) VALUES (?, ?, ?, ?, ?)",
+                entries,
+            )
+            self._conn.executemany("INSERT OR IGNORE INTO indexed_partition (day) VALUES (?)", [(day,) for day in days])
+
+    def append(self, rows):
+        """
+        Archive rows into their day partitions.
+
+        Args:
+            rows (list): Dicts with 'id', 'expression', 'result' and 'timestamp' (datetime).
+        """
+        partitions = {}
+        for row in rows:
+            timestamp = row['timestamp']
+            record = dict(row, timestamp=timestamp.isoformat() if timestamp else None)
+            day = timestamp.date().isoformat() if timestamp else 'undated'
+            partitions.setdefault(day, []).append(record)
+        with self._lock:
+            blocks = {}
+            entries = []
+            for day, records in partitions.items():
+                path = self._path(day)
+                offset = os.path.getsize(path) if os.path.exists(path) else 0
+                blocks[path] = []
+                for start in range(0, len(records), BLOCK_RECORDS):
+                    block = records[start:start + BLOCK_RECORDS]
+                    data = gzip.compress(''.join(json.dumps(record) + '\n' for record in block).encode('utf-8'))
+                    blocks[path].append(data)
+                    entries.extend((record['id'], day, offset, len(data), line) for line, record in enumerate(block))
+                    offset += len(data)
+            # Indexed before writing: an ID whose record is lost in a crash is simply not found
+            self._index_records(entries, partitions)
+            for path, data in blocks.items():
+                with open(path, 'ab') as f:
+                    f.writelines(data)
+
+    def partitions(self):
+        """
+        List the archive files, newest first.
+
+        Returns:
+            list: Paths of the archive files.
+        """
+        names = [
+            name for name in os.listdir(self.directory)
+            if name.startswith('results-') and name.endswith('.jsonl.gz')
+        ]
+        return [os.path.join(self.directory, name) for name in sorted(names, reverse=True)]
+
+    def _backfill(self):
+        """
+        Internal method: Add the partitions missing from the ID index to it, one member at a time.
+        """
+        with self._lock:
+            indexed = {day for day, in self._conn.execute("SELECT day FROM indexed_partition")}
+            for path in self.partitions():
+                day = os.path.basename(path)[len('results-'):-len('.jsonl.gz')]
+                if day in indexed:
+                    continue
+                entries = [
+                    (json.loads(text)['id'], day, offset, size, line)
+                    for offset, size, data in _members(path)
+                    for line, text in enumerate(data.splitlines())
+                ]
+                self._index_records(entries, [day])
+
+    def _read_block(self, path, offset, size):
+        """
+        Internal method: Read and decompress one gzip member of an archive file.
+        """
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            return gzip.decompress(f.read(size))
+
+    def get(self, req_id):
+        """
+        Look up an archived result by request ID.
+
+        Args:
+            req_id (str): The request ID.
+
+        Returns:
+            dict or None: The archived row (timestamp as a datetime), or None.
+        """
+        with self._lock:
+            located = self._conn.execute(
+                "SELECT day, block_offset, block_size, line FROM archived WHERE id = ?", (req_id,)
+            ).fetchone()
+        if located is None:
+            return None
+        day, offset, size, line = located
+        path = self._path(day)
+        try:
+            lines = self._read_block(path, offset, size).splitlines()
+        except (OSError, EOFError, zlib.error):
+            # A missing partition, or a member lost in a crash
+            return None
+        if line >= len(lines):
+            return None
+        record = json.loads(lines[line])
+        if record['timestamp']:
+            record['timestamp'] = datetime.fromisoformat(record['timestamp'])
+        return record
+
+    def close(self):
+        """
+        Close the ID index.
+        """
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,111 @@
+from collections import OrderedDict
+import threading
+import time
+
+class LRUCache:
+    """
+    A thread-safe, bounded least-recently-used cache with optional time-to-live.
+
+    With policy 'fifo' hits do not refresh an entry, so the oldest entry is evicted first.
+
+    Methods:
+        get(key, default): Return a cached value and record a hit or miss.
+        put(key, value): Store a value, evicting the least recently used entry when full.
+        pop(key, default): Remove and return a value.
+        clear(): Remove every entry.
+        stats(): Return hit, miss and size counters.
+    """
+    def __init__(self, maxsize=1024, ttl=None, policy='lru'):
+        """
+        Args:
+            maxsize (int): Maximum number of entries (0 disables caching).
+            ttl (float): Seconds an entry stays valid (None keeps entries until evicted).
+            policy (str): Eviction policy, 'lru' or 'fifo'.
+
+        Raises:
+            ValueError: If the eviction policy is unknown.
+        """
+        if policy not in ('lru', 'fifo'):
+            raise ValueError(f"Unknown eviction policy: {policy}")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.policy = policy
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Return a cached value and record a hit or miss.
+
+        Args:
+            key: The cache key.
+            default: Value returned on a miss.
+
+        Returns:
+            The cached value, or `default`.
+        """
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                value, expires = item
+                if expires is None or expires > time.monotonic():
+                    if self.policy == 'lru':
+                        self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        """
+        Store a value, evicting the least recently used entry when full.
+
+        Args:
+            key: The cache key.
+            value: The value to store.
+        """
+        if self.maxsize <= 0:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        """
+        Remove and return a value.
+
+        Args:
+            key: The cache key.
+            default: Value returned if the key is not cached.
+
+        Returns:
+            The removed value, or `default`.
+        """
+        with self._lock:
+            item = self._data.pop(key, None)
+        return default if item is None else item[0]
+
+    def clear(self):
+        """
+        Remove every entry.
+        """
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """
+        Return hit, miss and size counters.
+
+        Returns:
+            dict: 'hits', 'misses', 'size' and 'maxsize'.
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._data), 'maxsize': self.maxsize}
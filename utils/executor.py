@@ -0,0 +1,214 @@
+import itertools
+import math
+import multiprocessing
+import threading
+import weakref
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+try:
+    import resource
+except ImportError:  # Resource limits are only available on Unix
+    resource = None
+
+class EvaluationLimitError(Exception):
+    """
+    Raised when an evaluation is killed for exceeding its CPU time, memory or wall-clock limit.
+    """
+
+class InlineEvaluator:
+    """
+    Evaluation executor that runs each task directly on the calling thread.
+    """
+    def run(self, func, *args):
+        """
+        Run a parsing/evaluation function and return its result.
+
+        Args:
+            func (callable): The function to run.
+            *args: Arguments passed to the function.
+
+        Returns:
+            The function's result.
+        """
+        return func(*args)
+
+    def shutdown(self):
+        """
+        Release executor resources (nothing to do for inline evaluation).
+        """
+
+# Queue on which a pool process announces each task it starts (set in the pool processes)
+_started = None
+
+# Child process initializer: cap the address space of every pool process and keep
+# the queue for announcing started tasks
+def _limit_memory(memory_limit, started=None):
+    global _started
+    _started = started
+    if resource and memory_limit:
+        _, hard = resource.getrlimit(resource.RLIMIT_AS)
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, hard))
+
+# Run a task in a pool process under a per-task CPU time budget, announcing its start
+def _run_limited(cpu_limit, task_id, func, *args):
+    if _started is not None:
+        _started.put(task_id)
+    if resource and cpu_limit:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        used = usage.ru_utime + usage.ru_stime
+        _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+        soft = math.ceil(used + cpu_limit)
+        if hard != resource.RLIM_INFINITY:
+            soft = min(soft, hard)
+        # Exceeding the soft limit delivers SIGXCPU, which terminates the process
+        resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+    return func(*args)
+
+class ProcessPoolEvaluator:
+    """
+    Evaluation executor that fans tasks out to a pool of worker processes.
+
+    Only the result travels back to the calling thread. Each task runs under a CPU
+    time budget and each process under a memory cap; a runaway task kills its process
+    and the pool is rebuilt, so the calling thread only sees an EvaluationLimitError.
+
+    A broken pool fails every task submitted to it, but only the tasks that were
+    running can have broken it: pool processes announce each task they start, and
+    tasks that had not started, or whose pool was killed because another task timed
+    out, are retried once on the new pool. With several processes every task running
+    when the pool broke fails, since the one that exhausted its limits cannot be
+    told apart.
+    """
+    def __init__(self, processes=None, cpu_limit=5, memory_limit=None, timeout=30):
+        """
+        Args:
+            processes (int): Number of worker processes (defaults to the CPU count).
+            cpu_limit (float): CPU seconds allowed per task (0 disables the limit).
+            memory_limit (int): Address-space limit per process in bytes (None disables it).
+            timeout (float): Wall-clock seconds to wait for a task result.
+        """
+        self.processes = processes
+        self.cpu_limit = cpu_limit
+        self.memory_limit = memory_limit
+        self.timeout = timeout
+        self._pool = None
+        self._lock = threading.Lock()
+        self._task_ids = itertools.count()
+        # Tasks submitted and not yet finished, and those of them announced as started
+        self._started = multiprocessing.SimpleQueue()
+        self._pending = set()
+        self._running = set()
+        # Pools killed because a task timed out: their other tasks are innocent
+        self._killed = weakref.WeakSet()
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.processes,
+                    initializer=_limit_memory,
+                    initargs=(self.memory_limit, self._started),
+                )
+            return self._pool
+
+    def _reset_pool(self, pool, kill=False):
+        with self._lock:
+            if kill:
+                self._killed.add(pool)
+            if self._pool is not pool:
+                return
+            self._pool = None
+        if kill:
+            for process in list(getattr(pool, '_processes', {}).values()):
+                process.kill()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _collect_started(self):
+        """
+        Internal method: Record the pending tasks the pool processes announced as started.
+        """
+        while not self._started.empty():
+            task_id = self._started.get()
+            if task_id in self._pending:
+                self._running.add(task_id)
+
+    def _was_running(self, task_id):
+        """
+        Internal method: Return whether a task had started in a pool process.
+        """
+        with self._lock:
+            self._collect_started()
+            return task_id in self._running
+
+    def run(self, func, *args):
+        """
+        Run a parsing/evaluation function in a worker process and return its result.
+
+        A task that had not started when its pool broke is retried once on a new pool.
+
+        Args:
+            func (callable): A picklable, module-level function.
+            *args: Picklable arguments passed to the function.
+
+        Returns:
+            The function's result.
+
+        Raises:
+            EvaluationLimitError: If the task exceeds its CPU, memory or wall-clock limit.
+        """
+        for attempt in range(2):
+            pool = self._get_pool()
+            task_id = next(self._task_ids)
+            with self._lock:
+                self._pending.add(task_id)
+            try:
+                future = pool.submit(_run_limited, self.cpu_limit, task_id, func, *args)
+                return future.result(self.timeout)
+            except BrokenProcessPool:
+                self._reset_pool(pool)
+                innocent = pool in self._killed or not self._was_running(task_id)
+                if attempt or not innocent:
+                    raise EvaluationLimitError("Evaluation exceeded its CPU time or memory limit.")
+            except TimeoutError:
+                self._reset_pool(pool, kill=True)
+                raise EvaluationLimitError("Evaluation timed out.")
+            except MemoryError:
+                raise EvaluationLimitError("Evaluation exceeded its memory limit.")
+            finally:
+                with self._lock:
+                    self._pending.discard(task_id)
+                    self._running.discard(task_id)
+                    self._collect_started()
+
+    def shutdown(self):
+        """
+        Shut down the worker processes.
+        """
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+def create_evaluator(kind='inline', processes=None, cpu_limit=5, memory_limit=None, timeout=30):
+    """
+    Create an evaluation executor by name.
+
+    Args:
+        kind (str): 'inline' to evaluate on the stream thread, 'process' for a process pool.
+        processes (int): Number of worker processes for the process pool.
+        cpu_limit (float): CPU seconds allowed per task in the process pool.
+        memory_limit (int): Address-space limit per pool process in bytes.
+        timeout (float): Wall-clock seconds to wait for a pool task.
+
+    Returns:
+        An executor exposing run(func, *args) and shutdown().
+
+    Raises:
+        ValueError: If the executor kind is unknown.
+    """
+    if kind == 'inline':
+        return InlineEvaluator()
+    if kind == 'process':
+        return ProcessPoolEvaluator(processes, cpu_limit, memory_limit, timeout)
+    raise ValueError(f"Unknown evaluation executor: {kind}")
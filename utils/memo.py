@@ -0,0 +1,123 @@
+import threading
+from utils.cache import LRUCache
+
+class ResultMemo:
+    """
+    Content-addressed memo of evaluation results with coalescing of in-flight duplicates.
+
+    The first request for a key becomes its leader and is evaluated; identical
+    requests arriving while it is in flight become followers and share its outcome,
+    provided they are scheduled on the same terms (such as priority and deadline):
+    a request on other terms leads an evaluation of its own. Completed results are
+    kept in a bounded cache and answer later requests directly.
+
+    Methods:
+        claim(key, request, coalesce, terms): Register a request and report how it should be served.
+        complete(key, result): Store a leader's result and return the followers of every leader of the key.
+        fail(key, terms): Drop a failed leader and return its followers.
+        stats(): Return memo counters.
+    """
+    HIT = 'hit'
+    LEADER = 'leader'
+    FOLLOWER = 'follower'
+
+    def __init__(self, maxsize=10000, policy='lru', ttl=None):
+        """
+        Args:
+            maxsize (int): Maximum number of memoized results (0 disables memoization).
+            policy (str): Eviction policy, 'lru' or 'fifo'.
+            ttl (float): Seconds a memoized result stays valid (None keeps it until evicted).
+        """
+        self.results = LRUCache(maxsize, ttl, policy)
+        self.coalesced = 0
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.results.maxsize > 0
+
+    def claim(self, key, request, coalesce=True, terms=None):
+        """
+        Register a request and report how it should be served.
+
+        Args:
+            key: Content key of the request (normalized expression and value).
+            request: The request (e.g. its ID), handed back by complete() or fail()
+                if it becomes a follower.
+            coalesce (bool): Whether the request may follow an identical one in flight;
+                without coalescing, a request that misses the memo is not registered.
+            terms (hashable): Scheduling terms of the request; it only follows a
+                leader with equal terms.
+
+        Returns:
+            tuple: (HIT, result) if the result is memoized, (FOLLOWER, None) if an
+            identical request is in flight, or (LEADER, None) if it must be evaluated.
+        """
+        if not self.enabled:
+            return self.LEADER, None
+        with self._lock:
+            result = self.results.get(key)
+            if result is not None:
+                return self.HIT, result
+            if not coalesce:
+                return self.LEADER, None
+            leaders = self._in_flight.setdefault(key, {})
+            followers = leaders.get(terms)
+            if followers is not None:
+                followers.append(request)
+                self.coalesced += 1
+                return self.FOLLOWER, None
+            leaders[terms] = []
+            return self.LEADER, None
+
+    def complete(self, key, result):
+        """
+        Store a leader's result and return its followers.
+
+        The result answers the followers of every leader of the key, whatever their terms.
+
+        Args:
+            key: Content key of the request.
+            result (str): The evaluation result.
+
+        Returns:
+            list: The followers that share the result.
+        """
+        if not self.enabled:
+            return []
+        with self._lock:
+            self.results.put(key, result)
+            return [request for followers in self._in_flight.pop(key, {}).values() for request in followers]
+
+    def fail(self, key, terms=None):
+        """
+        Drop a failed leader and return its followers.
+
+        Args:
+            key: Content key of the request.
+            terms (hashable): Scheduling terms the leader claimed the key with.
+
+        Returns:
+            list: The followers that share the failure.
+        """
+        with self._lock:
+            leaders = self._in_flight.get(key)
+            if leaders is None:
+                return []
+            followers = leaders.pop(terms, [])
+            if not leaders:
+                del self._in_flight[key]
+            return followers
+
+    def stats(self):
+        """
+        Return memo counters.
+
+        Returns:
+            dict: Cache counters plus the number of coalesced and in-flight requests.
+        """
+        stats = self.results.stats()
+        stats['coalesced'] = self.coalesced
+        stats['in_flight'] = len(self._in_flight)
+        return stats
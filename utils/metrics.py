@@ -0,0 +1,277 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+import threading
+import time
+
+# Default histogram buckets in seconds, from 100 microseconds to 10 seconds
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def format_labels(pairs):
+    """
+    Format (name, value) label pairs as a Prometheus label set, e.g. {lane="high"}.
+    """
+    if not pairs:
+        return ''
+    escaped = []
+    for name, value in pairs:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        escaped.append(f'{name}="{value}"')
+    return '{' + ','.join(escaped) + '}'
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+class Metric:
+    """
+    Base class of a named metric with optional labels.
+
+    A metric with label names keeps one child per combination of label values,
+    returned by labels(); a metric without labels records values itself.
+
+    Methods:
+        labels(*values): Return the child for a combination of label values.
+        render(): Render the metric in the Prometheus text exposition format.
+    """
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        """
+        Args:
+            name (str): Metric name.
+            documentation (str): Help text.
+            labelnames (tuple): Names of the metric's labels.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """
+        Return the child metric for a combination of label values.
+
+        Args:
+            *values: One value per label name.
+
+        Returns:
+            Metric: The child, created on first use.
+
+        Raises:
+            ValueError: If the number of values does not match the label names.
+        """
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        values = tuple(str(value) for value in values)
+        with self._lock:
+            child = self._children.get(values)
+            if child is None:
+                child = self._children[values] = self._new_child()
+            return child
+
+    def _series(self):
+        """
+        Internal method: Return (label pairs, child) for every series to render.
+        """
+        if not self.labelnames:
+            return [((), self)]
+        with self._lock:
+            children = sorted(self._children.items())
+        return [(tuple(zip(self.labelnames, values)), child) for values, child in children]
+
+    def _samples(self, labels):
+        raise NotImplementedError
+
+    def render(self):
+        """
+        Render the metric in the Prometheus text exposition format.
+
+        Returns:
+            list: Lines of the exposition.
+        """
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for labels, child in self._series():
+            for suffix, pairs, value in child._samples(labels):
+                lines.append(f"{self.name}{suffix}{format_labels(pairs)} {format_value(value)}")
+        return lines
+
+class Counter(Metric):
+    """
+    A monotonically increasing count.
+    """
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.value = 0
+
+    def _new_child(self):
+        return Counter(self.name, self.documentation)
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def _samples(self, labels):
+        return [('', labels, self.value)]
+
+class Gauge(Metric):
+    """
+    A value that can go up and down, set directly or read from a callback at render time.
+    """
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        """
+        Args:
+            name (str): Metric name.
+            documentation (str): Help text.
+            labelnames (tuple): Names of the metric's labels.
+            callback (callable): Returns the current value or, for a gauge with one
+                label, a dict mapping label values to values.
+        """
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+        self.value = 0
+
+    def _new_child(self):
+        return Gauge(self.name, self.documentation)
+
+    def set(self, value):
+        self.value = value
+
+    def _series(self):
+        if self.callback is None:
+            return super()._series()
+        try:
+            current = self.callback()
+        except Exception as e:
+            print(f"Error reading metric {self.name}: {e}")
+            return []
+        if not self.labelnames:
+            return [((), _Value(current))]
+        return [(((self.labelnames[0], key),), _Value(value)) for key, value in sorted(current.items())]
+
+    def _samples(self, labels):
+        return [('', labels, self.value)]
+
+class _Value:
+    """
+    A gauge value read from a callback.
+    """
+    def __init__(self, value):
+        self.value = value
+
+    def _samples(self, labels):
+        return [('', labels, self.value)]
+
+class Histogram(Metric):
+    """
+    Observations counted in cumulative buckets, with their sum and count.
+    """
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        """
+        Args:
+            name (str): Metric name.
+            documentation (str): Help text.
+            labelnames (tuple): Names of the metric's labels.
+            buckets (tuple): Upper bounds of the buckets.
+        """
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+
+    def _new_child(self):
+        return Histogram(self.name, self.documentation, buckets=self.buckets)
+
+    def observe(self, value):
+        """
+        Record one observation.
+        """
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        """
+        Observe the duration of a block in seconds.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def _samples(self, labels):
+        with self._lock:
+            counts = list(self.counts)
+            total = self.sum
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            samples.append(('_bucket', labels + (('le', format_value(bound)),), cumulative))
+        samples.append(('_sum', labels, total))
+        samples.append(('_count', labels, cumulative))
+        return samples
+
+class Registry:
+    """
+    A collection of metrics rendered together for the /metrics endpoint.
+
+    Methods:
+        counter(name, documentation, labelnames): Register a counter.
+        gauge(name, documentation, labelnames, callback): Register a gauge.
+        histogram(name, documentation, labelnames, buckets): Register a histogram.
+        get(name): Return a registered metric.
+        render(): Render every metric in the Prometheus text exposition format.
+    """
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        """
+        Register a metric, or return the already registered metric of the same name.
+        """
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), callback=None):
+        return self.register(Gauge(name, documentation, labelnames, callback))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def render(self):
+        """
+        Render every metric in the Prometheus text exposition format.
+
+        Returns:
+            str: The exposition.
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+# Process-wide registry used by the application's instrumentation
+REGISTRY = Registry()
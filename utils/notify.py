@@ -0,0 +1,238 @@
+import asyncio
+import threading
+import time
+
+class Watch:
+    """
+    A subscription to the completion of a set of request IDs.
+
+    Use as a context manager so the subscription is always removed.
+    """
+    def __init__(self, notifier, req_ids):
+        self.notifier = notifier
+        self.req_ids = set(req_ids)
+        self._event = threading.Event()
+        self._completed = []
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self.notifier._subscribe(self)
+        return self
+
+    def __exit__(self, *exc):
+        self.notifier._unsubscribe(self)
+
+    def _complete(self, req_id):
+        with self._lock:
+            self._completed.append(req_id)
+        self._event.set()
+
+    def wait(self, timeout=None):
+        """
+        Block until at least one watched request completes or the timeout expires.
+
+        Args:
+            timeout (float): Maximum number of seconds to wait.
+
+        Returns:
+            list: Request IDs completed since the previous call (empty on timeout).
+        """
+        self._event.wait(timeout)
+        with self._lock:
+            completed, self._completed = self._completed, []
+            self._event.clear()
+        return completed
+
+class AsyncWatch(Watch):
+    """
+    A Watch awaited on an asyncio event loop, so waiting occupies no thread.
+
+    Completions are delivered from the notifying thread through the loop's
+    call_soon_threadsafe().
+    """
+    def __init__(self, notifier, req_ids, loop):
+        super().__init__(notifier, req_ids)
+        self._loop = loop
+        self._async_event = asyncio.Event()
+
+    def _complete(self, req_id):
+        with self._lock:
+            self._completed.append(req_id)
+        self._loop.call_soon_threadsafe(self._async_event.set)
+
+    async def wait(self, timeout=None):
+        """
+        Wait until at least one watched request completes or the timeout expires.
+
+        Args:
+            timeout (float): Maximum number of seconds to wait.
+
+        Returns:
+            list: Request IDs completed since the previous call (empty on timeout).
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return []
+            try:
+                await asyncio.wait_for(self._async_event.wait(), remaining)
+            except asyncio.TimeoutError:
+                return []
+            self._async_event.clear()
+            with self._lock:
+                completed, self._completed = self._completed, []
+            # A wake-up scheduled before the previous call took its IDs carries none
+            if completed:
+                return completed
+
+class CompletionNotifier:
+    """
+    In-process notification of completed evaluations.
+
+    The result writer calls notify() once results are committed, waking every
+    Watch subscribed to those request IDs.
+
+    Methods:
+        watch(req_ids): Subscribe to the completion of request IDs.
+        watch_async(req_ids): Subscribe from an asyncio event loop.
+        watched(): Return the request IDs currently watched.
+        notify(req_ids): Wake the watchers of completed request IDs.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._watches = {}
+
+    def watch(self, req_ids):
+        """
+        Subscribe to the completion of request IDs.
+
+        Subscribe before checking for existing results, so a result written
+        in between is not missed.
+
+        Args:
+            req_ids (iterable): The request IDs to watch.
+
+        Returns:
+            Watch: A context manager whose wait() returns completed IDs.
+        """
+        return Watch(self, req_ids)
+
+    def watch_async(self, req_ids):
+        """
+        Subscribe to the completion of request IDs from a coroutine on the running event loop.
+
+        Args:
+            req_ids (iterable): The request IDs to watch.
+
+        Returns:
+            AsyncWatch: A context manager whose wait() is awaited.
+        """
+        return AsyncWatch(self, req_ids, asyncio.get_running_loop())
+
+    def _subscribe(self, watch):
+        with self._lock:
+            for req_id in watch.req_ids:
+                self._watches.setdefault(req_id, set()).add(watch)
+
+    def _unsubscribe(self, watch):
+        with self._lock:
+            for req_id in watch.req_ids:
+                watches = self._watches.get(req_id)
+                if watches:
+                    watches.discard(watch)
+                    if not watches:
+                        del self._watches[req_id]
+
+    def watched(self):
+        """
+        Return the request IDs currently watched.
+
+        Returns:
+            list: The watched request IDs.
+        """
+        with self._lock:
+            return list(self._watches)
+
+    def notify(self, req_ids):
+        """
+        Wake the watchers of completed request IDs.
+
+        Args:
+            req_ids (iterable): The completed request IDs.
+        """
+        with self._lock:
+            if not self._watches:
+                return
+            woken = [(watch, req_id) for req_id in req_ids for watch in self._watches.get(req_id, ())]
+        for watch, req_id in woken:
+            watch._complete(req_id)
+
+class CompletionPoller:
+    """
+    Shared polling of the result store on behalf of every watcher of a notifier.
+
+    Results written by other processes are not announced in this one. Rather than
+    each waiting client querying the store, one background thread looks up every
+    watched request ID once per interval, in batched queries, and notifies those
+    found; the store load stays the same however many clients wait.
+
+    Methods:
+        start(): Start the polling thread, if it is not running yet.
+        stop(): Stop the polling thread.
+    """
+    def __init__(self, notifier, lookup, interval=0.25, batch_size=500):
+        """
+        Args:
+            notifier (CompletionNotifier): The notifier whose watched IDs are polled.
+            lookup (callable): Returns the subset of a list of request IDs that have a result.
+            interval (float): Seconds between polls.
+            batch_size (int): Maximum number of request IDs per lookup.
+        """
+        self.notifier = notifier
+        self.lookup = lookup
+        self.interval = interval
+        self.batch_size = batch_size
+        self._thread = None
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        """
+        Start the polling thread, if it is not running yet.
+        """
+        with self._lock:
+            if self._thread is None:
+                self._stopped.clear()
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        """
+        Stop the polling thread.
+        """
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stopped.set()
+            thread.join()
+
+    def poll(self):
+        """
+        Look up the watched request IDs once and notify those that have a result.
+        """
+        req_ids = self.notifier.watched()
+        for start in range(0, len(req_ids), self.batch_size):
+            found = self.lookup(req_ids[start:start + self.batch_size])
+            if found:
+                self.notifier.notify(found)
+
+    def _run(self):
+        """
+        Internal method: Poll until stopped.
+        """
+        while not self._stopped.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Error polling results: {e}")
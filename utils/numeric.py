@@ -0,0 +1,319 @@
+from decimal import Context, Decimal, DecimalException, DivisionByZero, InvalidOperation, Overflow
+from fractions import Fraction
+import math
+import operator
+import os
+
+# Numeric engine used when a submission does not choose one: 'float', 'exact' or 'decimal'
+DEFAULT_MODE = os.getenv('NUMERIC_MODE', 'float')
+
+# Significant digits of results in the decimal engine
+DECIMAL_PRECISION = int(os.getenv('DECIMAL_PRECISION', '28'))
+
+# Largest integer (or numerator/denominator) an evaluation may produce, in bits; the default
+# (about 3,000 digits) stays below Python's limit on converting integers to strings
+MAX_RESULT_BITS = int(os.getenv('MAX_RESULT_BITS', '10000'))
+
+def to_number(value):
+    """
+    Convert a submitted variable value to an int or float.
+
+    Args:
+        value: A number, or a string containing one.
+
+    Returns:
+        int or float: The numeric value.
+
+    Raises:
+        ValueError: If the value is not a number, or not a finite one (such as 'nan' or 'inf').
+    """
+    if isinstance(value, bool):
+        raise ValueError(f"Invalid variable value: {value}")
+    number = None
+    if isinstance(value, (int, float)):
+        number = value
+    elif isinstance(value, str):
+        try:
+            number = int(value)
+        except ValueError:
+            try:
+                number = float(value)
+            except ValueError:
+                pass
+    if number is None or (isinstance(number, float) and not math.isfinite(number)):
+        raise ValueError(f"Invalid variable value: {value}")
+    return number
+
+def _too_large():
+    return OverflowError(f"Result exceeds the maximum size of {MAX_RESULT_BITS} bits.")
+
+def _bits(value):
+    """
+    Return the number of bits needed for an int or for the larger part of a Fraction.
+    """
+    if isinstance(value, int):
+        return value.bit_length()
+    return max(value.numerator.bit_length(), value.denominator.bit_length())
+
+def _log2(value):
+    """
+    Return log2 of the magnitude of a nonzero int or of the larger part of a Fraction.
+    """
+    if isinstance(value, int):
+        return math.log2(abs(value))
+    return max(math.log2(abs(value.numerator)), math.log2(value.denominator))
+
+def _check_power(base, exponent):
+    """
+    Reject an integer power whose result would exceed MAX_RESULT_BITS, before computing it.
+    """
+    if base in (0, 1, -1):
+        return
+    if abs(exponent) * _log2(base) > MAX_RESULT_BITS:
+        raise _too_large()
+
+def _iroot(n, k):
+    """
+    Return the integer k-th root of a non-negative int, rounded down.
+    """
+    if n < 2:
+        return n
+    if k >= n.bit_length():
+        return 1
+    x = 1 << -(-n.bit_length() // k)
+    while True:
+        y = ((k - 1) * x + n // x ** (k - 1)) // k
+        if y >= x:
+            return x
+        x = y
+
+class NumericEngine:
+    """
+    Arithmetic of one numeric mode, used by the nodes of compiled expression trees.
+
+    Methods:
+        number(literal): Convert a number literal (an int or a Decimal token).
+        value(value): Convert a submitted variable value.
+        add(a, b), sub(a, b), mul(a, b), div(a, b), pow(a, b): Arithmetic.
+        neg(a): Negation.
+        check(value): Validate the final result of an evaluation.
+        result(value): Convert a result to a JSON-serializable value.
+    """
+    name = None
+
+    def number(self, literal):
+        raise NotImplementedError
+
+    def value(self, value):
+        raise NotImplementedError
+
+    add = staticmethod(operator.add)
+    sub = staticmethod(operator.sub)
+    neg = staticmethod(operator.neg)
+
+    def mul(self, a, b):
+        return a * b
+
+    def div(self, a, b):
+        if b == 0:
+            raise ZeroDivisionError("Division by zero is not allowed.")
+        return a / b
+
+    def pow(self, a, b):
+        raise NotImplementedError
+
+    def check(self, value):
+        return value
+
+    def result(self, value):
+        return str(value)
+
+class FloatEngine(NumericEngine):
+    """
+    Fast native arithmetic: integers stay exact ints, decimals and quotients are binary floats.
+
+    Only powers are guarded while evaluating, since they are the only operation that
+    can grow a result exponentially; sums and products are checked once, at the end.
+    """
+    name = 'float'
+    mul = staticmethod(operator.mul)
+
+    def number(self, literal):
+        return literal if isinstance(literal, int) else float(literal)
+
+    def value(self, value):
+        return to_number(value)
+
+    def pow(self, a, b):
+        if isinstance(a, int) and isinstance(b, int) and b > 0:
+            _check_power(a, b)
+        if a < 0 and isinstance(b, float) and not b.is_integer():
+            raise ArithmeticError("A negative number has no real power with a fractional exponent.")
+        try:
+            return a ** b
+        except OverflowError:
+            raise OverflowError("Result too large.")
+
+    def check(self, value):
+        # Float arithmetic overflows to infinity silently
+        if isinstance(value, float) and math.isinf(value):
+            raise OverflowError("Result too large.")
+        if isinstance(value, int) and value.bit_length() > MAX_RESULT_BITS:
+            raise _too_large()
+        return value
+
+    def result(self, value):
+        return value
+
+class ExactEngine(NumericEngine):
+    """
+    Exact rational arithmetic: big integers and Fractions, with decimal literals read exactly.
+    """
+    name = 'exact'
+
+    def number(self, literal):
+        return literal if isinstance(literal, int) else self._normal(Fraction(literal))
+
+    def value(self, value):
+        if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+            raise ValueError(f"Invalid variable value: {value}")
+        # Floats are read as their shortest decimal form, so 0.1 means 1/10
+        text = repr(value) if isinstance(value, float) else value
+        try:
+            return self._normal(Fraction(text.strip() if isinstance(text, str) else text))
+        except (ValueError, ZeroDivisionError):
+            raise ValueError(f"Invalid variable value: {value}")
+
+    @staticmethod
+    def _normal(value):
+        """
+        Internal method: Enforce MAX_RESULT_BITS and turn whole Fractions into ints.
+        """
+        if _bits(value) > MAX_RESULT_BITS:
+            raise _too_large()
+        if isinstance(value, Fraction) and value.denominator == 1:
+            return value.numerator
+        return value
+
+    def add(self, a, b):
+        return self._normal(a + b)
+
+    def sub(self, a, b):
+        return self._normal(a - b)
+
+    def mul(self, a, b):
+        # Operands within the limit multiply quickly; the product is checked afterwards
+        return self._normal(a * b)
+
+    def div(self, a, b):
+        if b == 0:
+            raise ZeroDivisionError("Division by zero is not allowed.")
+        return self._normal(Fraction(a) / b)
+
+    def pow(self, a, b):
+        if isinstance(b, Fraction):
+            a = self._root(a, b.denominator)
+            b = b.numerator
+        if a == 0 and b < 0:
+            raise ZeroDivisionError("Zero cannot be raised to a negative power.")
+        _check_power(a, b)
+        return self._normal(Fraction(a) ** b)
+
+    @staticmethod
+    def _root(a, k):
+        """
+        Return the exact k-th root of a rational number, or raise if it is irrational.
+        """
+        a = Fraction(a)
+        if a < 0 and k % 2 == 0:
+            raise ArithmeticError("A negative number has no real even root.")
+        numerator = _iroot(abs(a.numerator), k)
+        denominator = _iroot(a.denominator, k)
+        if numerator ** k != abs(a.numerator) or denominator ** k != a.denominator:
+            raise ArithmeticError("The power has no exact rational value; use the float or decimal mode.")
+        return Fraction(-numerator if a < 0 else numerator, denominator)
+
+class DecimalEngine(NumericEngine):
+    """
+    Decimal floating-point arithmetic rounded to a configurable number of significant digits.
+    """
+    name = 'decimal'
+
+    def __init__(self, precision=DECIMAL_PRECISION):
+        """
+        Args:
+            precision (int): Significant digits of every result.
+        """
+        self.context = Context(
+            prec=precision, Emax=999999, Emin=-999999, traps=[InvalidOperation, DivisionByZero, Overflow],
+        )
+
+    def number(self, literal):
+        return self.context.create_decimal(literal)
+
+    def value(self, value):
+        if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+            raise ValueError(f"Invalid variable value: {value}")
+        try:
+            number = self.context.create_decimal(repr(value) if isinstance(value, float) else value)
+        except DecimalException:
+            number = None
+        if number is None or not number.is_finite():
+            raise ValueError(f"Invalid variable value: {value}")
+        return number
+
+    def _apply(self, op, a, b):
+        try:
+            return op(a, b)
+        except Overflow:
+            raise OverflowError("Result too large.")
+        except InvalidOperation:
+            raise ArithmeticError("Invalid operation.")
+
+    def add(self, a, b):
+        return self._apply(self.context.add, a, b)
+
+    def sub(self, a, b):
+        return self._apply(self.context.subtract, a, b)
+
+    def mul(self, a, b):
+        return self._apply(self.context.multiply, a, b)
+
+    def div(self, a, b):
+        if b == 0:
+            raise ZeroDivisionError("Division by zero is not allowed.")
+        return self._apply(self.context.divide, a, b)
+
+    def pow(self, a, b):
+        if a == 0 and b < 0:
+            raise ZeroDivisionError("Zero cannot be raised to a negative power.")
+        if a < 0 and b != b.to_integral_value():
+            raise ArithmeticError("A negative number has no real power with a fractional exponent.")
+        if a == 0 and b == 0:
+            # decimal signals 0**0 as invalid; match the float and exact engines
+            return Decimal(1)
+        return self._apply(self.context.power, a, b)
+
+    def neg(self, a):
+        return self.context.minus(a)
+
+# Numeric engines by mode
+ENGINES = {engine.name: engine for engine in (FloatEngine(), ExactEngine(), DecimalEngine())}
+
+def get_engine(mode=None):
+    """
+    Return the numeric engine of a mode.
+
+    Args:
+        mode (str): 'float', 'exact' or 'decimal'; None selects DEFAULT_MODE.
+
+    Returns:
+        NumericEngine: The engine.
+
+    Raises:
+        ValueError: If the mode is unknown.
+    """
+    engine = ENGINES.get(mode or DEFAULT_MODE)
+    if engine is None:
+        raise ValueError(f"Mode must be one of: {', '.join(ENGINES)}.")
+    return engine
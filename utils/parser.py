@@ -1,38 +1,299 @@
-from abc import ABC
-from abc import ABC,abstractmethod
+from abc import ABC, abstractmethod
+from decimal import Decimal
+from fractions import Fraction
+from functools import lru_cache
+from utils.cache import LRUCache
+from utils.metrics import REGISTRY
+from utils.numeric import ENGINES, MAX_RESULT_BITS, get_engine, to_number
+import math
+import os
 import re
 
+# Maximum number of compiled expressions kept in the LRU cache
+PARSER_CACHE_SIZE = int(os.getenv('PARSER_CACHE_SIZE', '1024'))
+
+# Longest expression (in characters, or tokens) kept in the parser caches; longer ones are compiled
+# each time, so that a few very large submissions cannot pin their trees in memory
+PARSER_CACHE_MAX_LENGTH = int(os.getenv('PARSER_CACHE_MAX_LENGTH', '65536'))
+
+# Longest expression accepted, in characters; validating and compiling one of the default
+# length takes a few milliseconds even when it is nested all the way down
+MAX_EXPRESSION_LENGTH = int(os.getenv('MAX_EXPRESSION_LENGTH', '16384'))
+
+# Separate timings of compiling (including parser cache hits) and evaluating expressions
+PARSE_SECONDS = REGISTRY.histogram('expression_parse_seconds', 'Time to compile an expression, including cache hits')
+EVALUATE_SECONDS = REGISTRY.histogram('expression_evaluate_seconds', 'Time to evaluate a compiled expression')
+
+# Maximum number of distinct nodes one evaluation may compute (per value of 'x'); at roughly
+# 2 microseconds per node the default keeps one evaluation to about 0.2 seconds
+MAX_EVALUATION_STEPS = int(os.getenv('MAX_EVALUATION_STEPS', '100000'))
+
+# Maximum number of nodes a tabulation may compute across all its values of 'x'; a batch
+# computes roughly one node for one value per 0.1 microsecond, so about a second by default
+MAX_TABULATE_STEPS = int(os.getenv('MAX_TABULATE_STEPS', '10000000'))
+
+class CostLimitError(ValueError):
+    """
+    Raised when the estimated cost of an expression exceeds the evaluation budgets.
+    """
+
 class Expression(ABC):
+    """
+    Node of a compiled expression.
+
+    Compiled expressions are DAGs: identical subexpressions share one node. They
+    are evaluated through their Program, which visits every distinct node once.
+
+    Attributes:
+        constant (bool): Whether the node does not depend on 'x'.
+        variable (bool): Whether the node is the variable 'x'.
+        arity (int): Number of operands.
+    """
+    constant = True
+    variable = False
+    arity = 0
+
+    def children(self):
+        """
+        Return the operand nodes, in evaluation order.
+        """
+        return ()
+
     @abstractmethod
-    def calc(self) -> float:
-        pass
+    def apply(self, *operands):
+        """
+        Compute the node's value from the values of its operands.
+        """
+
+    def program(self):
+        """
+        Return the evaluation program of the expression rooted at this node (built once).
+        """
+        program = self.__dict__.get('_program')
+        if program is None:
+            program = self._program = Program(self, self.__dict__.get('_nodes'))
+        return program
+
+    def calc(self, x=None) -> float:
+        return self.program().run(x)
+
+    def calc_batch(self, xs):
+        """
+        Evaluate the node for a whole list of variable values in one pass.
+
+        Returns a single value when the node does not depend on 'x', otherwise a
+        list with one result per value (None where the evaluation failed).
+        """
+        return self.program().run_batch(xs)
 
 class Num(Expression):
-  def __init__(self, x: int):
-    self.x = x  
-  def calc(self)->int:
-    return self.x
+    def __init__(self, x):
+        self.x = x
+    def apply(self) -> int:
+        return self.x
+
+class Var(Expression):
+    constant = False
+    variable = True
+    def apply(self):
+        raise ValueError("No value given for variable 'x'.")
+
+class UnaryExp(Expression):
+    arity = 1
+
+    def __init__(self, operand: Expression, engine=ENGINES['float']):
+        self.operand = operand
+        self.neg = engine.neg
+        self.constant = operand.constant
+    def children(self):
+        return (self.operand,)
+
+class Neg(UnaryExp):
+    def apply(self, a) -> float:
+        return self.neg(a)
 
 class BinExp(Expression):
-  def __init__(self, left: Expression, right: Expression):
-    self.left = left
-    self.right = right  
- 
+    # Name of the numeric engine method implementing the operator
+    method = None
+    arity = 2
+
+    def __init__(self, left: Expression, right: Expression, engine=ENGINES['float']):
+        self.left = left
+        self.right = right
+        self.op = getattr(engine, self.method)
+        self.constant = left.constant and right.constant
+
+    def children(self):
+        return (self.left, self.right)
+
+    def apply(self, a, b) -> float:
+        return self.op(a, b)
+
 class Plus(BinExp):
-  def calc(self) -> float:
-    return self.left.calc() + self.right.calc()
+    method = 'add'
 
 class Minus(BinExp):
-  def calc(self) -> float:
-    return self.left.calc() - self.right.calc()
+    method = 'sub'
 
 class Mul(BinExp):
-  def calc(self) -> float:
-    return self.left.calc() * self.right.calc()
+    method = 'mul'
 
 class Div(BinExp):
-  def calc(self) -> float:
-    return self.left.calc() / self.right.calc()
+    method = 'div'
+
+class Pow(BinExp):
+    method = 'pow'
+
+class Program:
+    """
+    Straight-line evaluation plan of a compiled expression.
+
+    Lists the distinct nodes of the expression so that each node's operands come
+    before it, and evaluates them in that order, so a subexpression shared by
+    several parts of the expression is computed once. Nodes that do not depend on
+    'x' are folded into constants the first time the program runs; later runs,
+    and every value of 'x', only compute the nodes that depend on 'x'.
+
+    Building and running a program are iterative and linear in the number of
+    nodes, so arbitrarily deep expressions need no recursion.
+
+    Attributes:
+        nodes (list): The distinct nodes, operands first; the last one is the root.
+        operands (list): Slots (indexes in `nodes`) of the operands of each node.
+    """
+    def __init__(self, root, nodes=None):
+        """
+        Args:
+            root (Expression): The root node of the compiled expression.
+            nodes (list): Every distinct node of the expression, operands first and the
+                root last, when already known (the compiler creates them in that order);
+                otherwise they are collected from the root.
+        """
+        if not nodes or nodes[-1] is not root:
+            nodes = self._collect(root)
+        self.nodes = nodes
+        index = {id(node): i for i, node in enumerate(nodes)}
+        operands = []
+        for node in nodes:
+            if node.arity == 2:
+                operands.append((index[id(node.left)], index[id(node.right)]))
+            elif node.arity:
+                operands.append((index[id(node.operand)],))
+            else:
+                operands.append(())
+        self.operands = operands
+        # (slot, engine function, operand slots) of the nodes computed for every value of 'x'
+        self.steps = [
+            (i, node.op, *operands[i]) if node.arity == 2 else (i, node.neg, operands[i][0], None)
+            for i, node in enumerate(nodes) if not node.constant and node.arity
+        ]
+        # Slots whose per-value results are no longer needed after each step: a batch run
+        # drops them then, so it holds only the results still to be read
+        last_use = {}
+        for k, (_, _, a, b) in enumerate(self.steps):
+            last_use[a] = last_use[b] = k
+        last_use.pop(None, None)
+        self.releases = [[] for _ in self.steps]
+        for slot, k in last_use.items():
+            self.releases[k].append(slot)
+        # Slot of the variable, or None for an expression without 'x'
+        self.var = next((i for i, node in enumerate(nodes) if node.variable), None)
+        self._constants = None
+
+    @staticmethod
+    def _collect(root):
+        """
+        Internal method: List the distinct nodes under a root, operands first (iterative post-order walk).
+        """
+        nodes = []
+        seen = set()
+        stack = [(root, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if expanded:
+                nodes.append(node)
+            elif id(node) not in seen:
+                seen.add(id(node))
+                stack.append((node, True))
+                stack.extend((child, False) for child in reversed(node.children()))
+        return nodes
+
+    def constants(self):
+        """
+        Return the values of the nodes, with every node that does not depend on 'x'
+        folded into its value (computed once, the first time it succeeds).
+
+        Raises:
+            ZeroDivisionError, ArithmeticError: If a constant subexpression fails.
+        """
+        values = self._constants
+        if values is None:
+            values = [None] * len(self.nodes)
+            for i, node in enumerate(self.nodes):
+                if node.constant:
+                    values[i] = node.apply(*[values[j] for j in self.operands[i]])
+            self._constants = values
+        return values
+
+    def run(self, x=None):
+        """
+        Evaluate the expression for one value of 'x' (None for an expression without 'x').
+        """
+        values = self.constants()
+        if self.var is None:
+            return values[-1]
+        if x is None:
+            raise ValueError("No value given for variable 'x'.")
+        values = values.copy()
+        values[self.var] = x
+        for i, function, a, b in self.steps:
+            values[i] = function(values[a]) if b is None else function(values[a], values[b])
+        return values[-1]
+
+    def run_batch(self, xs):
+        """
+        Evaluate the expression for a list of values of 'x', one node at a time.
+
+        Returns:
+            A single value for an expression without 'x', otherwise a list with one
+            result per value (None where the evaluation failed).
+        """
+        values = self.constants()
+        if self.var is None:
+            return values[-1]
+        values = values.copy()
+        values[self.var] = xs
+        for (i, function, a, b), releases in zip(self.steps, self.releases):
+            left = values[a]
+            if b is None:
+                values[i] = [None if v is None else function(v) for v in left]
+            else:
+                right = values[b]
+                if isinstance(left, list) and isinstance(right, list):
+                    values[i] = [_apply(function, u, v) for u, v in zip(left, right)]
+                elif isinstance(left, list):
+                    values[i] = [_apply(function, u, right) for u in left]
+                else:
+                    values[i] = [_apply(function, left, v) for v in right]
+            for slot in releases:
+                values[slot] = None
+        return values[-1]
+
+# Apply a binary operation to one element of a batch; failures yield None
+def _apply(op, left, right):
+    if left is None or right is None:
+        return None
+    try:
+        result = op(left, right)
+    except ArithmeticError:
+        return None
+    return None if isinstance(result, complex) else result
+
+# Node class for each binary operator token
+BINARY_NODES = {'+': Plus, '-': Minus, '*': Mul, '/': Div, '**': Pow}
+
+# Precedence of each operator (higher binds tighter)
+PRECEDENCE = {'+': 1, '-': 1, '*': 2, '/': 2, '**': 4, 'u+': 3, 'u-': 3}
 
 # Function to determine operator precedence
 def precedence(op):
@@ -40,182 +301,546 @@ def precedence(op):
     Return the precedence level of the given operator.
 
     Args:
-        op (str): The operator ('+', '-', '*', '/', 'u+', 'u-').
+        op (str): The operator ('+', '-', '*', '/', '**', 'u+', 'u-').
 
     Returns:
         int: Precedence value (higher means higher precedence).
     """
-    precedence = {'+': 1, '-': 1, '*': 2, '/': 2, '**': 4, 'u+': 3, 'u-': 3}
-    return precedence.get(op, 0)
+    return PRECEDENCE.get(op, 0)
+
+# Types of number tokens
+NUMBER_TOKENS = (int, Decimal)
+
+# One token per match: the whitespace before it, then a number literal, an operator,
+# parenthesis or 'x', or any other non-space character (an error); trailing whitespace is not matched
+TOKEN_PATTERN = re.compile(r'(\s*)(?:([\d.]+)|(\*\*|[-+*/^()x])|(\S))')
+
+# Binary operator tokens by operator symbol
+OPERATOR_TOKENS = {'+': '+', '-': '-', '*': '*', '/': '/', '^': '**', '**': '**'}
+
+# Raise an error for the token at `index`, located by scanning the expression again
+def _token_error(expression, index, message):
+    match = next(m for i, m in enumerate(TOKEN_PATTERN.finditer(expression)) if i == index)
+    raise ValueError(message.format(position=match.end(1) + 1))
+
+# Single-pass tokenizer and validator for normal and variable expressions
+def tokenize(expression, variable=False, strict=False):
+    """
+    Validate an expression and split it into tokens, in a single pass.
+
+    Checks the characters, the order of operands and operators and the balance of
+    parentheses while reading the tokens. Implicit multiplication between a
+    number and 'x' (e.g. '2x' or 'x2') is made explicit.
+
+    Args:
+        expression (str): The mathematical expression.
+        variable (bool): Whether the variable 'x' is allowed.
+        strict (bool): Also reject adjacent operator characters (such as '2*-3' or
+            '2**3'), as submissions through the API do.
+
+    Returns:
+        list: Tokens, ready for compile_tokens: integers as ints, decimal numbers as
+        exact Decimals, 'x', '(' and ')', unary operators as 'u+' and 'u-', and
+        binary operators, with '^' written as '**'.
+
+    Raises:
+        ValueError: If the expression is invalid or longer than MAX_EXPRESSION_LENGTH;
+        the message gives the (1-based) position of the offending character.
+    """
+    if len(expression) > MAX_EXPRESSION_LENGTH:
+        raise ValueError(
+            f"Expression is too long: {len(expression)} characters, above the limit of {MAX_EXPRESSION_LENGTH}."
+        )
+    tokens = []
+    append = tokens.append
+    # Indexes of the parentheses still open
+    opened = []
+    expect_operand = True
+    after_operator = False
+    for index, (space, literal, symbol, other) in enumerate(TOKEN_PATTERN.findall(expression)):
+        if literal:
+            if not expect_operand:
+                if tokens[-1] != 'x':
+                    _token_error(expression, index, "Missing operator before position {position}.")
+                append('*')
+            if '.' in literal:
+                if literal.count('.') > 1 or literal == '.':
+                    _token_error(expression, index, f"Invalid number '{literal}' at position {{position}}.")
+                append(Decimal(literal))
+            else:
+                append(int(literal))
+            expect_operand = after_operator = False
+        elif symbol in OPERATOR_TOKENS:
+            if strict and ((after_operator and not space) or symbol == '**'):
+                _token_error(expression, index, "Consecutive operators are not allowed (position {position}).")
+            if expect_operand:
+                if symbol != '+' and symbol != '-':
+                    _token_error(expression, index, "Missing operand before position {position}.")
+                append('u' + symbol)
+            else:
+                append(OPERATOR_TOKENS[symbol])
+                expect_operand = True
+            after_operator = True
+        elif symbol == '(':
+            if not expect_operand:
+                _token_error(expression, index, "Missing operator before position {position}.")
+            append('(')
+            opened.append(index)
+            after_operator = False
+        elif symbol == ')':
+            if not opened:
+                _token_error(expression, index, "Unbalanced parenthesis at position {position}.")
+            if expect_operand:
+                _token_error(expression, index, "Missing operand before position {position}.")
+            append(')')
+            opened.pop()
+            after_operator = False
+        elif symbol and variable:
+            if not expect_operand:
+                if not isinstance(tokens[-1], NUMBER_TOKENS):
+                    _token_error(expression, index, "Missing operator before position {position}.")
+                append('*')
+            append('x')
+            expect_operand = after_operator = False
+        else:
+            _token_error(expression, index, f"Unsafe character '{other or symbol}' at position {{position}}.")
+    if opened:
+        _token_error(expression, opened[-1], "Unbalanced parenthesis at position {position}.")
+    if not tokens:
+        raise ValueError("Expression cannot be empty.")
+    if expect_operand:
+        raise ValueError("Missing operand at the end of the expression.")
+    return tokens
+
+# Pop an operator from the stack and combine its operands
+# into a tree node, reusing the node already built for an identical subexpression
+def _reduce(operators, operands, engine, nodes):
+    op = operators.pop()
+    if op == 'u-':
+        operand = operands.pop()
+        operands.append(_intern(nodes, (op, id(operand)), Neg, operand, engine))
+    elif op == 'u+':
+        pass  # Unary plus leaves its operand unchanged
+    else:
+        right = operands.pop()
+        left = operands.pop()
+        operands.append(_intern(nodes, (op, id(left), id(right)), BINARY_NODES[op], left, right, engine))
+
+# Return the node stored under `key`, creating it first if needed (hash-consing); operands are
+# interned before the nodes using them, so their identities identify whole subexpressions
+def _intern(nodes, key, cls, *args):
+    node = nodes.get(key)
+    if node is None:
+        node = nodes[key] = cls(*args)
+    return node
+
+@lru_cache(maxsize=PARSER_CACHE_SIZE)
+def _compile_tokens(tokens, mode):
+    """
+    Build the expression of a validated token tuple for a numeric mode (cached by both).
+
+    Identical subexpressions are built once and shared, so the result is a DAG.
+    """
+    engine = get_engine(mode)
+    operators = []
+    operands = []
+    # Nodes built so far, by operator and operand identities (leaves by literal)
+    nodes = {}
+    for token in tokens:
+        # If a number or the variable -> push a leaf node
+        if isinstance(token, int):
+            operands.append(_intern(nodes, token, Num, engine.number(token)))
+        elif isinstance(token, Decimal):
+            # Keyed by text: Decimal('1.0') == Decimal('1.00'), but they differ in the decimal mode
+            operands.append(_intern(nodes, str(token), Num, engine.number(token)))
+        elif token == 'x':
+            operands.append(_intern(nodes, 'x', Var))
+
+        # If left parenthesis or a unary operator -> push it; it applies to the next operand
+        elif token == '(' or token in ('u+', 'u-'):
+            operators.append(token)
+
+        # If right parenthesis -> reduce until the matching left parenthesis
+        elif token == ')':
+            while operators[-1] != '(':
+                _reduce(operators, operands, engine, nodes)
+            operators.pop()
+
+        # If a binary operator -> reduce operators that bind at least as tightly;
+        # '**' is right-associative, the other operators are left-associative
+        else:
+            rank = PRECEDENCE[token]
+            while operators and operators[-1] != '(' and (
+                PRECEDENCE[operators[-1]] > rank or (PRECEDENCE[operators[-1]] == rank and token != '**')
+            ):
+                _reduce(operators, operands, engine, nodes)
+            operators.append(token)
+
+    while operators:
+        _reduce(operators, operands, engine, nodes)
+    root = operands[0]
+    # Nodes were created operands first, which is the order the program evaluates them in
+    root._nodes = list(nodes.values())
+    return root
+
+def compile_tokens(tokens, mode=None) -> Expression:
+    """
+    Compile the tokens returned by tokenize into an expression tree.
+
+    Lets a caller that has already validated an expression with tokenize compile it
+    without reading it again. Trees are cached by tokens and numeric mode, up to
+    PARSER_CACHE_MAX_LENGTH tokens.
+
+    Args:
+        tokens (list): Tokens returned by tokenize.
+        mode (str): Numeric mode ('float', 'exact' or 'decimal'; None for the default).
+
+    Returns:
+        Expression: The root node of the compiled tree.
+
+    Raises:
+        ValueError: If the mode is invalid.
+    """
+    tokens = tuple(tokens)
+    build = _compile_tokens if len(tokens) <= PARSER_CACHE_MAX_LENGTH else _compile_tokens.__wrapped__
+    return build(tokens, get_engine(mode).name)
+
+# Compiled trees by normalized expression, variable flag and numeric mode
+_compiled = LRUCache(PARSER_CACHE_SIZE)
+
+# Compile a normalized expression, through the cache unless it is very long; `tokens`
+# already read from the expression are compiled instead of tokenizing it again
+def _compile_normalized(expression, variable, mode, tokens=None):
+    mode = get_engine(mode).name
+    cached = len(expression) <= PARSER_CACHE_MAX_LENGTH
+    key = (expression, variable, mode)
+    tree = _compiled.get(key) if cached else None
+    if tree is None:
+        tree = compile_tokens(tokenize(expression, variable) if tokens is None else tokens, mode)
+        if cached:
+            _compiled.put(key, tree)
+    return tree
+
+def normalize(expression):
+    """
+    Normalize an expression string for use as a cache key.
+
+    Collapses runs of whitespace and writes exponentiation as '^'.
+
+    Args:
+        expression (str): The mathematical expression.
+
+    Returns:
+        str: The normalized expression.
+    """
+    return ' '.join(expression.split()).replace('**', '^')
+
+# Compile an expression once; repeated expressions are served from the cache
+def compile_expression(expression, mode=None) -> Expression:
+    """
+    Compile a mathematical expression string into an expression tree.
+    Supports +, -, *, /, and ^ (or **) for exponentiation, and decimal numbers.
+
+    Compiled trees are immutable and kept in an LRU cache keyed by the
+    normalized expression and numeric mode, so an expression is parsed only once.
+
+    Args:
+        expression (str): The mathematical expression to compile.
+        mode (str): Numeric mode ('float', 'exact' or 'decimal'; None for the default).
+
+    Returns:
+        Expression: The root node of the compiled tree.
+
+    Raises:
+        ValueError: If the expression or mode is invalid.
+    """
+    return _compile_normalized(normalize(expression), False, mode)
+
+# Compile a variable expression once; it can then be evaluated for many values of x
+def compile_variable_expression(expression, mode=None) -> Expression:
+    """
+    Compile a math expression with a variable 'x' into an expression tree.
+
+    Implicit multiplication between a number and 'x' (e.g. '2x') is supported.
+    Compiled trees are cached like those of compile_expression.
+
+    Args:
+        expression (str): The math expression (e.g., 'x*2+1').
+        mode (str): Numeric mode ('float', 'exact' or 'decimal'; None for the default).
+
+    Returns:
+        Expression: The root node of the compiled tree, containing Var leaves.
+
+    Raises:
+        ValueError: If the expression or mode is invalid.
+    """
+    return _compile_normalized(normalize(expression), True, mode)
+
+def compile_submission(expression, variable=False, mode=None) -> Expression:
+    """
+    Validate a submitted expression strictly and compile it, reading it only once.
+
+    The expression is checked by tokenize(strict=True), so error positions refer to
+    the submitted text, and its tokens are compiled into the tree that
+    compile_expression and compile_variable_expression return for it: evaluating
+    the submission later in this process does not read it again.
+
+    Args:
+        expression (str): The submitted expression.
+        variable (bool): Whether the variable 'x' is allowed.
+        mode (str): Numeric mode ('float', 'exact' or 'decimal'; None for the default).
+
+    Returns:
+        Expression: The root node of the compiled tree.
+
+    Raises:
+        ValueError: If the expression or mode is invalid.
+    """
+    tokens = tokenize(expression, variable, strict=True)
+    # Strictly valid expressions have the same tokens once normalized
+    return _compile_normalized(normalize(expression), variable, mode, tokens)
 
 # Parser function to evaluate normal expressions
-def parser(expression) -> float:
+def parser(expression, mode=None) -> float:
     """
     Parse and evaluate a mathematical expression string.
     Supports +, -, *, /, and ** for exponentiation.
 
     Args:
         expression (str): The mathematical expression to evaluate.
+        mode (str): Numeric mode: 'float' (ints and binary floats), 'exact'
+            (ints and Fractions) or 'decimal' (Decimals); None for the default.
 
     Returns:
-        float: The result of the evaluated expression.
+        float: The result of the evaluated expression, of the mode's number type.
 
     Raises:
-        ValueError: If the expression is invalid.
-    """ 
-    # Convert ^ to ** for exponentiation
-    expression = expression.replace('^', '**')
-    
-    stack = []
-    queue = []
-    i = 0
-    # Tokenize expression, handling '**' as a single token
-    tokens = []
-    while i < len(expression):
-        if expression[i:i+2] == '**':
-            tokens.append('**')
-            i += 2
-        else:
-            tokens.append(expression[i])
-            i += 1
-
-    # Check for balanced parentheses
-    paren_count = 0
-    for t in tokens:
-        if t == '(':
-            paren_count += 1
-        elif t == ')':
-            paren_count -= 1
-        if paren_count < 0:
-            raise ValueError("Unbalanced parentheses in expression.")
-    if paren_count != 0:
-        raise ValueError("Unbalanced parentheses in expression.")
-
-    i = 0
-    while i < len(tokens):      
-        token = tokens[i]             
-
-        # If character is a digit/number -> collect all digits and enqueue   
-        if token.isdigit():        
-            num = int(token)        
-            i += 1
-            while i < len(tokens) and tokens[i].isdigit():
-                num = num * 10 + int(tokens[i])
-                i += 1
-            queue.append(num)
-            continue
-
-        # If character is an operator
-        elif token in ['+', '-', '*', '/', '**']:
-            # Handling unary operators
-            if (token == '+' or token == '-') and (i == 0 or tokens[i - 1] in ['+', '-', '*', '/', '**', '(']):
-                queue.append('u' + token)  # Mark as unary operator, enqueue to queue!
-            else:
-                while len(stack) > 0 and (stack[-1] in ['+', '-', '*', '/', '**'] and (precedence(token) <= precedence(stack[-1]))):
-                    queue.append(stack.pop())
-                stack.append(token)             
-        
-        # If character is left parenthesis -> push onto the stack
-        elif token == '(':
-            stack.append(token)                      
-
-        # If character is right parenthesis -> pop operators from stack and enqueue until the top one is a left parenthesis       
-        elif token == ')':
-            while stack and stack[-1] != '(':
-                queue.append(stack.pop())          
-            stack.pop()
-
-        i += 1
-
-    # While there are operators in the stack -> pop operators from stack and enqueue
-    while len(stack) > 0:                               
-        queue.append(stack.pop())            
-
-    # Calculate result
-    while len(queue) > 0:
-        token = queue.pop(0)        
-        
-        # If a number -> pop and push onto the stack
-        if isinstance(token, int) or (isinstance(token, str) and token.lstrip('-').isdigit()):
-            stack.append(int(token)) 
-
-        # If a unary operator -> apply to next number in queue
-        elif token == 'u-' or token == 'u+':
-            if len(queue) > 0 and (isinstance(queue[0], int) or (isinstance(queue[0], str) and queue[0].lstrip('-').isdigit())):
-                op = queue.pop(0)
-                op = int(op)
-                if token == 'u-':
-                    stack.append(-op)
-                elif token == 'u+':
-                    stack.append(op)
-            else:
-                # fallback: if stack has an operand, apply unary
-                if stack:
-                    op = stack.pop()
-                    if token == 'u-':
-                        stack.append(-op)
-                    elif token == 'u+':
-                        stack.append(op)
-
-        # If a binary operator -> pop the last two operands from stack and push the performed operation
-        elif stack and token in ['+', '-', '*', '/', '**']:          
-            right = stack.pop() 
-            left = stack.pop()
-            calc = 0
-            if token == '+':              
-                calc = left + right
-            if token == '-': 
-                calc = left - right                           
-            if token == '*':
-                calc = left * right
-            if token == '/':
-                if right == 0:
-                    raise ZeroDivisionError("Division by zero is not allowed.")
-                calc = left / right
-            if token == '**':
-                calc = left ** right
-            stack.append(calc)            
-
-    # print("{0} = {1}" .format(expression,stack[0]))    
-    return stack[0]
+        ValueError: If the expression or mode is invalid.
+        CostLimitError: If the expression exceeds the evaluation budgets (see check_cost).
+        ZeroDivisionError: If the expression divides by zero.
+        ArithmeticError: If a result is too large or has no value in the mode.
+    """
+    with PARSE_SECONDS.time():
+        compiled = compile_expression(expression, mode)
+    return evaluate(compiled, mode)
+
+# Evaluate a compiled normal expression within the evaluation budgets
+def evaluate(tree, mode=None):
+    """
+    Evaluate a compiled expression without a variable.
+
+    Args:
+        tree (Expression): A tree returned by compile_expression or compile_tokens.
+        mode (str): The numeric mode the tree was compiled for.
+
+    Returns:
+        float: The result, of the mode's number type.
+
+    Raises:
+        CostLimitError: If the expression exceeds the evaluation budgets (see check_cost).
+        ZeroDivisionError: If the expression divides by zero.
+        ArithmeticError: If a result is too large or has no value in the mode.
+    """
+    check_cost(estimate_cost(tree, mode))
+    with EVALUATE_SECONDS.time():
+        return get_engine(mode).check(tree.calc())
 
 # Parser function to evaluate variable expressions
-def variable_parser(expression, value):
+def variable_parser(expression, value, mode=None):
     """
     Safely evaluate a math expression with a variable 'x' using your custom parser.
 
     Args:
         expression (str): The math expression (e.g., 'x*2+1').
         value (float): The value to substitute for 'x'.
+        mode (str): Numeric mode ('float', 'exact' or 'decimal'; None for the default).
 
     Returns:
         float: The result of the evaluated expression.
 
     Raises:
-        ValueError: If the expression is not valid or evaluation fails.
+        ValueError: If the expression is not valid, exceeds the evaluation budgets or evaluation fails.
     """
-    # Only allow x, digits, operators, parentheses, spaces, and ^
-    if not re.match(r'^[x\d+\-*/().\s^]+$', expression):
-        raise ValueError("Unsafe characters in expression.")
+    try:
+        with PARSE_SECONDS.time():
+            compiled = compile_variable_expression(expression, mode)
+        engine = get_engine(mode)
+        x = engine.value(value)
+        check_cost(estimate_cost(compiled, mode, (x,)))
+        with EVALUATE_SECONDS.time():
+            return engine.check(compiled.calc(x))
+    except Exception as e:
+        raise ValueError(f"Invalid math expression: {e}")
 
-    # Convert ^ to ** for exponentiation
-    expr = expression.replace('^', '**')
+# Evaluate a variable expression for many values of x at once
+def batch_variable_parser(expression, values, mode=None):
+    """
+    Evaluate a math expression with a variable 'x' for a list of values.
 
-    # Insert * for implicit multiplication (e.g., 2x -> 2*x)
-    expr = re.sub(r'(\d)(x)', r'\1*\2', expr)
-    expr = re.sub(r'(x)(\d)', r'\1*\2', expr)
+    The expression is compiled once and evaluated node by node over the whole
+    list, so parts that do not depend on 'x' are computed only once.
 
-    # Substitute x with value
-    expr = expr.replace('x', str(value))
+    Args:
+        expression (str): The math expression (e.g., 'x^2+1').
+        values (list): The values to substitute for 'x'.
+        mode (str): Numeric mode ('float', 'exact' or 'decimal'; None for the default).
 
-    # Validate consecutive operators
-    if re.search(r'[\+\-\*/]{2,}', expr.replace('**', '')):
-        raise ValueError("Invalid consecutive operators.")
+    Returns:
+        list: One JSON-serializable result per value (numbers in the float mode,
+        strings in the exact and decimal modes); None where the evaluation failed
+        for that value (e.g. division by zero).
 
-    # Use your custom parser for evaluation
+    Raises:
+        ValueError: If the expression, mode or a value is not valid, or the
+            expression exceeds the evaluation budgets for the largest value or for all
+            the values together.
+    """
+    engine = get_engine(mode)
+    xs = [engine.value(value) for value in values]
     try:
-        result = parser(expr)
-        return result
+        with PARSE_SECONDS.time():
+            compiled = compile_variable_expression(expression, mode)
+        check_cost(estimate_cost(compiled, mode, xs), len(xs))
+        with EVALUATE_SECONDS.time():
+            results = compiled.calc_batch(xs)
     except Exception as e:
         raise ValueError(f"Invalid math expression: {e}")
-        
\ No newline at end of file
+    if not isinstance(results, list):
+        results = [results] * len(xs)
+    return [_finish(engine, r) for r in results]
+
+# Check and convert one result of a batch; failures yield None
+def _finish(engine, result):
+    if result is None or isinstance(result, complex):
+        return None
+    try:
+        return engine.result(engine.check(result))
+    except ArithmeticError:
+        return None
+
+# Size in bits of a number: (numerator, denominator), or None for a float or Decimal,
+# whose size is fixed however large its magnitude
+def _size(value):
+    if isinstance(value, int):
+        return (math.log2(abs(value)) if value else 0.0, 0.0)
+    if isinstance(value, Fraction):
+        return (math.log2(abs(value.numerator)) if value else 0.0, math.log2(value.denominator))
+    return None
+
+# Upper bound of the size of a sum of numbers of a and b bits: log2(2^a + 2^b)
+def _sum_bits(a, b):
+    high, low = max(a, b), min(a, b)
+    if high == math.inf:
+        return high
+    return high + math.log2(1 + 2.0 ** (low - high))
+
+# Size of a number of `bits` bits raised to a power of at most `exponent`
+def _power_bits(bits, exponent):
+    return bits * exponent if bits else 0.0
+
+# Size of the result of a binary operator (by engine method name) from the sizes of its operands (see _size)
+def _node_size(method, mode, left, right):
+    if left is None or right is None or (mode == 'float' and method == 'div'):
+        # Floats are bounded; the float engine divides into floats
+        return None
+    (ln, ld), (rn, rd) = left, right
+    if method == 'add' or method == 'sub':
+        return (_sum_bits(ln + rd, rn + ld), ld + rd)
+    if method == 'mul':
+        return (ln + rn, ld + rd)
+    if method == 'div':
+        return (ln + rd, ld + rn)
+    # Pow: the exponent is at most 2^rn; a negative one swaps numerator and denominator
+    exponent = 2.0 ** rn if rn < 1024 else math.inf
+    if mode == 'float':
+        return (_power_bits(ln, exponent), 0.0)
+    bits = _power_bits(max(ln, ld), exponent)
+    return (bits, bits)
+
+@lru_cache(maxsize=PARSER_CACHE_SIZE)
+def _estimate(tree, mode, x_size):
+    """
+    Estimate the cost of a tree for a mode and a size of 'x' (cached by all three).
+    """
+    program = tree.program()
+    peak = 0.0
+    # Nodes are listed operands first, so each is sized from its operands' sizes
+    sizes = []
+    for node, operands in zip(program.nodes, program.operands):
+        if node.variable:
+            size = x_size
+        elif not node.arity:
+            size = _size(node.x) if mode != 'decimal' else None
+        elif node.arity == 1:
+            # Negation keeps the size
+            size = sizes[operands[0]]
+        else:
+            size = _node_size(node.method, mode, sizes[operands[0]], sizes[operands[1]])
+        sizes.append(size)
+        if size is not None:
+            peak = max(peak, *size)
+    return len(program.nodes), peak
+
+# Statically estimate the work of evaluating a compiled tree
+def estimate_cost(tree, mode=None, xs=()):
+    """
+    Estimate the cost of evaluating a compiled expression, without evaluating it.
+
+    Walks the expression once, counting the distinct nodes an evaluation visits
+    and bounding the size of every intermediate result from the sizes of the
+    operands: a product adds sizes, a sum adds at most one bit, and a power
+    multiplies the size of its base by the largest value its exponent can take.
+    Floats and Decimals have a fixed size, so only integers and Fractions are bounded.
+
+    Args:
+        tree (Expression): A tree returned by compile_expression or compile_variable_expression.
+        mode (str): The numeric mode the tree was compiled for.
+        xs (iterable): Values of 'x' the tree will be evaluated with, as numbers
+            of the mode's engine; the largest one determines the estimate.
+
+    Returns:
+        tuple: (steps, bits): distinct nodes evaluated, and an upper bound
+        on the size in bits of the largest integer, numerator or denominator
+        produced along the way.
+    """
+    mode = get_engine(mode).name
+    x_size = (0, 0)
+    sizes = [size for size in map(_size, xs) if size is not None]
+    if mode == 'decimal' or (xs and not sizes):
+        x_size = None
+    elif sizes:
+        # Rounded up to whole bits, so that similar values share a cache entry
+        x_size = tuple(math.ceil(max(bits)) for bits in zip(*sizes))
+    if len(tree.program().nodes) > PARSER_CACHE_MAX_LENGTH:
+        return _estimate.__wrapped__(tree, mode, x_size)
+    return _estimate(tree, mode, x_size)
+
+def check_cost(cost, count=1):
+    """
+    Enforce the evaluation budgets on an estimated cost.
+
+    Args:
+        cost (tuple): (steps, bits) as returned by estimate_cost.
+        count (int): Number of values of 'x' the expression is evaluated for.
+
+    Raises:
+        CostLimitError: If the expression has more than MAX_EVALUATION_STEPS nodes, more
+            than MAX_TABULATE_STEPS nodes across all the values, or its intermediate
+            results could exceed MAX_RESULT_BITS bits.
+    """
+    steps, bits = cost
+    if steps > MAX_EVALUATION_STEPS:
+        raise CostLimitError(
+            f"Expression is too long: evaluating it takes {steps} steps, above the limit of {MAX_EVALUATION_STEPS}."
+        )
+    if steps * count > MAX_TABULATE_STEPS:
+        raise CostLimitError(
+            f"Tabulation is too long: evaluating {count} values takes {steps * count} steps, "
+            f"above the limit of {MAX_TABULATE_STEPS}."
+        )
+    if bits > MAX_RESULT_BITS:
+        estimate = f"about {bits:.3g} bits" if bits < math.inf else "an unbounded size"
+        raise CostLimitError(
+            f"Expression is too costly: its results could reach {estimate}, "
+            f"above the maximum size of {MAX_RESULT_BITS} bits."
+        )
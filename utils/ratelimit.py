@@ -0,0 +1,74 @@
+from collections import OrderedDict
+import threading
+import time
+
+class TokenBucketLimiter:
+    """
+    Per-client token-bucket rate limiter.
+
+    Each client's bucket holds up to `burst` tokens and refills at `rate` tokens
+    per second; a request costing n tokens is admitted if n tokens are available.
+    Buckets of the least recently seen clients are dropped beyond `maxsize`
+    (a dropped bucket starts full again).
+
+    Methods:
+        acquire(client, cost): Take tokens for a request, or report how long to wait.
+        stats(): Return admission counters.
+    """
+    def __init__(self, rate, burst, maxsize=10000):
+        """
+        Args:
+            rate (float): Tokens added per second (0 disables rate limiting).
+            burst (float): Bucket capacity, i.e. the largest admissible burst.
+            maxsize (int): Maximum number of client buckets kept.
+        """
+        self.rate = rate
+        self.burst = burst
+        self.maxsize = maxsize
+        self.admitted = 0
+        self.limited = 0
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.rate > 0
+
+    def acquire(self, client, cost=1):
+        """
+        Take tokens for a request, or report how long to wait.
+
+        Args:
+            client (str): The client key (API key or address).
+            cost (float): Tokens the request costs.
+
+        Returns:
+            float: 0 if the request is admitted, otherwise the seconds until
+            enough tokens are available (infinite if `cost` exceeds the burst).
+        """
+        if not self.enabled:
+            return 0.0
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= cost:
+                tokens -= cost
+                wait = 0.0
+                self.admitted += 1
+            else:
+                wait = (cost - tokens) / self.rate if cost <= self.burst else float('inf')
+                self.limited += 1
+            self._buckets[client] = (tokens, now)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def stats(self):
+        """
+        Return admission counters.
+
+        Returns:
+            dict: 'admitted', 'limited' and the number of tracked 'clients'.
+        """
+        return {'admitted': self.admitted, 'limited': self.limited, 'clients': len(self._buckets)}
@@ -1,48 +1,236 @@
+from collections import OrderedDict, deque
+import queue
 import threading
-from time import sleep
+import time
+
+# Sentinel placed on the queue to tell a worker thread to exit
+_STOP = object()
+
+class LaneQueue(queue.Queue):
+    """
+    A blocking queue with priority lanes, aging and optional per-client fairness.
+
+    Each item goes to the lane named by its 'priority' key (the default lane if it
+    has none). A get() serves the lane whose oldest waiting item has the best
+    effective priority: the lane's rank minus one per `aging` seconds that item has
+    waited, so low-priority work is delayed behind higher lanes but never starved.
+    With `fair`, each lane keeps one FIFO per client (the item's 'client' key) and
+    serves clients round-robin, so a client with a large backlog cannot starve the
+    others. Stop sentinels are only served once every lane is empty.
+    """
+    def __init__(self, maxsize=0, lanes=('normal',), default_lane=None, fair=True, aging=5.0):
+        """
+        Args:
+            maxsize (int): Maximum number of queued items (0 means unbounded).
+            lanes (tuple): Lane names, highest priority first.
+            default_lane (str): Lane of items without a known priority (the middle lane by default).
+            fair (bool): Serve clients round-robin within each lane.
+            aging (float): Seconds of waiting that raise an item by one lane (0 disables aging).
+        """
+        self.lanes = tuple(lanes)
+        self.default_lane = default_lane or self.lanes[len(self.lanes) // 2]
+        self.fair = fair
+        self.aging = aging
+        super().__init__(maxsize)
+
+    # The methods below are called by queue.Queue with its mutex held
+    def _init(self, maxsize):
+        self._lanes = {lane: OrderedDict() for lane in self.lanes}
+        self._depth = dict.fromkeys(self.lanes, 0)
+        self._served = dict.fromkeys(self.lanes, 0)
+        self._total_wait = dict.fromkeys(self.lanes, 0.0)
+        self._max_wait = dict.fromkeys(self.lanes, 0.0)
+        self._stops = deque()
+
+    def _qsize(self):
+        return sum(self._depth.values()) + len(self._stops)
+
+    def _lane(self, item):
+        lane = item.get('priority') if isinstance(item, dict) else None
+        return lane if lane in self._lanes else self.default_lane
+
+    def _put(self, item):
+        if item is _STOP:
+            self._stops.append(item)
+            return
+        lane = self._lane(item)
+        client = item.get('client') if self.fair and isinstance(item, dict) else None
+        self._lanes[lane].setdefault(client, deque()).append((time.monotonic(), item))
+        self._depth[lane] += 1
+
+    def _get(self):
+        now = time.monotonic()
+        best = None
+        for rank, lane in enumerate(self.lanes):
+            clients = self._lanes[lane]
+            if not clients:
+                continue
+            waited = now - next(iter(clients.values()))[0][0]
+            score = rank - waited / self.aging if self.aging else rank
+            if best is None or score < best[0]:
+                best = (score, lane)
+        if best is None:
+            return self._stops.popleft()
+        lane = best[1]
+        clients = self._lanes[lane]
+        client, items = next(iter(clients.items()))
+        enqueued, item = items.popleft()
+        # Move the client to the back of the rotation, or drop it once idle
+        del clients[client]
+        if items:
+            clients[client] = items
+        waited = now - enqueued
+        self._depth[lane] -= 1
+        self._served[lane] += 1
+        self._total_wait[lane] += waited
+        self._max_wait[lane] = max(self._max_wait[lane], waited)
+        return item
+
+    def stats(self):
+        """
+        Return per-lane queue depth and wait time.
+
+        Returns:
+            dict: For each lane, 'depth', 'served', 'avg_wait_seconds' and 'max_wait_seconds'.
+        """
+        with self.mutex:
+            return {
+                lane: {
+                    'depth': self._depth[lane],
+                    'served': self._served[lane],
+                    'avg_wait_seconds': self._total_wait[lane] / self._served[lane] if self._served[lane] else 0.0,
+                    'max_wait_seconds': self._max_wait[lane],
+                }
+                for lane in self.lanes
+            }
 
 class Stream:
     """
-    A simple asynchronous stream processor for handling queued tasks in a background thread.
+    An asynchronous stream processor for handling queued tasks on a pool of background threads.
+
+    Items are held in a bounded, blocking work queue: idle workers sleep on the queue
+    instead of spinning, and a full queue applies backpressure to producers.
 
     Methods:
-        add(x): Add an item to the stream queue.
+        add(x, block, timeout): Add an item to the stream queue.
         apply(f): Create a new stream and apply a function to each item.
         forEach(f): Set a consumer-style function for processing items.
-        stop(): Stop the stream and any chained streams.
-    """    
-    def __init__(self):
+        onDrop(f): Set the function recording dropped items (never called: items are not dropped).
+        size(): Return the number of items waiting in the queue.
+        lane_stats(): Return per-lane queue depth and wait time.
+        ack(request_ids): Acknowledge processed requests.
+        stop(drain, timeout): Stop the stream and any chained streams.
+    """
+    def __init__(self, workers=1, maxsize=0, daemon=True, fair=False, lanes=None, aging=5.0,
+                 registry=None, name='stream'):
+        """
+        Initialize the stream, start the background worker threads, and set up internal state.
+
+        Args:
+            workers (int): Number of worker threads consuming the queue.
+            maxsize (int): Maximum number of queued items (0 means unbounded).
+            daemon (bool): Whether the worker threads are daemon threads.
+            fair (bool): Serve items round-robin by their 'client' key (see LaneQueue).
+            lanes (tuple): Priority lane names, highest first, selected by the items'
+                'priority' key (see LaneQueue). None keeps a single lane.
+            aging (float): Seconds of waiting that raise an item by one lane.
+            registry (Registry): Metrics registry receiving item counts, errors and
+                processing times (None disables instrumentation).
+            name (str): Stream name used as the metrics' 'stream' label.
         """
-        Initialize the stream, start the background thread, and set up internal state.
-        """                   
-        self.list = []
+        if workers < 1:
+            raise ValueError("A stream needs at least one worker.")
+        self.registry = registry
+        self.name = name
+        self._processed = self._errors = self._seconds = None
+        if registry is not None:
+            self._processed = registry.counter('stream_items_total', 'Items processed by a stream', ('stream',)).labels(name)
+            self._errors = registry.counter('stream_errors_total', 'Items whose processing raised', ('stream',)).labels(name)
+            self._seconds = registry.histogram('stream_item_seconds', 'Time to process one item', ('stream',)).labels(name)
+        if fair or lanes:
+            self.queue = LaneQueue(maxsize, lanes or ('normal',), fair=fair, aging=aging)
+        else:
+            self.queue = queue.Queue(maxsize)
+        self.workers = workers
+        self.maxsize = maxsize
+        self.fair = fair
+        self.lanes = lanes
+        self.aging = aging
         self.action_func = None
         self.next_stream = None
-        self.thread = threading.Thread(target=self._run)       
-        self.stop_flag = False                
-        self.thread.start()
-    
+        self.stop_flag = False
+        self._ready = threading.Event()
+        self.threads = [
+            threading.Thread(target=self._run, daemon=daemon)
+            for _ in range(workers)
+        ]
+        for thread in self.threads:
+            thread.start()
+
     # Processing
     def _run(self):
         """
-        Internal method: Continuously process items in the queue using the action function.
+        Internal method: Block on the queue and process items using the action function.
         """
-        while not self.stop_flag: 
-            if self.action_func and self.list:                
-                item = self.list.pop(0)
-                self.action_func(item)
-            else:
-                pass # Wait
+        # Items are held until a processing function has been set
+        self._ready.wait()
+        while True:
+            item = self.queue.get()
+            try:
+                if item is _STOP:
+                    break
+                if self.action_func:
+                    if self._seconds is None:
+                        self.action_func(item)
+                    else:
+                        with self._seconds.time():
+                            self.action_func(item)
+                        self._processed.inc()
+            except Exception as e:
+                if self._errors is not None:
+                    self._errors.inc()
+                print(f"Error processing stream item: {e}")
+            finally:
+                self.queue.task_done()
 
-    # Add a new functon to the list  
-    def add(self, x):   
+    # Add a new item to the queue
+    def add(self, x, block=True, timeout=None):
         """
         Add an item to the stream queue.
 
+        When the queue is full the call blocks, waits up to `timeout` seconds,
+        or fails immediately if `block` is False.
+
         Args:
             x: The item to add.
-        """     
-        self.list.append(x)            
+            block (bool): Whether to wait for free space when the queue is full.
+            timeout (float): Maximum number of seconds to wait for free space.
+
+        Raises:
+            queue.Full: If the queue stays full.
+            RuntimeError: If the stream has been stopped.
+        """
+        if self.stop_flag:
+            raise RuntimeError("Stream is stopped.")
+        self.queue.put(x, block, timeout)
+
+    def size(self):
+        """
+        Return the approximate number of items waiting in the queue.
+        """
+        return self.queue.qsize()
+
+    def lane_stats(self):
+        """
+        Return per-lane queue depth and wait time (empty without lanes).
+        """
+        return self.queue.stats() if isinstance(self.queue, LaneQueue) else {}
+
+    def ack(self, request_ids):
+        """
+        Acknowledge processed requests. In-memory items are never redelivered, so
+        this only exists for compatibility with durable queues.
+        """
 
     # Create a new stream and add an item to it depending on the result
     def apply(self, f):
@@ -58,7 +246,10 @@ class Stream:
         Returns:
             Stream: The next stream in the chain.
         """
-        self.next_stream = Stream()
+        self.next_stream = Stream(
+            workers=self.workers, maxsize=self.maxsize, fair=self.fair, lanes=self.lanes, aging=self.aging,
+            registry=self.registry, name=f"{self.name}.next",
+        )
 
         def apply_func(item):
             result = f(item)
@@ -67,11 +258,12 @@ class Stream:
             elif result is False:
                 pass
             elif result is not None:
-                self.next_stream.add(result)        
-        
+                self.next_stream.add(result)
+
         self.action_func = apply_func
-        return self.next_stream             
-    
+        self._ready.set()
+        return self.next_stream
+
     # Consumer-style function for processing
     def forEach(self, f):
         """
@@ -81,12 +273,48 @@ class Stream:
             f (callable): Function to process each item.
         """
         self.action_func = f
+        self._ready.set()
+
+    def onDrop(self, f):
+        """
+        Set the function recording the failure of dropped items. In-memory items are
+        delivered once and never dropped, so this only exists for compatibility with
+        durable queues.
+        """
 
     # Stop all threads
-    def stop(self):
+    def stop(self, drain=True, timeout=None):
         """
         Stop the stream and any chained streams.
+
+        New items are rejected immediately. With `drain`, items already queued are
+        processed before the workers exit; otherwise they are discarded.
+
+        Args:
+            drain (bool): Whether to process pending items before stopping.
+            timeout (float): Maximum number of seconds to wait for each worker to exit.
         """
-        self.stop_flag = True
+        if not self.stop_flag:
+            self.stop_flag = True
+            if not drain or not self.action_func:
+                self._discard_pending()
+            self._ready.set()
+            for _ in self.threads:
+                self.queue.put(_STOP)
+        current = threading.current_thread()
+        for thread in self.threads:
+            if thread is not current:
+                thread.join(timeout)
         if self.next_stream:
-            self.next_stream.stop()
+            self.next_stream.stop(drain, timeout)
+
+    def _discard_pending(self):
+        """
+        Internal method: Drop every item still waiting in the queue.
+        """
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                return
+            self.queue.task_done()
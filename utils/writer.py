@@ -0,0 +1,146 @@
+import threading
+import time
+
+class BatchWriter:
+    """
+    A group-commit buffer that hands rows to a writer function in batches on a background thread.
+
+    Rows are flushed once `max_batch` rows are buffered or `max_delay` seconds after
+    the oldest buffered row arrived, whichever comes first.
+
+    Methods:
+        add(rows): Buffer rows for the next flush.
+        forEach(f): Set the function that writes each batch of rows.
+        stats(): Return flush-latency and batch-size metrics.
+        stop(): Flush the remaining rows and stop the writer thread.
+    """
+    def __init__(self, max_batch=500, max_delay=0.05):
+        """
+        Initialize the buffer and start the background writer thread.
+
+        Args:
+            max_batch (int): Number of buffered rows that triggers an immediate flush.
+            max_delay (float): Maximum seconds a row waits in the buffer.
+        """
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.action_func = None
+        self.stop_flag = False
+        self._buffer = []
+        self._oldest = None
+        self._condition = threading.Condition()
+        self._metrics = {
+            'batches': 0,
+            'rows': 0,
+            'errors': 0,
+            'last_batch_size': 0,
+            'max_batch_size': 0,
+            'last_flush_seconds': 0.0,
+            'max_flush_seconds': 0.0,
+            'total_flush_seconds': 0.0,
+        }
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    # Processing
+    def _run(self):
+        """
+        Internal method: Wait for a full batch or the flush deadline, then write the buffered rows.
+        """
+        while True:
+            with self._condition:
+                while not (self._buffer and self.action_func) and not self.stop_flag:
+                    self._condition.wait()
+                if not self._buffer:
+                    return
+                deadline = self._oldest + self.max_delay
+                while len(self._buffer) < self.max_batch and not self.stop_flag:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                rows = self._buffer[:self.max_batch]
+                self._buffer = self._buffer[self.max_batch:]
+                self._oldest = time.monotonic() if self._buffer else None
+            self._write(rows)
+
+    def _write(self, rows):
+        """
+        Internal method: Write one batch and record its metrics.
+        """
+        start = time.perf_counter()
+        try:
+            self.action_func(rows)
+        except Exception as e:
+            self._metrics['errors'] += 1
+            print(f"Error writing results: {e}")
+        elapsed = time.perf_counter() - start
+        metrics = self._metrics
+        metrics['batches'] += 1
+        metrics['rows'] += len(rows)
+        metrics['last_batch_size'] = len(rows)
+        metrics['max_batch_size'] = max(metrics['max_batch_size'], len(rows))
+        metrics['last_flush_seconds'] = elapsed
+        metrics['max_flush_seconds'] = max(metrics['max_flush_seconds'], elapsed)
+        metrics['total_flush_seconds'] += elapsed
+
+    def add(self, rows):
+        """
+        Buffer rows for the next flush.
+
+        Args:
+            rows (list): Rows to write.
+
+        Raises:
+            RuntimeError: If the writer has been stopped.
+        """
+        if not rows:
+            return
+        with self._condition:
+            if self.stop_flag:
+                raise RuntimeError("Writer is stopped.")
+            if not self._buffer:
+                self._oldest = time.monotonic()
+            self._buffer.extend(rows)
+            self._condition.notify()
+
+    def forEach(self, f):
+        """
+        Set the function that writes each batch of rows.
+
+        Args:
+            f (callable): Function called with a list of rows.
+        """
+        with self._condition:
+            self.action_func = f
+            self._condition.notify()
+
+    def stats(self):
+        """
+        Return flush-latency and batch-size metrics.
+
+        Returns:
+            dict: Counters plus average batch size and flush latency.
+        """
+        metrics = dict(self._metrics)
+        batches = metrics['batches']
+        metrics['avg_batch_size'] = metrics['rows'] / batches if batches else 0.0
+        metrics['avg_flush_seconds'] = metrics['total_flush_seconds'] / batches if batches else 0.0
+        with self._condition:
+            metrics['pending'] = len(self._buffer)
+        return metrics
+
+    def stop(self, timeout=None):
+        """
+        Flush the remaining rows and stop the writer thread.
+
+        Args:
+            timeout (float): Maximum number of seconds to wait for the final flush.
+        """
+        with self._condition:
+            self.stop_flag = True
+            if not self.action_func:
+                self._buffer = []
+            self._condition.notify()
+        if self.thread is not threading.current_thread():
+            self.thread.join(timeout)
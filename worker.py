@@ -0,0 +1,43 @@
+"""
+Standalone evaluation worker.
+
+Claims jobs from the shared database queue and runs them through the same
+processing pipeline as the web application: evaluation, the result memo and
+the group-commit result writer. Run any number of workers, on any number of
+hosts, next to web processes started with EMBEDDED_WORKER=0; throughput grows
+with the number of workers (STREAM_WORKERS threads each).
+
+Usage:
+    QUEUE_BACKEND=database python -m worker
+"""
+from dotenv import load_dotenv
+load_dotenv()
+
+import os
+import signal
+import sys
+import threading
+
+def main():
+    if os.getenv('QUEUE_BACKEND', 'memory') != 'database':
+        sys.exit("The worker requires QUEUE_BACKEND=database.")
+
+    from app import app, start_worker
+    from routes import expression_stream, result_writer
+
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+    signal.signal(signal.SIGINT, lambda *_: stopping.set())
+
+    start_worker(app)
+    print(f"Worker started with {expression_stream.workers} threads.")
+    while not stopping.wait(1):
+        pass
+
+    # Jobs not yet claimed stay queued; results already evaluated are flushed
+    print("Worker stopping.")
+    expression_stream.stop()
+    result_writer.stop()
+
+if __name__ == '__main__':
+    main()